@@ -1,72 +1,1200 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
 import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
 import requests
-from urllib.parse import urlparse
+
+import icon_cache
+import icon_image
+import icon_index
+import icon_journal
+import icon_metrics
+import icon_providers
+import icon_sched
+import icon_store
+import icon_throttle
+
+logger = logging.getLogger("dd2")
+
+# Google favicon 服务接口
+ICON_API = "https://t0.gstatic.com/faviconV2"
+
+# 规范化后主机名的最大长度，以及其中每个标签（LDH：字母、数字、连字符）的格式
+MAX_HOST_LENGTH = 253
+_LABEL_RE = re.compile(r"^(?!-)[a-z0-9-]{1,63}(?<!-)$")
+
+# 单个图标响应体的大小上限（字节），超过即中止下载
+MAX_ICON_BYTES = 4 * 1024 * 1024
+
+# 流式读取响应体的块大小
+CHUNK_SIZE = 16 * 1024
+
+# GUI 提供的全部尺寸；多尺寸模式默认生成这些
+ALL_SIZES = (16, 32, 48, 64, 96, 128, 192, 256, 512)
+
+# 多尺寸模式下每批一起缩放的源图像数量
+DERIVE_BATCH = 64
+
+# 单个请求的超时上限（秒）；request_timeout 为 None 时固定使用该值
+DEFAULT_TIMEOUT = 10
+
+# 共享 Session 的连接池大小；批量下载时应不小于 workers
+DEFAULT_POOL_SIZE = 32
+
+# 进程内图标缓存：按 (规范化域名, 尺寸) 缓存图标字节，先于任何网络/磁盘 I/O 查询
+memory_cache = icon_cache.MemoryCache()
+
+# 所有工作线程共享的限速器、熔断器与重试策略（可按需替换或调整参数）
+rate_limiter = icon_throttle.RateLimiter(rate=100, burst=200)
+circuit_breaker = icon_throttle.CircuitBreaker()
+retry_policy = icon_throttle.RetryPolicy()
+# 自适应并发上限与超时：按上游的实时延迟与错误率调整；设为 None 时退回固定的 workers 与 DEFAULT_TIMEOUT
+concurrency_limit = icon_throttle.AdaptiveConcurrency()
+request_timeout = icon_throttle.AdaptiveTimeout(maximum=DEFAULT_TIMEOUT)
+# 以上共享控制按 Google favicon 服务调整；直接请求各网站的来源（favicon / html）不经过它们，
+# 只按主机限制并发、最多重试一次，失败与延迟也不计入熔断器、自适应并发与超时
+host_limiter = icon_throttle.HostLimiter(per_host=2)
+direct_retry_policy = icon_throttle.RetryPolicy(retries=1)
+# 直连请求的 (连接, 读取) 超时（秒）：不可达的主机尽快放弃
+DIRECT_TIMEOUT = (3.05, DEFAULT_TIMEOUT)
+
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+# 所有批量下载共享的优先级调度器（懒加载），见 get_scheduler
+_scheduler = None
+
+
+def get_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    返回进程内共享的 requests.Session（懒加载）。
+
+    所有请求复用同一个连接池，避免每个图标都重新进行 TCP/TLS 握手。
+
+    :param pool_size: 每个主机保持的最大连接数；大于当前值时会扩容连接池。
+    :return: requests.Session 实例。
+    """
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool_size:
+            adapter = icon_metrics.TimedHTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _session_pool_size = pool_size
+        return _session
+
+
+def get_scheduler(workers=8):
+    """
+    返回进程内共享的 icon_sched.Scheduler（懒加载）。
+
+    同一进程中的批量下载共用这些工作线程：interactive 作业优先于 normal / bulk，
+    同一优先级的多个作业轮流执行，后台积压再多也不会拖慢即时请求。
+
+    :param workers: 需要的工作线程数；大于当前值时会增加线程。
+    """
+    global _scheduler
+    with _session_lock:
+        if _scheduler is None:
+            _scheduler = icon_sched.Scheduler(workers)
+    _scheduler.ensure_workers(workers)
+    return _scheduler
+
+
+def make_providers(names=icon_providers.PROVIDER_NAMES, hedge=True, **kwargs):
+    """
+    创建图标来源组合，传给各下载函数的 providers 参数；google 来源使用 build_icon_url（即 ICON_API）。
+
+    同一个对象应在多次下载之间复用，各来源的成功率与延迟统计随之累积，排序与对冲时机也越准确。
+
+    :param names: icon_providers.PROVIDER_NAMES 中的名字，或逗号分隔的字符串，例如 "google,favicon,html"。
+    :param hedge: 是否开启对冲请求，见 icon_providers.Providers。
+    """
+    return icon_providers.from_names(names, build_icon_url, hedge=hedge, **kwargs)
+
+
+def normalize_domain(domain, fold_www=False):
+    """
+    把域名或 URL 规范化为主机名，作为请求、文件名与缓存键的统一依据。
+
+    去掉协议、端口、路径与查询串，转为小写并做 IDNA (punycode) 编码，例如
+    "HTTPS://Developer.Mozilla.org/en-US/docs" -> "developer.mozilla.org"，
+    "bücher.de" -> "xn--bcher-kva.de"。
+
+    编码后的每个标签只能由字母、数字与连字符组成（不以连字符开头或结尾，长 1-63），总长不超过 253；
+    IPv6 地址字面量不受支持（无法安全地用作文件名）。
+
+    :param domain: 网站域名或 URL。
+    :param fold_www: 为 True 时去掉开头的 "www."。
+    :return: 规范化后的主机名；无法解析出合法主机名时返回 None。
+    """
+    text = (domain or '').strip()
+    if '://' not in text:
+        text = '//' + text
+    try:
+        host = urlsplit(text).hostname
+    except ValueError:
+        return None
+    host = (host or '').rstrip('.')
+    if not host or ':' in host:
+        return None
+    try:
+        host = host.encode('idna').decode('ascii').lower()
+    except UnicodeError:
+        return None
+    if len(host) > MAX_HOST_LENGTH or not all(_LABEL_RE.match(label) for label in host.split('.')):
+        return None
+    if fold_www and host.startswith('www.') and host.count('.') >= 2:
+        host = host[4:]
+    return host
+
+
+def dedupe_requests(domains, sizes, fold_www=False):
+    """
+    把批量输入去重为唯一的 (主机名, 尺寸) 键。
+
+    :return: (keys, items)。keys 为去重后的键列表（保持首次出现顺序）；
+             items 为每个原始输入对应的 (domain, size, key)，无法解析的输入 key 为 None。
+    """
+    keys = []
+    items = []
+    for domain, size, key, first in _iter_requests(domains, sizes, fold_www):
+        if first:
+            keys.append(key)
+        items.append((domain, size, key))
+    return keys, items
+
+
+def _iter_requests(domains, sizes, fold_www=False):
+    """
+    惰性地规范化并去重批量输入：边读取边产出，不预先读完整个输入。
+
+    :return: 生成器，对每个原始输入的每个尺寸产出 (domain, size, key, first)；
+             无法解析的输入 key 为 None，first 表示该键是否第一次出现。
+    """
+    if isinstance(sizes, int):
+        sizes = (sizes,)
+    seen = set()
+    for domain in domains:
+        host = normalize_domain(domain, fold_www)
+        for size in sizes:
+            key = (host, int(size)) if host else None
+            first = key is not None and key not in seen
+            if first:
+                seen.add(key)
+            yield domain, size, key, first
+
+
+def build_icon_url(host, size):
+    """构建 Google favicon 服务的请求 URL；host 应为 normalize_domain 的结果。"""
+    # 新版 t0.gstatic.com 接口更稳定，且支持 https:// 前缀
+    return f"{ICON_API}?client=SOCIAL&type=FAVICON&fallback_opts=TYPE,SIZE,URL&url=https://{host}&size={size}"
 
 
-def download_icon_from_google(domain, save_dir='icons', size=64):
+def ext_from_content_type(content_type):
+    """从 Content-Type 推断文件扩展名。"""
+    if 'svg' in content_type:
+        return '.svg'
+    elif 'png' in content_type:
+        return '.png'
+    elif 'jpeg' in content_type:
+        return '.jpg'
+    elif 'gif' in content_type:
+        return '.gif'
+    elif 'webp' in content_type:
+        return '.webp'
+    return '.ico'
+
+
+def icon_filename(host, size, ext):
+    """生成保存文件名，例如 "www.douban.com" -> "www.douban.com_64x64.png"。"""
+    return f"{host}_{size}x{size}{ext}"
+
+
+def make_result(domain, size, host=None):
+    """
+    创建单个下载任务的结果字典。
+
+    字段: domain, host, size, url, path, status, content_type, bytes, sha256, error, cache, retries,
+    elapsed_ms, provider。
+    domain 为原始输入，host 为规范化后的主机名（无法解析时为 None）。
+    成功时 path 为保存路径，否则为 None。cache 为缓存结果：
+    "memory"（进程内缓存命中）、"fresh"（max-age 内直接命中，无网络请求）、
+    "revalidated"（304）、"journal"（作业日志中已完成，未重新下载）、"miss" 或 None（未启用）。
+    provider 为通过 providers 下载时实际给出图标的来源名字（url 为该来源的图标地址）。
+    """
+    return {
+        "domain": domain,
+        "host": host,
+        "size": size,
+        "url": build_icon_url(host, size) if host else None,
+        "path": None,
+        "status": None,
+        "content_type": None,
+        "bytes": 0,
+        "sha256": None,
+        "error": None if host else f"无效的域名: {domain!r}",
+        "cache": None,
+        "retries": 0,
+        "elapsed_ms": None,
+        "provider": None,
+    }
+
+
+# 原子写入的实现在 icon_store 中（各模块共用），这里保留原有的名字
+atomic_write = icon_store.atomic_write
+
+
+def _write_icon(path, data, digest=None, store=None):
+    """写入图标：有内容寻址存储时交给 store（相同内容只存一份），否则原子写入。"""
+    with icon_metrics.phase("write"):
+        if store is not None:
+            store.save(path, data, digest)
+        else:
+            atomic_write(path, data)
+
+
+def _icon_exists(path, store=None):
+    """图标是否已保存；打包输出（icon_store.PackWriter）时查包内索引而不是文件系统。"""
+    return store.exists(path) if store is not None else os.path.exists(path)
+
+
+def _load_meta(save_dir, stem, store=None):
+    """读取缓存校验信息；打包输出时保存在包索引中，否则在 .icon_cache 下的 JSON 文件中。"""
+    if isinstance(store, icon_store.PackWriter):
+        return store.load_meta(stem)
+    return icon_cache.load_meta(save_dir, stem, store.exists if store is not None else os.path.exists)
+
+
+def _save_meta(save_dir, stem, meta, store=None):
+    if isinstance(store, icon_store.PackWriter):
+        store.save_meta(stem, meta)
+    else:
+        icon_cache.save_meta(save_dir, stem, meta)
+
+
+def _read_icon(path, store=None):
+    if store is not None:
+        return store.read(path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class DownloadCancelled(Exception):
+    """下载被调用方通过 cancel 事件取消。"""
+
+
+def _chunk_hook(key, progress=None, cancel=None):
+    """
+    构造每读到一块响应体就调用一次的回调：检查取消事件并上报进度。
+
+    :param progress: progress(key, received, total)，received 为该图标已接收的字节数，
+                     total 为 Content-Length（未知时为 None）。
+    :param cancel: threading.Event；被设置后下一块到达时抛出 DownloadCancelled。
+    """
+    if progress is None and cancel is None:
+        return None
+
+    def hook(received, total):
+        if cancel is not None and cancel.is_set():
+            raise DownloadCancelled("已取消")
+        if progress is not None:
+            progress(key, received, total)
+    return hook
+
+
+def _iter_body(response, max_bytes, on_chunk=None):
+    """
+    按块迭代响应体，累计超过 max_bytes 时立即中止。
+
+    :param on_chunk: 可选回调 on_chunk(received, total)，见 _chunk_hook。
+    :raises ValueError: 响应体（声明的或实际的）超过 max_bytes 时。
+    """
+    declared = response.headers.get('Content-Length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise ValueError(f"响应体过大: {declared} 字节 (上限 {max_bytes})")
+    declared = int(declared) if declared and declared.isdigit() else None
+    total = 0
+    # 只统计等待网络数据的时间，不含调用方处理每块（写盘等）的时间
+    started = time.perf_counter()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        icon_metrics.add("body", time.perf_counter() - started)
+        total += len(chunk)
+        if total > max_bytes:
+            raise ValueError(f"响应体过大: 超过 {max_bytes} 字节")
+        if on_chunk is not None:
+            on_chunk(total, declared)
+        yield chunk
+        started = time.perf_counter()
+
+
+def _read_body(response, max_bytes, on_chunk=None):
+    """
+    流式读取响应体到内存并计算 SHA-256。
+
+    :return: (data, sha256_hex)
+    :raises ValueError: 响应体超过 max_bytes 时。
+    """
+    hasher = hashlib.sha256()
+    chunks = []
+    for chunk in _iter_body(response, max_bytes, on_chunk):
+        hasher.update(chunk)
+        chunks.append(chunk)
+    return b''.join(chunks), hasher.hexdigest()
+
+
+def _stream_to_file(response, path, max_bytes, keep_limit=0, on_chunk=None):
+    """
+    流式读取响应体并原子写入 path，同时增量计算 SHA-256。
+
+    :param keep_limit: 响应体不超过该字节数时在内存中保留一份（供内存缓存使用）。
+    :param on_chunk: 见 _iter_body。
+    :return: (nbytes, sha256_hex, data 或 None)
+    :raises ValueError: 响应体超过 max_bytes 时（临时文件会被删除）。
+    """
+    hasher = hashlib.sha256()
+    kept = []
+    total = 0
+    tmp = icon_store.temp_path(path)
+    try:
+        with open(tmp, 'wb') as f:
+            for chunk in _iter_body(response, max_bytes, on_chunk):
+                total += len(chunk)
+                hasher.update(chunk)
+                with icon_metrics.phase("write"):
+                    f.write(chunk)
+                if kept is not None:
+                    kept.append(chunk)
+                    if total > keep_limit:
+                        kept = None
+        with icon_metrics.phase("write"):
+            os.replace(tmp, path)
+    except BaseException:
+        icon_store.remove_quietly(tmp)
+        raise
+    return total, hasher.hexdigest(), b''.join(kept) if kept is not None else None
+
+
+def _send(session, url, urgent=None, direct=False, **kwargs):
+    """
+    经过共享的熔断器、限速器与自适应并发上限发送请求，超时取自 request_timeout，
+    并对 429/5xx/连接错误做退避重试。interactive 任务优先获得并发名额。
+
+    :param urgent: 是否优先获得并发名额；None 时按当前调度任务的优先级判断（在其他线程中代发请求时需显式传入）。
+    :param direct: 直接请求网站本身（favicon / html 来源）：改由 host_limiter 按主机限制并发，
+                   按 direct_retry_policy 重试，超时为 DIRECT_TIMEOUT，不经过也不影响上述共享控制。
+    """
+    if urgent is None:
+        urgent = icon_sched.current_priority() == icon_sched.INTERACTIVE
+    if direct:
+        host = urlsplit(url).hostname or ""
+        kwargs.setdefault("timeout", DIRECT_TIMEOUT)
+        host_limiter.acquire(host, urgent)
+        try:
+            return _traced_send(session, url, None, None, direct_retry_policy, kwargs)
+        finally:
+            host_limiter.release(host)
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    kwargs.update(concurrency=concurrency_limit, timeouts=request_timeout, urgent=urgent)
+    return _traced_send(session, url, rate_limiter, circuit_breaker, retry_policy, kwargs)
+
+
+def _traced_send(session, url, limiter, breaker, policy, kwargs):
+    trace = icon_metrics.current()
+    if trace is None:
+        return icon_throttle.send_with_retry(session, url, limiter, breaker, policy, **kwargs)
+    before = sum(trace.phases.get(p, 0.0) for p in ("connect", "tls", "ttfb"))
+    started = time.perf_counter()
+    try:
+        return icon_throttle.send_with_retry(session, url, limiter, breaker, policy, **kwargs)
+    finally:
+        # 除建连与等待响应头之外的时间都花在限速、熔断、等待并发名额和重试退避上
+        network = sum(trace.phases.get(p, 0.0) for p in ("connect", "tls", "ttfb")) - before
+        trace.add("wait", max(0.0, time.perf_counter() - started - network))
+
+
+def _download_one(host, save_dir, size, session, **options):
+    """
+    下载单个图标并返回结果字典（含耗时 elapsed_ms），字段见 make_result；host 需已规范化。
+
+    结束后通过 icon_metrics.emit 向监听者发送带阶段耗时的事件。
+    """
+    trace = icon_metrics.begin()
+    try:
+        result = _download_to_dir(host, save_dir, size, session, **options)
+    finally:
+        icon_metrics.end()
+    result["elapsed_ms"] = round((time.perf_counter() - trace.started) * 1000, 1)
+    icon_metrics.emit(result, trace)
+    return result
+
+
+def _download_to_dir(host, save_dir, size, session, use_cache=True, max_bytes=MAX_ICON_BYTES, store=None,
+                     progress=None, cancel=None, index=None, providers=None):
+    result = make_result(host, size, host)
+    key = (host, int(size))
+    if cancel is not None and cancel.is_set():
+        result["error"] = "已取消"
+        return result
+    if use_cache:
+        hit = memory_cache.get(key)
+        if hit is not None:
+            data, content_type = hit
+            save_path = os.path.join(save_dir, icon_filename(host, size, ext_from_content_type(content_type)))
+            digest = hashlib.sha256(data).hexdigest()
+            if not _icon_exists(save_path, store):
+                try:
+                    _write_icon(save_path, data, digest, store)
+                except OSError as e:
+                    result["error"] = str(e)
+                    return result
+                if index is not None:
+                    index.record(host, size, {"file": os.path.basename(save_path), "content_type": content_type,
+                                              "bytes": len(data)}, digest)
+            result.update(path=save_path, content_type=content_type, bytes=len(data), sha256=digest,
+                          cache="memory")
+            return result
+
+    stem = icon_filename(host, size, '')
+    meta = _load_meta(save_dir, stem, store) if use_cache else None
+    if meta and icon_cache.is_fresh(meta):
+        result.update(path=os.path.join(save_dir, meta["file"]), content_type=meta.get("content_type"),
+                      bytes=meta.get("bytes") or 0, sha256=meta.get("sha256"), cache="fresh")
+        _remember_file(key, result, store)
+        return result
+
+    if providers is not None:
+        fetched = _fetch_from_providers(result, key, session, providers, max_bytes, progress, cancel)
+        if fetched is None:
+            return result
+        data, content_type, response_headers = fetched["data"], fetched["content_type"], fetched["headers"]
+        result.update(url=fetched["url"], status=fetched["status"], content_type=content_type,
+                      provider=fetched["provider"])
+        filename = icon_filename(host, size, ext_from_content_type(content_type))
+        save_path = os.path.join(save_dir, filename)
+        digest = hashlib.sha256(data).hexdigest()
+        nbytes = len(data)
+        try:
+            _write_icon(save_path, data, digest, store)
+        except OSError as e:
+            result["error"] = str(e)
+            return result
+    else:
+        headers = icon_cache.conditional_headers(meta) if meta else None
+        on_chunk = _chunk_hook(key, progress, cancel)
+        try:
+            response, result["retries"] = _send(session, result["url"], headers=headers, stream=True)
+            with response:
+                result["status"] = response.status_code
+                if response.status_code == 304 and meta:
+                    meta = icon_cache.refresh_meta(meta, response.headers)
+                    _save_meta(save_dir, stem, meta, store)
+                    if index is not None:
+                        index.record(host, size, meta)
+                    result.update(path=os.path.join(save_dir, meta["file"]), content_type=meta.get("content_type"),
+                                  bytes=meta.get("bytes") or 0, sha256=meta.get("sha256"), cache="revalidated")
+                    _remember_file(key, result, store)
+                    return result
+
+                content_type = response.headers.get('Content-Type', '')
+                result["content_type"] = content_type or None
+                # 检查请求是否成功
+                if response.status_code != 200 or 'image' not in content_type:
+                    result["error"] = f"HTTP {response.status_code}"
+                    return result
+
+                filename = icon_filename(host, size, ext_from_content_type(content_type))
+                save_path = os.path.join(save_dir, filename)
+                if store is not None:
+                    # 先在内存中算出哈希：blob 已存在时无需任何写入
+                    data, digest = _read_body(response, max_bytes, on_chunk)
+                    nbytes = len(data)
+                    store.save(save_path, data, digest)
+                else:
+                    keep_limit = memory_cache.max_item_bytes if use_cache else 0
+                    nbytes, digest, data = _stream_to_file(response, save_path, max_bytes, keep_limit, on_chunk)
+            response_headers = response.headers
+        except (requests.exceptions.RequestException, ValueError, OSError, DownloadCancelled) as e:
+            result["error"] = str(e)
+            return result
+
+    if use_cache or index is not None:
+        meta = icon_cache.meta_from_response(filename, response_headers, nbytes)
+        meta.update(sha256=digest, content_type=content_type)
+    if use_cache:
+        try:
+            _save_meta(save_dir, stem, meta, store)
+        except OSError as e:
+            result["error"] = str(e)
+            return result
+    if index is not None:
+        index.record(host, size, meta)
+    result.update(path=save_path, bytes=nbytes, sha256=digest)
+    if use_cache:
+        if data is not None:
+            memory_cache.put(key, data, content_type)
+        result["cache"] = "miss"
+    return result
+
+
+def _fetch_from_providers(result, key, session, providers, max_bytes, progress=None, cancel=None):
+    """
+    通过 icon_providers.Providers 获取图标字节（各来源的请求可能在后台线程中并发进行）。
+
+    :return: Providers.fetch 的结果字典；失败时返回 None，并在 result 中写入 error 与重试次数。
+    """
+    urgent = icon_sched.current_priority() == icon_sched.INTERACTIVE
+    trace = icon_metrics.current()
+    retries = []  # 各来源请求的重试次数（可能来自多个线程，list.append 是原子的）
+
+    def get(url, limit=None, partial=False, cancel=None, direct=False):
+        if cancel is not None and cancel.is_set():
+            raise DownloadCancelled("已取消")
+        with icon_metrics.responses_to(trace):
+            response, n = _send(session, url, urgent=urgent, direct=direct, stream=True)
+        retries.append(n)
+        with response:
+            if response.status_code != 200:
+                return response.status_code, response.headers, b'', response.url
+            if partial:
+                data = _read_prefix(response, limit, _chunk_hook(key, None, cancel))
+            else:
+                data, _ = _read_body(response, limit or max_bytes, _chunk_hook(key, progress, cancel))
+            return response.status_code, response.headers, data, response.url
+
+    try:
+        fetched, errors = providers.fetch(key[0], key[1], get, cancel)
+    finally:
+        result["retries"] = sum(retries)
+    if fetched is None:
+        result["error"] = "; ".join(errors) or "没有找到图标"
+    return fetched
+
+
+def _read_prefix(response, limit, on_chunk=None, stop=b"</head"):
+    """读取 HTML 响应体的开头：读到 stop（不区分大小写）或 limit 字节为止，其余部分丢弃。"""
+    chunks = []
+    total = 0
+    tail = b''
+    for chunk in response.iter_content(CHUNK_SIZE):
+        chunks.append(chunk)
+        total += len(chunk)
+        if on_chunk is not None:
+            on_chunk(total, None)
+        window = tail + chunk.lower()
+        if total >= limit or stop in window:
+            break
+        tail = window[-len(stop):]
+    return b''.join(chunks)[:limit]
+
+
+def _remember_file(key, result, store=None):
+    """把磁盘缓存命中的图标载入内存缓存，后续请求不再触发磁盘读取；超过条目上限的图标不读取。"""
+    if result["bytes"] > memory_cache.max_item_bytes:
+        return
+    try:
+        data = _read_icon(result["path"], store)
+    except OSError:
+        return
+    memory_cache.put(key, data, result["content_type"] or '')
+
+
+def fetch_icon_bytes(domain, size=64, session=None, use_cache=True, fold_www=False):
+    """
+    获取图标字节而不落盘，适合嵌入长期运行的服务。
+
+    :return: (data, content_type)；失败时返回 None。
+    """
+    host = normalize_domain(domain, fold_www)
+    if host is None:
+        return None
+    key = (host, int(size))
+    if use_cache:
+        hit = memory_cache.get(key)
+        if hit is not None:
+            return hit
+    session = session or get_session()
+    try:
+        response, _ = _send(session, build_icon_url(host, size), stream=True)
+        with response:
+            content_type = response.headers.get('Content-Type', '')
+            if response.status_code != 200 or 'image' not in content_type:
+                return None
+            data, _ = _read_body(response, MAX_ICON_BYTES)
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    if use_cache:
+        memory_cache.put(key, data, content_type)
+    return data, content_type
+
+
+def _derive_smaller_sizes(hosts, sizes, save_dir, session, pool, **options):
+    """
+    多尺寸模式：每个主机只请求最大尺寸一次，较小的 PNG 尺寸在本地批量缩放生成。
+
+    源图像不是 PNG/ICO、无法解码或小于目标尺寸时，对应尺寸退回到单独请求。
+
+    :param options: 透传给 _download_one 的关键字参数。
+    :return: {(host, size): result}
+    """
+    largest = max(sizes)
+    smaller = sorted({int(s) for s in sizes if s != largest})
+    results = {}
+    sources = []  # (host, source_result, (w, h, rgba))
+
+    store = options.get("store")
+
+    def load(host, base):
+        # 源图像未变化且派生文件都在时无需重新缩放
+        if base["cache"] in ("memory", "fresh", "revalidated"):
+            paths = [os.path.join(save_dir, icon_filename(host, s, '.png')) for s in smaller]
+            if all(_icon_exists(p, store) for p in paths):
+                return "unchanged"
+        try:
+            return icon_image.decode_image(_read_icon(base["path"], store), largest)
+        except (OSError, ValueError):
+            return None
+
+    bases = list(zip(hosts, pool.map(lambda h: _download_one(h, save_dir, largest, session, **options), hosts)))
+    loaded = pool.map(lambda hb: load(*hb) if hb[1]["path"] and hb[1]["path"].endswith(('.png', '.ico')) else None,
+                      bases)
+    for (host, base), decoded in zip(bases, loaded):
+        results[(host, largest)] = base
+        if decoded == "unchanged":
+            for s in smaller:
+                path = os.path.join(save_dir, icon_filename(host, s, '.png'))
+                results[(host, s)] = dict(make_result(host, s, host), path=path, content_type='image/png',
+                                          bytes=store.size(path) if store is not None else os.path.getsize(path),
+                                          cache=base["cache"],
+                                          derived_from=base["path"])
+        elif decoded is not None:
+            sources.append((host, base, decoded))
+
+    def write(host, base, size, rgba):
+        data = icon_image.encode_png(size, size, rgba)
+        path = os.path.join(save_dir, icon_filename(host, size, '.png'))
+        digest = hashlib.sha256(data).hexdigest()
+        try:
+            _write_icon(path, data, digest, store)
+        except OSError as e:
+            return (host, size), dict(make_result(host, size, host), error=str(e), derived_from=base["path"])
+        if options.get("index") is not None:
+            options["index"].record(host, size, {"file": os.path.basename(path), "content_type": 'image/png',
+                                                 "bytes": len(data)}, digest, derived_from=base["path"])
+        return (host, size), dict(make_result(host, size, host), path=path, content_type='image/png',
+                                  bytes=len(data), sha256=digest, derived_from=base["path"])
+
+    for i in range(0, len(sources), DERIVE_BATCH):
+        chunk = sources[i:i + DERIVE_BATCH]
+        derived = icon_image.derive_sizes_batch([src for _, _, src in chunk], smaller)
+        jobs = [(host, base, size, rgba) for (host, base, _), sizes_rgba in zip(chunk, derived)
+                for size, rgba in sizes_rgba.items()]
+        results.update(pool.map(lambda job: write(*job), jobs))
+
+    missing = [(host, s) for host in hosts for s in smaller if (host, s) not in results]
+    results.update(zip(missing, pool.map(lambda k: _download_one(k[0], save_dir, k[1], session, **options), missing)))
+    return results
+
+
+def download_icon_all_sizes(domain, sizes=ALL_SIZES, save_dir='icons', session=None, use_cache=True,
+                            fold_www=False, max_bytes=MAX_ICON_BYTES, store=None, index=None, providers=None):
+    """
+    只请求一次最大尺寸，本地生成其余较小尺寸的 PNG（文件名规则不变）。
+
+    :param domain: 网站域名或 URL。
+    :param sizes: 需要的尺寸列表。
+    :param save_dir: 保存图标的目录。
+    :param store: 可选的 icon_store.ContentStore，见 download_icon_from_google。
+    :param index: 可选的 icon_index.IconIndex，见 download_icon_from_google。
+    :param providers: 可选的 icon_providers.Providers，见 download_icon_from_google。
+    :return: {size: 保存路径或 None}
+    """
+    host = normalize_domain(domain, fold_www)
+    if host is None:
+        logger.warning("无效的域名: %r", domain)
+        return {int(s): None for s in sizes}
+    os.makedirs(save_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = _derive_smaller_sizes([host], sizes, save_dir, session or get_session(), pool,
+                                        use_cache=use_cache, max_bytes=max_bytes, store=store, index=index,
+                                        providers=providers)
+    if index is not None:
+        index.flush()
+    return {int(s): results[(host, int(s))]["path"] for s in sizes}
+
+
+def download_icon_from_google(domain, save_dir='icons', size=64, session=None, use_cache=True, fold_www=False,
+                              max_bytes=MAX_ICON_BYTES, store=None, index=None, providers=None,
+                              priority=icon_sched.INTERACTIVE):
     """
     使用 Google 的 favicon 服务下载网站图标。
 
     :param domain: 网站域名 (例如: "github.com")。
     :param save_dir: 保存图标的目录。
     :param size: 想要的图标尺寸 (例如: 16, 32, 64, 128)。
+    :param session: 可选的 requests.Session；默认使用共享连接池。
+    :param use_cache: 是否启用缓存：先查进程内缓存 memory_cache，再查磁盘缓存
+                      （max-age 内直接复用，过期后发送条件请求）。
+    :param fold_www: 为 True 时把 "www.example.com" 与 "example.com" 视为同一站点。
+    :param max_bytes: 响应体大小上限；超过时中止下载，不留下任何文件。
+    :param store: 可选的 icon_store.ContentStore；提供时相同内容的图标只保存一份，
+                  各域名文件为指向同一 blob 的硬链接。也可传入 icon_store.PackWriter，
+                  把图标追加到单个包文件中（返回的路径只是包内名字，用 icon_store.PackReader 读取）。
+    :param index: 可选的 icon_index.IconIndex；写入图标或重新验证后在索引中记录其元数据。
+    :param providers: 可选的 icon_providers.Providers（见 make_providers）；提供时按其中各来源的成绩依次或对冲地
+                      请求（Google、/favicon.ico、首页 <link rel="icon">），不再只依赖 Google 服务。
+    :param priority: 在共享调度器（get_scheduler）中执行的优先级，默认 interactive：优先于同一进程中
+                     正在进行的批量下载，并优先获得并发名额；None 时直接在调用线程中下载。
     :return: 如果下载成功，返回保存的文件路径；否则返回 None。
     """
-    print(f"\n🚀 使用 Google 服务获取 '{domain}' 的图标...")
+    logger.debug("获取图标: %s (%dx%d)", domain, size, size)
 
     # 确保保存目录存在
     os.makedirs(save_dir, exist_ok=True)
 
-    # 构建 Google favicon 服务的 URL
-    # 新版 t0.gstatic.com 接口更稳定，且支持 https:// 前缀
-    full_url_for_api = f"https://{domain}" if not domain.startswith('http') else domain
-    icon_url = f"https://t0.gstatic.com/faviconV2?client=SOCIAL&type=FAVICON&fallback_opts=TYPE,SIZE,URL&url={full_url_for_api}&size={size}"
+    host = normalize_domain(domain, fold_www)
+    if host is None:
+        logger.warning("无效的域名: %r", domain)
+        return None
 
-    try:
-        response = requests.get(icon_url, timeout=10)
-
-        # 检查请求是否成功
-        if response.status_code == 200 and 'image' in response.headers.get('Content-Type', ''):
-            # 从 Content-Type 推断文件扩展名
-            content_type = response.headers['Content-Type']
-            if 'svg' in content_type:
-                ext = '.svg'
-            elif 'png' in content_type:
-                ext = '.png'
-            elif 'jpeg' in content_type:
-                ext = '.jpg'
+    args = (host, save_dir, size, session or get_session())
+    options = dict(use_cache=use_cache, max_bytes=max_bytes, store=store, index=index, providers=providers)
+    if priority is None or icon_sched.current_priority() is not None:
+        # 已在调度器的工作线程中时直接执行，避免等待同一调度器中的其他任务
+        result = _download_one(*args, **options)
+    else:
+        result = get_scheduler().submit(_download_one, *args, priority=priority, **options).result()
+    if index is not None:
+        index.flush()
+    if result["path"]:
+        logger.info("图标已保存: %s (cache=%s, provider=%s)", result["path"], result["cache"], result["provider"])
+        return result["path"]
+    if providers is not None:
+        logger.warning("所有图标来源都失败: %s: %s", domain, result["error"])
+    elif result["status"] is None:
+        logger.warning("下载时发生网络错误: %s: %s", domain, result["error"])
+    else:
+        logger.warning("下载失败 (状态码: %s): %s。Google 服务可能未找到该网站的图标。", result["status"], domain)
+    return None
+
+
+def download_icons_bulk(domains, sizes=(64,), save_dir='icons', workers=8, use_cache=True, fold_www=False,
+                        derive_sizes=False, max_bytes=MAX_ICON_BYTES, store=None, progress=None, cancel=None,
+                        priority=icon_sched.NORMAL, deadline=None, journal=None, index=None, providers=None):
+    """
+    批量下载图标：任务交给共享调度器（get_scheduler）执行，所有请求共享同一个连接池。
+
+    输入先经 normalize_domain 规范化并去重，相同的 (主机名, 尺寸) 只请求一次。
+
+    :param domains: 域名或 URL 列表。
+    :param sizes: 尺寸列表；每个域名会下载其中每个尺寸。
+    :param save_dir: 保存图标的目录。
+    :param workers: 该批次最多同时占用的工作线程数。
+    :param use_cache: 是否启用内存与磁盘缓存（见 download_icon_from_google）。
+    :param fold_www: 为 True 时去掉开头的 "www." 再去重。
+    :param derive_sizes: 为 True 时每个域名只请求最大尺寸，较小尺寸在本地缩放生成
+                         （结果中带 derived_from 字段）。
+    :param max_bytes: 单个响应体大小上限。
+    :param store: 可选的 icon_store.ContentStore（内容寻址去重存储）或 icon_store.PackWriter（打包输出）。
+    :param index: 可选的 icon_index.IconIndex（元数据索引），批次结束时提交。
+    :param progress: 可选回调 progress((host, size), received, total)，在工作线程中每收到一块响应体调用一次；
+                     total 为 Content-Length（未知时为 None）。
+    :param cancel: 可选的 threading.Event；设置后不再发起新请求，进行中的下载在下一块到达时中止，
+                   未完成的项 error 为 "已取消"。
+    :param priority: 调度优先级 "interactive" / "normal" / "bulk"（或 icon_sched 中的常量）；
+                     同一进程中的即时查询应使用 "interactive"，大批量后台任务使用 "bulk"。
+    :param deadline: 截止时间（秒）；到时仍未完成的项 error 为 "已超时"。
+    :param journal: 可选的 icon_journal.Journal；记录每项的完成情况，再次运行时跳过已完成的项
+                    （结果 cache 为 "journal"），只重新下载失败与未完成的项。
+    :param providers: 可选的 icon_providers.Providers，见 download_icon_from_google；结果的 provider 字段为实际来源。
+    :return: 结果字典列表，顺序与 (domain, size) 的输入顺序一致；
+             每个原始输入都有一条结果，domain 字段保留原始输入。
+    """
+    keys, items = dedupe_requests(domains, sizes, fold_www)
+    options = dict(use_cache=use_cache, max_bytes=max_bytes, store=store, progress=progress, cancel=cancel,
+                   priority=priority, deadline=deadline, journal=journal, index=index, providers=providers)
+    done = dict(_run_keys(keys, save_dir, workers, derive_sizes, options))
+    return [dict(done[key], domain=d) if key else make_result(d, s) for d, s, key in items]
+
+
+def iter_icons_bulk(domains, sizes=(64,), save_dir='icons', workers=8, fold_www=False, derive_sizes=False,
+                    **options):
+    """
+    与 download_icons_bulk 相同，但按完成顺序逐条产出结果（每个原始输入一条）。
+
+    输入是惰性读取的：边读边去重、边提交，第一批下载不必等整个输入读完；
+    同一时刻只提交 workers 的数倍个任务，百万级输入也不会堆积大量 Future。
+    options 为 use_cache / max_bytes / store / index / progress / cancel / priority / deadline / journal /
+    providers，含义同 download_icons_bulk。
+    """
+    ready = deque()  # 无需等待下载的结果：无效输入，以及已完成键的重复输入
+    waiting = {}   # 进行中的键 -> 等待其结果的原始输入
+    finished = {}  # 已完成的键 -> 结果，供之后出现的重复输入使用
+
+    def keys():
+        for d, s, key, first in _iter_requests(domains, sizes, fold_www):
+            if key is None:
+                ready.append(make_result(d, s))
+            elif first:
+                waiting[key] = [d]
+                yield key
+            elif key in finished:
+                ready.append(dict(finished[key], domain=d))
             else:
-                ext = '.ico'
+                waiting[key].append(d)
 
-            # 清理域名作为文件名 (例如 "https://www.douban.com" -> "www.douban.com")
-            clean_domain = urlparse(full_url_for_api).netloc
-            filename = f"{clean_domain}_{size}x{size}{ext}"
-            save_path = os.path.join(save_dir, filename)
+    for key, result in _run_keys(keys(), save_dir, workers, derive_sizes, options):
+        while ready:
+            yield ready.popleft()
+        finished[key] = result
+        for d in waiting.pop(key):
+            yield dict(result, domain=d)
+    while ready:
+        yield ready.popleft()
 
-            # 以二进制写模式保存文件
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
 
-            print(f"✅ 图标下载成功: {icon_url}")
-            print(f"   保存至: {save_path}")
-            return save_path
-        else:
-            print(f"❌ 下载失败 (状态码: {response.status_code})。Google 服务可能未找到该网站的图标。")
-            return None
+def _run_keys(keys, save_dir, workers, derive_sizes, options):
+    """
+    下载去重后的 (host, size) 键（可迭代对象，惰性读取），按完成顺序产出 (key, result)。
 
-    except requests.exceptions.RequestException as e:
-        print(f"❌ 下载时发生网络错误: {e}")
-        return None
+    options 中有 journal 时，键按批登记到日志中，日志中已完成的项不再下载（cache 为 "journal"），
+    其余每条结果写入日志；结束（或提前退出）时提交作业日志与元数据索引中缓存的记录。
+    """
+    options = dict(options)
+    journal = options.pop("journal", None)
+    index = options.get("index")
+    precheck = None
+    if journal is not None:
+        store = options.get("store")
+        exists = store.exists if store is not None else os.path.exists
+        keys = _register_pending(keys, journal)
 
+        def precheck(key):
+            entry = journal.done(key, exists)
+            if entry is None:
+                return None
+            path, digest, nbytes, content_type = entry
+            return dict(make_result(key[0], key[1], key[0]), path=path, sha256=digest, bytes=nbytes or 0,
+                        content_type=content_type, cache="journal")
+    try:
+        for key, result in _schedule_keys(keys, save_dir, workers, derive_sizes, options, precheck):
+            if journal is not None and result["cache"] != "journal":
+                journal.record(key, result)
+            yield key, result
+    finally:
+        if journal is not None:
+            journal.flush()
+        if index is not None:
+            index.flush()
 
-# --- 使用示例 ---
-if __name__ == "__main__":
-    # 只需要提供域名即可
-    # download_icon_from_google("github.com", size=128)
-    #
-    # download_icon_from_google("www.douban.com", size=128)
 
-    download_icon_from_google("linux.do", size=128)
+def _register_pending(keys, journal, batch=1000):
+    """每取出 batch 个键就在作业日志中登记一次 pending（一个事务），再逐个产出。"""
+    keys = iter(keys)
+    while True:
+        chunk = list(itertools.islice(keys, batch))
+        if not chunk:
+            return
+        journal.add_pending(chunk)
+        yield from chunk
+
+
+def _host_batches(keys, hosts_per_batch):
+    """把键按主机分批（每批最多 hosts_per_batch 个主机），供多尺寸模式按批缩放。"""
+    batch = []
+    hosts = set()
+    for key in keys:
+        if key[0] not in hosts and len(hosts) >= hosts_per_batch:
+            yield batch
+            batch = []
+            hosts = set()
+        hosts.add(key[0])
+        batch.append(key)
+    if batch:
+        yield batch
+
+
+def _schedule_keys(keys, save_dir, workers, derive_sizes, options, precheck=None):
+    """
+    作为共享调度器中的一个作业下载 keys，按完成顺序产出 (key, result)。
+
+    keys 边下载边读取，同一时刻最多有 workers 的 4 倍个任务在排队或执行。
+    options 中的 priority / deadline 决定作业的优先级与截止时间，其余透传给 _download_one。
+
+    :param precheck: 可选的 precheck(key) -> 结果或 None；返回结果的键直接产出，不再下载
+                     （多尺寸模式下主机的任一尺寸需要下载时整个主机重新处理）。
+    """
+    os.makedirs(save_dir, exist_ok=True)
+    workers = max(1, int(workers))
+    limit = workers * 4
+    session = get_session(max(DEFAULT_POOL_SIZE, workers))
+    options = dict(options)
+    priority = options.pop("priority", None)
+    deadline = options.pop("deadline", None)
+    check = precheck or (lambda key: None)
+    # 多尺寸模式中取消后排队任务仍会执行（_download_to_dir 立即返回"已取消"），保证每个键都有结果
+    job = get_scheduler(workers).job(icon_sched.NORMAL if priority is None else priority, deadline,
+                                     options.get("cancel"), max_concurrency=workers,
+                                     drop_on_cancel=not derive_sizes)
+    # 到达截止时间时作业会设置 cancel_event，进行中的下载随之中止
+    options["cancel"] = job.cancel_event
+    with job:
+        if derive_sizes:
+            for batch in _host_batches(keys, max(DERIVE_BATCH, limit)):
+                checked = {key: check(key) for key in batch}
+                hosts = list(dict.fromkeys(host for (host, _), result in checked.items() if result is None))
+                results = {}
+                if hosts:
+                    results = _derive_smaller_sizes(hosts, {size for _, size in batch}, save_dir, session, job,
+                                                    **options)
+                for key in batch:
+                    if key in results:
+                        yield key, _job_result(job, key, result=results[key])
+                    else:
+                        yield key, checked[key]
+            return
+        keys = iter(keys)
+        pending = {}
+
+        def refill():
+            """提交新任务直到排队数达到上限；返回 precheck 已给出结果、无需下载的 (key, result) 列表。"""
+            ready = []
+            while len(pending) < limit and len(ready) < limit and not job.cancelled:
+                key = next(keys, None)
+                if key is None:
+                    break
+                result = check(key)
+                if result is not None:
+                    ready.append((key, result))
+                else:
+                    pending[job.submit(_download_one, key[0], save_dir, key[1], session, **options)] = key
+            return ready
+
+        while True:
+            ready = refill()
+            yield from ready
+            if not pending:
+                if ready:
+                    continue
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = pending.pop(future)
+                yield key, _job_result(job, key, future)
+        # 取消或超时后剩余的键不再提交，直接产出"已取消"/"已超时"的结果
+        for key in keys:
+            yield key, check(key) or _job_result(job, key)
+
+
+def _job_result(job, key, future=None, result=None):
+    """
+    取出调度任务的结果；任务因取消或截止时间未执行时构造失败结果。
+
+    作业已超过截止时间时，"已取消" 改为 "已超时"。
+    """
+    if future is not None:
+        try:
+            result = future.result()
+        except (CancelledError, icon_sched.DeadlineExceeded):
+            result = None
+    if result is None:
+        result = dict(make_result(key[0], key[1], key[0]), error="已取消")
+    if result["error"] == "已取消" and job.expired():
+        result["error"] = "已超时"
+    return result
+
+
+# ---------------------------------------------------------------- 命令行
+
+# JSONL 输出中每条结果包含的字段
+JSONL_FIELDS = ("domain", "host", "size", "path", "bytes", "content_type", "status", "elapsed_ms", "cache",
+                "retries", "sha256", "provider", "error")
+
+
+def _parse_sizes(text):
+    if text.strip().lower() == 'all':
+        return ALL_SIZES
+    try:
+        sizes = tuple(int(part) for part in text.split(',') if part.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的尺寸列表: {text!r}") from None
+    if not sizes or min(sizes) <= 0:
+        raise argparse.ArgumentTypeError(f"无效的尺寸列表: {text!r}")
+    return sizes
+
+
+def _open_inputs(args):
+    """
+    打开 --input 给出的文件（"-" 为标准输入；没有任何输入参数且标准输入不是终端时读取标准输入）。
+
+    :raises OSError: 文件无法打开时（已打开的文件会先关闭）。
+    """
+    sources = list(args.input or [])
+    if not args.domains and not sources and not sys.stdin.isatty():
+        sources = ['-']
+    files = []
+    try:
+        for source in sources:
+            files.append(sys.stdin if source == '-' else open(source, 'r', encoding='utf-8'))
+    except OSError:
+        _close_inputs(files)
+        raise
+    return files
+
 
-    # 即使是带有路径的 URL，它也能正确处理
-    # download_icon_from_google("https://developer.mozilla.org/en-US/docs/Web/API", size=128)
+def _close_inputs(files):
+    for f in files:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _read_domains(args, files):
+    """依次产出命令行参数、已打开的输入文件中的域名；忽略空行与 # 注释。读完（或生成器关闭）后关闭文件。"""
+    try:
+        yield from args.domains
+        for f in files:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+    finally:
+        _close_inputs(files)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m dd2",
+        description="使用 Google Favicon 服务批量下载网站图标，每完成一项输出一行 JSON。")
+    parser.add_argument("domains", nargs="*", help="域名或 URL")
+    parser.add_argument("-i", "--input", action="append", metavar="FILE",
+                        help="从文件读取域名（每行一个，可重复指定；\"-\" 表示标准输入）")
+    parser.add_argument("-s", "--sizes", type=_parse_sizes, default=(64,),
+                        help="逗号分隔的尺寸列表，或 all（默认 64）")
+    parser.add_argument("-w", "--workers", type=int, default=32,
+                        help="工作线程数上限（默认 32）；实际并发由自适应并发上限按上游延迟与错误率决定")
+    parser.add_argument("-o", "--out", default="icons", help="输出目录（默认 icons）")
+    parser.add_argument("--derive", action="store_true", help="每个域名只请求最大尺寸，其余尺寸本地缩放生成")
+    parser.add_argument("--fold-www", action="store_true", help="把 www.example.com 与 example.com 视为同一站点")
+    parser.add_argument("--no-cache", action="store_true", help="忽略缓存，总是重新下载")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--cas", action="store_true", help="内容寻址存储：相同图标只保存一份，域名文件为硬链接")
+    output.add_argument("--pack", action="store_true",
+                        help=f"打包输出：所有图标追加写入 <out>/{icon_store.PACK_FILENAME}（附偏移索引），不生成单独的文件")
+    parser.add_argument("--rate", type=float, help="全局限速（每秒请求数）")
+    parser.add_argument("--providers", metavar="LIST",
+                        help="逗号分隔的图标来源（%s），按实测成功率与延迟排序尝试；默认只用 Google 服务"
+                             % ",".join(icon_providers.PROVIDER_NAMES))
+    parser.add_argument("--no-hedge", action="store_true",
+                        help="与 --providers 一起使用：不发对冲请求，只在前一个来源失败后才尝试下一个")
+    parser.add_argument("--timeout", type=float, metavar="SECONDS",
+                        help="固定的请求超时；默认按最近的延迟分位数自适应（最长 %d 秒）" % DEFAULT_TIMEOUT)
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="关闭自适应并发上限，始终使用 --workers 个并发请求")
+    parser.add_argument("--index", action="store_true",
+                        help=f"在 <out>/{icon_index.INDEX_FILENAME} 中记录图标元数据，可用 python -m icon_index 查询")
+    parser.add_argument("--journal", metavar="FILE",
+                        help="作业日志（SQLite）；中断后以相同参数重新运行时跳过已完成的项，只重试失败与未完成的项")
+    parser.add_argument("--metrics", metavar="FILE", help="定期把 Prometheus 文本格式的指标写入该文件")
+    parser.add_argument("--metrics-interval", type=float, default=5.0, help="指标文件的写入间隔秒数（默认 5）")
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="在标准错误输出日志（-vv 更详细）")
+    return parser
+
+
+def main(argv=None):
+    """命令行入口；全部成功返回 0，有失败项返回 1，参数错误或没有任何输入时返回 2。"""
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG if args.verbose > 1 else logging.INFO, stream=sys.stderr,
+                            format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.rate is not None:
+        rate_limiter.rate = args.rate
+        rate_limiter.burst = max(1.0, args.rate)
+    global concurrency_limit, request_timeout
+    if args.timeout is not None:
+        request_timeout = icon_throttle.AdaptiveTimeout(minimum=args.timeout, maximum=args.timeout)
+    if args.fixed_concurrency:
+        concurrency_limit = None
+    providers = None
+    if args.providers:
+        try:
+            providers = make_providers(args.providers, hedge=not args.no_hedge)
+        except ValueError as e:
+            parser.error(str(e))
+    try:
+        files = _open_inputs(args)
+    except OSError as e:
+        parser.error(f"无法读取输入文件 {e.filename}: {e.strerror}")
+    domains = _read_domains(args, files)
+    first = next(domains, None)
+    if first is None:
+        parser.error("没有输入任何域名（在命令行给出，或用 -i FILE / 标准输入）")
+    domains = itertools.chain((first,), domains)
+
+    store = None
+    if args.cas:
+        store = icon_store.ContentStore.for_dir(args.out)
+    elif args.pack:
+        store = icon_store.PackWriter.for_dir(args.out)
+    journal = icon_journal.Journal(args.journal) if args.journal else None
+    index = icon_index.IconIndex.for_dir(args.out) if args.index else None
+    metrics = None
+    if args.metrics:
+        metrics = icon_metrics.add_listener(icon_metrics.MetricsAggregator())
+        if concurrency_limit is not None:
+            metrics.add_gauge("concurrency_limit", "自适应并发上限。", lambda: int(concurrency_limit.limit))
+            metrics.add_gauge("requests_in_flight", "正在等待响应头的请求数。", lambda: concurrency_limit.in_flight)
+        metrics.add_gauge("request_timeout_seconds", "当前的请求超时。", request_timeout.timeout)
+        metrics.start_file_export(args.metrics, args.metrics_interval)
+
+    out = sys.stdout
+    failures = 0
+    last_flush = time.monotonic()
+    results = iter_icons_bulk(domains, args.sizes, args.out, args.workers, fold_www=args.fold_www,
+                              derive_sizes=args.derive, use_cache=not args.no_cache, store=store, journal=journal,
+                              index=index, providers=providers)
+    try:
+        for result in results:
+            if not result["path"]:
+                failures += 1
+            out.write(json.dumps({k: result.get(k) for k in JSONL_FIELDS}, ensure_ascii=False) + "\n")
+            # 按时间间隔批量 flush，避免百万行输出时每行一次系统调用
+            now = time.monotonic()
+            if now - last_flush >= 0.5:
+                out.flush()
+                last_flush = now
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        out.flush()
+        results.close()  # 中断时也把已完成的结果写入作业日志
+        if journal is not None:
+            journal.close()
+        if index is not None:
+            index.close()
+        if args.pack:
+            store.close()
+        if providers is not None:
+            logger.info("图标来源统计: %s", json.dumps(providers.stats(), ensure_ascii=False))
+            providers.close()
+        if metrics is not None:
+            icon_metrics.remove_listener(metrics)
+            metrics.stop()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
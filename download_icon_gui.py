@@ -4,10 +4,53 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
 from tkinter import font as tkfont
-import base64, zlib, struct
+import base64
+import hashlib
 import json
-
-from dd2 import download_icon_from_google
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import icon_image
+import icon_raster
+import icon_store
+from icon_gallery import IconGallery
+
+# dd2（以及 requests / urllib3）不在启动时导入：窗口显示后延迟 PREWARM_DELAY_MS 在后台线程预先导入，
+# 第一次下载时若尚未导入完成则在工作线程中导入
+PREWARM_DELAY_MS = 250
+
+# 批量下载的并发线程数
+BATCH_WORKERS = 8
+
+# 日志面板保留的最大行数与刷新间隔（毫秒）
+LOG_MAX_LINES = 2000
+LOG_FLUSH_MS = 50
+
+# 可由 icon_image 解码（后台线程处理）的扩展名；.ico 文件实际可能是 PNG 或 BMP
+DECODABLE_EXTS = (".png", ".ico", ".bmp")
+
+# 预览缓存容量：解码后的源图像数 / 缩放后的 PhotoImage 数
+PREVIEW_CACHE_SOURCES = 8
+PREVIEW_CACHE_IMAGES = 16
+# 窗口缩放时预览重绘的防抖间隔、批量下载时预览切换的最短间隔（毫秒）
+PREVIEW_DEBOUNCE_MS = 80
+PREVIEW_THROTTLE_MS = 200
+
+# 生成的窗口图标的磁盘缓存；文件名中的键由绘制参数与 APP_ICON_VERSION 计算，修改绘制代码时需递增版本号
+APP_ICON_VERSION = 2
+ICON_CACHE_DIR = os.environ.get("DOWNLOAD_ICON_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "download_icon")
+
+# 内置云朵图标的绘制参数
+CLOUD_ICON_STYLE = {
+    "size": 128,
+    "badge": (255, 255, 255, 255),
+    "border": (229, 231, 235, 255),  # Tailwind gray-200
+    "cloud": (226, 232, 240, 255),   # slate-200 (softer)
+    "arrow": (63, 140, 255, 255),    # JetBrains-like blue
+}
 
 # 主题配色预设（可扩展）
 THEMES = {
@@ -150,6 +193,303 @@ class RoundedButton(tk.Canvas):
         self.create_text(w//2, h//2, text=self._text, fill=fg, font=self._font)
 
 
+def parse_url_list(text: str):
+    """从粘贴的文本中提取 URL/域名：按空白、逗号、分号分隔，忽略 # 注释行，保持顺序去重。"""
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        items.extend(part for part in re.split(r"[\s,;]+", line) if part)
+    return list(dict.fromkeys(items))
+
+
+def cached_icon_png(name, params, build):
+    """
+    读取缓存的生成图标；未命中时调用 build() 生成并写入 ICON_CACHE_DIR。
+
+    :param name: 图标名，作为缓存文件名前缀。
+    :param params: 影响绘制结果的参数（可 JSON 序列化），参与计算缓存键。
+    :param build: 无参函数，返回 PNG 字节。
+    :return: PNG 字节
+    """
+    key = hashlib.sha1(json.dumps([APP_ICON_VERSION, name, params], sort_keys=True).encode()).hexdigest()[:16]
+    path = os.path.join(ICON_CACHE_DIR, f"{name}-{key}.png")
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if icon_image.is_png(data):
+            return data
+    except OSError:
+        pass
+    data = build()
+    try:
+        os.makedirs(ICON_CACHE_DIR, exist_ok=True)
+        icon_store.atomic_write(path, data)
+    except OSError:
+        pass
+    return data
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+class BatchProgress:
+    """
+    批量下载的实时进度（线程安全）：工作线程上报数据块与结果，Tk 主线程定时读取快照。
+
+    进度 = (已完成项 + 进行中各项按 Content-Length 计算的完成比例) / 总数。
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.bytes_received = 0
+        self.started = time.monotonic()
+        self._inflight = {}  # (host, size) -> (已接收字节, Content-Length 或 None)
+        self._lock = threading.Lock()
+
+    def on_chunk(self, key, received, total):
+        with self._lock:
+            previous = self._inflight.get(key, (0, None))[0]
+            # 重试时从 0 重新计数
+            self.bytes_received += received - previous if received >= previous else received
+            self._inflight[key] = (received, total)
+
+    def on_result(self, result: dict):
+        with self._lock:
+            self._inflight.pop((result.get("host"), result.get("size")), None)
+            self.completed += 1
+            if not result.get("path"):
+                self.failed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            partial = sum(min(1.0, received / total) for received, total in self._inflight.values() if total)
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            done = self.completed + partial
+            rate = self.completed / elapsed
+            remaining = self.total - self.completed
+            return {
+                "fraction": done / self.total if self.total else 1.0,
+                "completed": self.completed,
+                "failed": self.failed,
+                "total": self.total,
+                "bytes": self.bytes_received,
+                "bytes_per_s": self.bytes_received / elapsed,
+                "items_per_s": rate,
+                "eta": remaining / rate if rate > 0 else None,
+            }
+
+
+class LogSink:
+    """
+    线程安全的日志缓冲：任意线程调用 write()，Tk 主线程每 interval_ms 毫秒把积压的行一次性插入 Text。
+
+    控件只保留最近 max_lines 行；两次刷新之间积压超过 max_lines 的行直接丢弃并计数，
+    因此无论工作线程每秒产生多少日志，主线程每帧最多做一次插入和一次裁剪。
+    提供 spill_path 时，完整日志（含被丢弃的行）同时追加写入该文件。
+    """
+
+    def __init__(self, widget: tk.Text, max_lines: int = LOG_MAX_LINES, interval_ms: int = LOG_FLUSH_MS,
+                 spill_path: str | None = None):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self._pending = []
+        self._spill = []
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._job = None
+        self._spill_file = None
+        if spill_path:
+            try:
+                self._spill_file = open(spill_path, "a", encoding="utf-8")
+            except OSError:
+                self._spill_file = None
+
+    def write(self, line: str):
+        with self._lock:
+            self._pending.append(line)
+            if len(self._pending) > self.max_lines:
+                overflow = len(self._pending) - self.max_lines
+                del self._pending[:overflow]
+                self._dropped += overflow
+            if self._spill_file is not None:
+                self._spill.append(line)
+
+    def start(self):
+        if self._job is None:
+            self._job = self.widget.after(self.interval_ms, self._drain)
+
+    def close(self):
+        if self._job is not None:
+            try:
+                self.widget.after_cancel(self._job)
+            except Exception:
+                pass
+            self._job = None
+        self._write_spill()
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def _drain(self):
+        self._job = None
+        with self._lock:
+            lines, self._pending = self._pending, []
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            lines.insert(0, f"…（省略 {dropped} 行）")
+        if lines:
+            self._insert(lines)
+        self._write_spill()
+        self.start()
+
+    def _insert(self, lines):
+        w = self.widget
+        try:
+            # 用户向上翻看时不强制滚动到底部
+            follow = w.yview()[1] >= 0.999
+            w.insert(tk.END, "\n".join(lines) + "\n")
+            count = int(w.index("end-1c").split(".")[0]) - 1
+            if count > self.max_lines:
+                w.delete("1.0", f"{count - self.max_lines + 1}.0")
+            if follow:
+                w.see(tk.END)
+        except tk.TclError:
+            pass  # 窗口已销毁
+
+    def _write_spill(self):
+        if self._spill_file is None:
+            return
+        with self._lock:
+            lines, self._spill = self._spill, []
+        if lines:
+            try:
+                self._spill_file.write("\n".join(lines) + "\n")
+                self._spill_file.flush()
+            except OSError:
+                pass
+
+
+class PreviewCache:
+    """
+    预览图缓存。
+
+    解码后的源图像按 (路径, mtime, 文件大小) 缓存，缩放后的 PhotoImage 再按目标边长缓存，均为小型 LRU：
+    窗口缩放时不再读盘和解码，每个目标尺寸只做一次面积平均缩放。
+    PNG / ICO / BMP 的解码与缩放在后台线程完成（icon_image.decode_image），Tk 主线程只负责由结果创建
+    PhotoImage；其他 Tk 能读取的格式（GIF）在主线程用 PhotoImage + subsample 处理。
+    """
+
+    def __init__(self, widget: tk.Misc, max_sources: int = PREVIEW_CACHE_SOURCES,
+                 max_images: int = PREVIEW_CACHE_IMAGES):
+        self.widget = widget
+        self.max_sources = max_sources
+        self.max_images = max_images
+        self._sources = OrderedDict()
+        self._images = OrderedDict()
+        self._loading = set()
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get(self, path: str, max_side: int, on_ready=None):
+        """
+        返回适合放进 max_side 见方区域的预览图（只缩小不放大）。
+
+        未缓存的 PNG 交给后台线程处理并返回 None，完成后在主线程调用 on_ready()。
+
+        :raises OSError, ValueError, tk.TclError: 文件无法读取或解码时。
+        """
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        image_key = key + (max_side,)
+        img = self._images.get(image_key)
+        if img is not None:
+            self._images.move_to_end(image_key)
+            return img
+        if image_key in self._failed:
+            raise ValueError("无法解码该图像")
+        if not path.lower().endswith(DECODABLE_EXTS):
+            return self._remember(image_key, self._scale_photo(key, max_side))
+        if image_key not in self._loading:
+            self._loading.add(image_key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+            self._executor.submit(self._load_decoded, image_key, on_ready)
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._sources.clear()
+        self._images.clear()
+        self._failed.clear()
+
+    def _remember(self, image_key, img):
+        self._images[image_key] = img
+        if len(self._images) > self.max_images:
+            self._images.popitem(last=False)
+        return img
+
+    def _source(self, key, load):
+        with self._lock:
+            src = self._sources.get(key)
+            if src is not None:
+                self._sources.move_to_end(key)
+                return src
+        src = load()
+        with self._lock:
+            self._sources[key] = src
+            if len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+        return src
+
+    def _load_decoded(self, image_key, on_ready):
+        # 后台线程：读取、解码、缩放并编码为 PNG 字节（不触碰任何 Tk 对象）
+        key, max_side = image_key[:3], image_key[3]
+        try:
+            def load():
+                with open(key[0], "rb") as f:
+                    return icon_image.decode_image(f.read())
+            w, h, rgba = self._source(key, load)
+            scale = min(1.0, max_side / max(w, h))
+            nw, nh = max(1, round(w * scale)), max(1, round(h * scale))
+            if (nw, nh) != (w, h):
+                rgba = icon_image.resize_rgba(rgba, w, h, nw, nh)
+            png = icon_image.encode_png(nw, nh, rgba, level=1)
+        except (OSError, ValueError):
+            png = None  # 例如隔行扫描的 PNG，交给 Tk 读取
+
+        def finish():
+            self._loading.discard(image_key)
+            try:
+                if png is not None:
+                    img = tk.PhotoImage(data=base64.b64encode(png).decode("ascii"))
+                else:
+                    img = self._scale_photo(key, max_side)
+                self._remember(image_key, img)
+            except (OSError, tk.TclError):
+                self._failed.add(image_key)
+            if on_ready is not None:
+                on_ready()
+        try:
+            self.widget.after(0, finish)
+        except (RuntimeError, tk.TclError):
+            pass  # 窗口已关闭
+
+    def _scale_photo(self, key, max_side):
+        img = self._source(key, lambda: tk.PhotoImage(file=key[0]))
+        subs = max(1, -(-max(img.width(), img.height()) // max_side))
+        return img.subsample(subs, subs) if subs > 1 else img
+
+
 class App(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -165,6 +505,7 @@ class App(tk.Tk):
         self.theme_var = tk.StringVar(value="浅色")
         self._rounded_buttons = []
         self._prefs_path = os.path.join(os.path.expanduser("~"), ".download_icon_prefs.json")
+        self._log_file = None  # 可在偏好文件中设置 "log_file"，把完整日志写入该文件
 
         # Load user preferences
         self._load_prefs_into_vars()
@@ -175,10 +516,24 @@ class App(tk.Tk):
         self._build_ui()
         # progress helpers
         self._progress_job = None
-        self._progress_target = 0
+        self._batch = None
+        self._cancel_event = None
+        # 批量任务进行中发起的单个网站查询（其取消事件），与 _batch 分开跟踪
+        self._lookup = None
 
         # Save prefs on close
         self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(PREWARM_DELAY_MS, self._prewarm_downloader)
+
+    def _prewarm_downloader(self):
+        # 窗口已显示后在后台导入下载模块，第一次点击下载时不必再等待 requests 加载
+        def load():
+            try:
+                import dd2  # noqa: F401
+            except ImportError:
+                pass  # 缺少 requests 等依赖时，由下载时的导入报告错误
+
+        threading.Thread(target=load, name="dd2-prewarm", daemon=True).start()
 
     # Ensure message boxes are invoked on the Tk main thread (macOS safety)
     def show_info_async(self, title: str, message: str):
@@ -331,7 +686,7 @@ class App(tk.Tk):
                     img = None
         if img is None:
             try:
-                png_bytes = self._build_cloud_download_png()
+                png_bytes = cached_icon_png("cloud", CLOUD_ICON_STYLE, self._build_cloud_download_png)
                 b64 = base64.b64encode(png_bytes).decode('ascii')
                 img = tk.PhotoImage(data=b64)
             except Exception:
@@ -343,126 +698,50 @@ class App(tk.Tk):
             except Exception:
                 pass
 
-    def _build_cloud_download_png(self) -> bytes:
-        # Build a 128x128 transparent PNG with a white rounded-square badge,
+    def _build_cloud_download_png(self, style=CLOUD_ICON_STYLE) -> bytes:
+        # Build a transparent PNG (128x128 by default) with a white rounded-square badge,
         # a slate cloud, and a blue download arrow.
-        size = 128
-        transparent = (0, 0, 0, 0)
-        white = (255, 255, 255, 255)
-        border = (229, 231, 235, 255)  # Tailwind gray-200
-        cloud = (226, 232, 240, 255)   # slate-200 (softer)
-        arrow = (63, 140, 255, 255)    # JetBrains-like blue
+        size = style["size"]
+        white = style["badge"]
+        border = style["border"]
+        cloud = style["cloud"]
+        arrow = style["arrow"]
 
-        px = [[transparent for _ in range(size)] for _ in range(size)]
+        canvas = icon_raster.Raster(size, size)
 
-        # Rounded square parameters
+        # Rounded square badge with a 1px border
         pad = 12
-        x1, y1, x2, y2 = pad, pad, size - pad, size - pad
-        r = 22
-
-        def inside_round_rect(x, y):
-            if x1 + r <= x <= x2 - r and y1 <= y <= y2:
-                return True
-            if x1 <= x <= x2 and y1 + r <= y <= y2 - r:
-                return True
-            # corners
-            dx, dy = x - (x1 + r), y - (y1 + r)
-            if dx*dx + dy*dy <= r*r:
-                return True
-            dx, dy = x - (x2 - r), y - (y1 + r)
-            if dx*dx + dy*dy <= r*r:
-                return True
-            dx, dy = x - (x1 + r), y - (y2 - r)
-            if dx*dx + dy*dy <= r*r:
-                return True
-            dx, dy = x - (x2 - r), y - (y2 - r)
-            if dx*dx + dy*dy <= r*r:
-                return True
-            return False
-
-        # Fill badge
-        for y in range(size):
-            for x in range(size):
-                if inside_round_rect(x, y):
-                    px[y][x] = white
-
-        # 1px border
-        for y in range(size):
-            for x in range(size):
-                inside = inside_round_rect(x, y)
-                if inside:
-                    for nx, ny in ((x-1,y),(x+1,y),(x,y-1),(x,y+1)):
-                        if 0 <= nx < size and 0 <= ny < size and not inside_round_rect(nx, ny):
-                            px[y][x] = border
-                            break
+        badge = icon_raster.round_rect_spans(pad, pad, size - pad, size - pad, 22)
+        canvas.fill_spans(badge, white)
+        canvas.outline(badge, border)
 
         # Cloud shape (union of circles; more rounded)
-        cx, cy = size//2, size//2 + 6
-        # Make cloud slimmer horizontally (closer centers, smaller radii)
-        c1 = (cx - 20, cy - 6, 20)
-        c2 = (cx, cy - 14, 26)
-        c3 = (cx + 20, cy - 6, 20)
-        c4 = (cx, cy + 2, 18)
-
-        def inside_circle(x, y, cx0, cy0, rr):
-            dx, dy = x - cx0, y - cy0
-            return dx*dx + dy*dy <= rr*rr
-
-        def inside_cloud(x, y):
-            return (inside_circle(x,y,*c1) or inside_circle(x,y,*c2) or
-                    inside_circle(x,y,*c3) or inside_circle(x,y,*c4))
-
-        for y in range(size):
-            for x in range(size):
-                if inside_cloud(x, y):
-                    px[y][x] = cloud
+        cx, cy = size // 2, size // 2 + 6
+        canvas.fill_spans(icon_raster.union_spans(
+            icon_raster.circle_spans(cx - 20, cy - 6, 20),
+            icon_raster.circle_spans(cx, cy - 14, 26),
+            icon_raster.circle_spans(cx + 20, cy - 6, 20),
+            icon_raster.circle_spans(cx, cy + 2, 18),
+        ), cloud)
 
         # Arrow (shaft + head), centered, over the cloud
         shaft_w = 16  # thicker shaft
         base_y = cy + 6
-        # Shaft ends at base_y (just above arrow head base)
-        for y in range(cy - 24, base_y):
-            for x in range(cx - shaft_w//2, cx + shaft_w//2 + 1):
-                px[y][x] = arrow
+        canvas.fill_rect(cx - shaft_w // 2, cy - 24, cx + shaft_w // 2, base_y - 1, arrow)
         # Arrow head triangle (pointing down): base near shaft, apex at bottom
-        head_h = 18
-        base_half = max(shaft_w//2 + 4, 12)
-        for t in range(head_h):
-            y = base_y + t
-            half = max(base_half - t, 0)
-            for x in range(cx - half, cx + half + 1):
-                if 0 <= x < size and 0 <= y < size:
-                    px[y][x] = arrow
-
-        # Tray line under arrow (thicker, slightly lower)
-        tray_y = base_y + head_h + 4
-        for x in range(cx - 30, cx + 30):
-            for dy in (-1, 0, 1):  # 3px thick
-                y = tray_y + dy
-                if 0 <= y < size:
-                    px[y][x] = arrow
-
-        # Encode to PNG
-        raw = bytearray()
-        for y in range(size):
-            raw.append(0)
-            for x in range(size):
-                r8, g8, b8, a8 = px[y][x]
-                raw.extend((r8, g8, b8, a8))
-
-        def png_chunk(typ: bytes, data: bytes) -> bytes:
-            return struct.pack('>I', len(data)) + typ + data + struct.pack('>I', zlib.crc32(typ + data) & 0xffffffff)
-
-        sig = b'\x89PNG\r\n\x1a\n'
-        ihdr = struct.pack('>IIBBBBB', size, size, 8, 6, 0, 0, 0)
-        idat = zlib.compress(bytes(raw), 9)
-        png_bytes = sig + png_chunk(b'IHDR', ihdr) + png_chunk(b'IDAT', idat) + png_chunk(b'IEND', b'')
-        return png_bytes
+        base_half = max(shaft_w // 2 + 4, 12)
+        canvas.fill_triangle((cx - base_half, base_y), (cx + base_half, base_y), (cx, base_y + base_half), arrow)
+
+        # Tray line under arrow (3px thick)
+        tray_y = base_y + 18 + 4
+        canvas.fill_rect(cx - 30, tray_y - 1, cx + 29, tray_y + 1, arrow)
+        return canvas.to_png()
 
     def _make_generated_icon(self, accent_hex: str):
         # Deprecated in new flow; kept for fallback compatibility
         try:
-            png_bytes = self._build_abstract_download_png(accent_hex)
+            png_bytes = cached_icon_png("abstract", {"size": 128, "accent": accent_hex.lower()},
+                                        lambda: self._build_abstract_download_png(accent_hex))
             b64 = base64.b64encode(png_bytes).decode('ascii')
             return tk.PhotoImage(data=b64)
         except Exception:
@@ -471,95 +750,20 @@ class App(tk.Tk):
     def _build_abstract_download_png(self, accent_hex: str) -> bytes:
         # Build a 128x128 transparent PNG with abstract download motif (ring + arrow + tray)
         size = 128
-
-        def hex_to_rgba(h, a=255):
-            h = h.lstrip('#')
-            r = int(h[0:2], 16)
-            g = int(h[2:4], 16)
-            b = int(h[4:6], 16)
-            return (r, g, b, a)
-
-        transparent = (0, 0, 0, 0)
-        stroke = hex_to_rgba(accent_hex, 255)
-        accent = stroke
-
-        px = [[transparent for _ in range(size)] for _ in range(size)]
-
+        accent = icon_raster.parse_color(accent_hex)
+        canvas = icon_raster.Raster(size, size)
         cx, cy = size // 2, size // 2
 
-        def set_pixel(x, y, color):
-            if 0 <= x < size and 0 <= y < size:
-                px[y][x] = color
-
-        def draw_line(x1, y1, x2, y2, color):
-            dx = abs(x2 - x1)
-            dy = abs(y2 - y1)
-            x, y = x1, y1
-            sx = 1 if x1 < x2 else -1
-            sy = 1 if y1 < y2 else -1
-            if dx > dy:
-                err = dx // 2
-                while x != x2:
-                    set_pixel(x, y, color)
-                    err -= dy
-                    if err < 0:
-                        y += sy
-                        err += dx
-                    x += sx
-                set_pixel(x2, y2, color)
-            else:
-                err = dy // 2
-                while y != y2:
-                    set_pixel(x, y, color)
-                    err -= dx
-                    if err < 0:
-                        x += sx
-                        err += dy
-                    y += sy
-                set_pixel(x2, y2, color)
-
-        def draw_circle_outline(cx0, cy0, r, color, thickness=2):
-            r2 = r * r
-            r1_2 = (r - thickness) * (r - thickness)
-            for y in range(cy0 - r - 1, cy0 + r + 2):
-                for x in range(cx0 - r - 1, cx0 + r + 2):
-                    d2 = (x - cx0) * (x - cx0) + (y - cy0) * (y - cy0)
-                    if r1_2 <= d2 <= r2:
-                        set_pixel(x, y, color)
-
-        def draw_line_thick(x1, y1, x2, y2, color, thickness=3):
-            for off in range(-thickness//2, thickness//2 + 1):
-                if abs(x2 - x1) >= abs(y2 - y1):
-                    draw_line(x1, y1 + off, x2, y2 + off, color)
-                else:
-                    draw_line(x1 + off, y1, x2 + off, y2, color)
-
         # Abstract motif: outer ring
-        draw_circle_outline(cx, cy, 40, stroke, thickness=4)
+        canvas.fill_ring(cx, cy, 40, 4, accent)
         # Arrow shaft
-        draw_line_thick(cx, cy - 18, cx, cy + 10, accent, thickness=4)
+        canvas.draw_line(cx, cy - 18, cx, cy + 10, accent, thickness=4)
         # Arrow head
-        draw_line_thick(cx - 8, cy + 2, cx, cy + 12, accent, thickness=4)
-        draw_line_thick(cx + 8, cy + 2, cx, cy + 12, accent, thickness=4)
+        canvas.draw_line(cx - 8, cy + 2, cx, cy + 12, accent, thickness=4)
+        canvas.draw_line(cx + 8, cy + 2, cx, cy + 12, accent, thickness=4)
         # Tray line
-        draw_line_thick(cx - 16, cy + 18, cx + 16, cy + 18, accent, thickness=4)
-
-        # Encode to PNG RGBA
-        raw = bytearray()
-        for y in range(size):
-            raw.append(0)
-            for x in range(size):
-                r, g, b, a = px[y][x]
-                raw.extend((r, g, b, a))
-
-        def png_chunk(typ: bytes, data: bytes) -> bytes:
-            return struct.pack('>I', len(data)) + typ + data + struct.pack('>I', zlib.crc32(typ + data) & 0xffffffff)
-
-        sig = b'\x89PNG\r\n\x1a\n'
-        ihdr = struct.pack('>IIBBBBB', size, size, 8, 6, 0, 0, 0)
-        idat = zlib.compress(bytes(raw), 9)
-        png_bytes = sig + png_chunk(b'IHDR', ihdr) + png_chunk(b'IDAT', idat) + png_chunk(b'IEND', b'')
-        return png_bytes
+        canvas.draw_line(cx - 16, cy + 18, cx + 16, cy + 18, accent, thickness=4)
+        return canvas.to_png()
 
     def _build_ui(self):
         pad = 12
@@ -611,6 +815,16 @@ class App(tk.Tk):
         self.start_btn = RoundedButton(btn_frame, text="▶ 开始下载", command=self.on_download, colors=self._colors, variant="primary")
         self.start_btn.pack(side=tk.LEFT, pady=2)
         self._rounded_buttons.append(self.start_btn)
+        self.batch_btn = RoundedButton(btn_frame, text="批量…", command=self.open_batch_dialog, colors=self._colors, variant="secondary")
+        self.batch_btn.pack(side=tk.LEFT, padx=(6, 0), pady=2)
+        self._rounded_buttons.append(self.batch_btn)
+        self.gallery_btn = RoundedButton(btn_frame, text="图库…", command=self.open_gallery, colors=self._colors, variant="secondary")
+        self.gallery_btn.pack(side=tk.LEFT, padx=(6, 0), pady=2)
+        self._rounded_buttons.append(self.gallery_btn)
+        self.cancel_btn = RoundedButton(btn_frame, text="⏹ 取消", command=self.on_cancel, colors=self._colors, variant="secondary")
+        self.cancel_btn.pack(side=tk.LEFT, padx=(6, 0), pady=2)
+        self.cancel_btn.set_state("disabled")
+        self._rounded_buttons.append(self.cancel_btn)
 
         self.progress = ttk.Progressbar(btn_frame, mode="determinate", style=self._colors.get("pb_style", "Horizontal.TProgressbar"))
         self.progress.pack(side=tk.LEFT, padx=(10, 0), fill=tk.X, expand=True)
@@ -628,6 +842,8 @@ class App(tk.Tk):
         self.scroll = ttk.Scrollbar(panel, command=self.log.yview, style="Modern.Vertical.TScrollbar")
         self.scroll.grid(row=7, column=2, sticky="ns")
         self.log.configure(yscrollcommand=self.scroll.set)
+        self._log_sink = LogSink(self.log, spill_path=self._log_file)
+        self._log_sink.start()
 
         # Right side: icon preview (larger square with padding)
         self._preview_size = 280
@@ -638,6 +854,10 @@ class App(tk.Tk):
         self.preview_canvas.pack(expand=True)
         self._preview_image = None  # keep reference
         self._preview_path = None
+        self._preview_cache = PreviewCache(self)
+        self._preview_redraw_job = None
+        self._preview_pending = None
+        self._preview_update_job = None
         self.preview_wrap.bind("<Configure>", self._on_preview_container_configure)
         self._draw_preview_placeholder()
 
@@ -683,63 +903,197 @@ class App(tk.Tk):
             self._save_prefs()
 
     def append_log(self, text: str):
-        def _do():
-            self.log.insert(tk.END, text + "\n")
-            self.log.see(tk.END)
-        self.log.after(0, _do)
+        # 可从任意线程调用；由 LogSink 在主线程批量写入
+        self._log_sink.write(text)
 
     def on_download(self):
-        url = (self.url_var.get() or "").strip()
+        # 输入框中可以一次粘贴多个地址（空白或逗号分隔），此时按批量处理
+        urls = parse_url_list(self.url_var.get() or "")
+        if not urls:
+            messagebox.showwarning("提示", "请输入网站地址 URL")
+            return
+        if self._batch is not None:
+            # 批量任务进行中：单个网站作为 interactive 任务插队执行
+            if len(urls) == 1:
+                self._start_lookup(urls[0])
+            else:
+                self.append_log("⚠️ 批量任务进行中，一次只能插入查询一个网站")
+            return
+        self._start_batch(urls)
+
+    def open_batch_dialog(self):
+        # 批量输入：粘贴多行地址，或从文本文件导入
+        dlg = tk.Toplevel(self)
+        dlg.title("批量下载")
+        dlg.configure(bg=self._colors["panel"])
+        dlg.transient(self)
+        frame = ttk.Frame(dlg, padding=12, style="Panel.TFrame")
+        frame.pack(fill=tk.BOTH, expand=True)
+        ttk.Label(frame, text="每行一个网站地址（也可用空格或逗号分隔，# 开头为注释）:").pack(anchor="w")
+        text = tk.Text(frame, width=60, height=16, bg=self._colors["field_bg"], fg=self._colors["text"],
+                       insertbackground=self._colors["text"], highlightthickness=0, bd=0)
+        text.pack(fill=tk.BOTH, expand=True, pady=(4, 8))
+        count_var = tk.StringVar(value="共 0 个")
+        buttons = ttk.Frame(frame, style="Panel.TFrame")
+        buttons.pack(fill=tk.X)
+
+        def refresh_count(*_):
+            count_var.set(f"共 {len(parse_url_list(text.get('1.0', tk.END)))} 个")
+            text.edit_modified(False)
+
+        def import_file():
+            path = filedialog.askopenfilename(parent=dlg, filetypes=[("文本文件", "*.txt *.csv *.lst"), ("所有文件", "*")])
+            if not path:
+                return
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    content = f.read()
+            except OSError as e:
+                messagebox.showerror("导入失败", str(e), parent=dlg)
+                return
+            if text.get("1.0", tk.END).strip():
+                text.insert(tk.END, "\n")
+            text.insert(tk.END, content)
+            refresh_count()
+
+        def start():
+            urls = parse_url_list(text.get("1.0", tk.END))
+            if not urls:
+                messagebox.showwarning("提示", "请至少输入一个网站地址", parent=dlg)
+                return
+            dlg.destroy()
+            self._start_batch(urls, priority="bulk")
+
+        text.bind("<<Modified>>", refresh_count)
+        ttk.Label(buttons, textvariable=count_var).pack(side=tk.LEFT)
+        for label, command, variant in (("开始下载", start, "primary"), ("取消", dlg.destroy, "secondary"),
+                                        ("从文件导入…", import_file, "secondary")):
+            RoundedButton(buttons, text=label, command=command, colors=self._colors, variant=variant).pack(side=tk.RIGHT, padx=(6, 0))
+        text.focus_set()
+
+    def open_gallery(self):
+        # 浏览输出目录中的全部图标（虚拟化网格，适合数万个文件）
+        out_dir = (self.out_dir_var.get() or "").strip()
+        if not out_dir or not os.path.isdir(out_dir):
+            messagebox.showwarning("提示", "请选择存在的输出目录")
+            return
+        win = tk.Toplevel(self)
+        win.title(f"图库 - {out_dir}")
+        win.geometry("760x560")
+        win.configure(bg=self._colors["panel"])
+        frame = ttk.Frame(win, padding=10, style="Panel.TFrame")
+        frame.pack(fill=tk.BOTH, expand=True)
+        gallery = IconGallery(frame, out_dir, colors=self._colors, on_open=self._update_preview_async)
+        bar = ttk.Frame(frame, style="Panel.TFrame")
+        bar.pack(side=tk.TOP, fill=tk.X, pady=(0, 8))
+        RoundedButton(bar, text="刷新", command=gallery.refresh, colors=self._colors, variant="secondary").pack(side=tk.RIGHT)
+        gallery.pack(fill=tk.BOTH, expand=True)
+
+    def on_cancel(self):
+        if self._cancel_event is not None and not self._cancel_event.is_set():
+            self._cancel_event.set()
+            self.append_log("⏹ 正在取消…（进行中的下载将尽快中止）")
+
+    def _start_batch(self, urls, priority=None):
         out_dir = (self.out_dir_var.get() or "").strip()
         try:
             size = int(self.size_var.get() or 128)
         except Exception:
             size = 128
-
-        if not url:
-            messagebox.showwarning("提示", "请输入网站地址 URL")
-            return
         if not out_dir:
             messagebox.showwarning("提示", "请选择输出目录")
             return
+        if self._batch is not None:
+            return
 
-        self.append_log(f"🚀 获取图标: {url}")
+        if len(urls) == 1:
+            self.append_log(f"🚀 获取图标: {urls[0]}")
+        else:
+            self.append_log(f"🚀 批量获取图标: {len(urls)} 个网站（{BATCH_WORKERS} 个并发）")
         self.append_log(f"📁 保存目录: {out_dir}")
         self.append_log(f"🔧 尺寸: {size}x{size}")
 
+        if priority is None:
+            # 单个网站的查询优先于同一进程中正在进行的批量任务
+            priority = "interactive" if len(urls) == 1 else "normal"
+        batch = BatchProgress(len(urls))
+        cancel = threading.Event()
+        self._batch = batch
+        self._cancel_event = cancel
         # UI: set busy
         self._set_busy(True)
 
         def worker():
             try:
-                path = download_icon_from_google(url, save_dir=out_dir, size=size)
-                if path:
-                    self.append_log("✅ 下载完成")
-                    self.append_log(f"📥 保存路径: {path}")
-                    self._update_preview_async(path)
-                    success = True
-                    result = path
-                else:
-                    self.append_log("❌ 未获取到图标 (服务可能未返回图像)")
-                    success = False
-                    result = None
+                from dd2 import iter_icons_bulk  # 延迟导入，见 PREWARM_DELAY_MS
+                results = iter_icons_bulk(urls, (size,), out_dir, workers=BATCH_WORKERS,
+                                          progress=batch.on_chunk, cancel=cancel, priority=priority)
+                for result in results:
+                    batch.on_result(result)
+                    self._log_result(result)
             except Exception as e:
                 self.append_log(f"💥 下载失败: {e}")
-                success = False
-                result = None
             finally:
-                # complete progress then finish UI and optional notify
+                snap = batch.snapshot()
+                ok = snap["completed"] - snap["failed"]
+                cancelled = "（已取消）" if cancel.is_set() else ""
+                self.append_log(f"🏁 完成{cancelled}: 成功 {ok} / 共 {snap['total']}，"
+                                f"失败 {snap['failed']}，接收 {_format_bytes(snap['bytes'])}")
                 self.after(0, lambda: self._finish_ui_post_download())
 
         threading.Thread(target=worker, daemon=True).start()
 
+    def _start_lookup(self, url):
+        # 批量任务进行中的单个查询：输出目录与尺寸沿用批量任务的设置（此时两者不可修改）
+        if self._lookup is not None:
+            self.append_log("⚠️ 上一个单独查询尚未完成")
+            return
+        out_dir = (self.out_dir_var.get() or "").strip()
+        try:
+            size = int(self.size_var.get() or 128)
+        except Exception:
+            size = 128
+        cancel = threading.Event()
+        self._lookup = cancel
+        self.append_log(f"🚀 获取图标（优先）: {url}")
+
+        def worker():
+            try:
+                from dd2 import iter_icons_bulk
+                for result in iter_icons_bulk([url], (size,), out_dir, workers=1, cancel=cancel,
+                                              priority="interactive"):
+                    self._log_result(result)
+            except Exception as e:
+                self.append_log(f"💥 下载失败: {e}")
+            finally:
+                self.after(0, self._finish_lookup)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _finish_lookup(self):
+        self._lookup = None
+
+    def _log_result(self, result):
+        # 可从工作线程调用
+        if result["path"]:
+            self.append_log(f"✅ {result['domain']} → {result['path']}")
+            self._update_preview_async(result["path"])
+        elif result["error"] == "已取消":
+            pass
+        elif result["status"] is not None:
+            self.append_log(f"❌ {result['domain']}: 未获取到图标 (状态码: {result['status']})")
+        else:
+            self.append_log(f"💥 {result['domain']}: {result['error']}")
+
     def _set_busy(self, busy: bool):
         def _apply():
             if busy:
                 self.status_var.set("🟡 下载中…")
                 self._progress_start()
                 try:
-                    self.start_btn.set_state("disabled")
+                    # “开始”保持可用：批量任务进行中仍可单独查询一个网站（见 on_download）
+                    self.batch_btn.set_state("disabled")
+                    self.cancel_btn.set_state("normal")
                 except Exception:
                     pass
                 try:
@@ -759,6 +1113,8 @@ class App(tk.Tk):
                 self._progress_reset()
                 try:
                     self.start_btn.set_state("normal")
+                    self.batch_btn.set_state("normal")
+                    self.cancel_btn.set_state("disabled")
                 except Exception:
                     pass
                 try:
@@ -775,14 +1131,13 @@ class App(tk.Tk):
                     pass
         self.after(0, _apply)
 
-    # Progress handling
+    # Progress handling（真实进度：定时读取 BatchProgress 快照）
     def _progress_start(self):
         try:
             self.progress.configure(value=0, maximum=100)
         except Exception:
             pass
         self.percent_var.set("0%")
-        self._progress_target = 90
         if self._progress_job:
             try:
                 self.after_cancel(self._progress_job)
@@ -791,29 +1146,43 @@ class App(tk.Tk):
         self._progress_job = self.after(100, self._tick_progress)
 
     def _tick_progress(self):
+        batch = self._batch
+        if batch is None:
+            self._progress_job = None
+            return
+        self._show_progress(batch.snapshot())
+        self._progress_job = self.after(150, self._tick_progress)
+
+    def _show_progress(self, snap: dict):
+        val = 100.0 * snap["fraction"]
         try:
-            val = float(self.progress.cget("value"))
+            self.progress.configure(value=val)
         except Exception:
-            val = 0.0
-        step = 2.5
-        target = float(self._progress_target)
-        if val < target:
-            val = min(val + step, target)
+            pass
+        self.percent_var.set(f"{int(val)}%")
+        parts = [f"🟡 下载中… {snap['completed']}/{snap['total']}"]
+        if snap["failed"]:
+            parts.append(f"失败 {snap['failed']}")
+        parts.append(f"{_format_bytes(snap['bytes'])} · {_format_bytes(snap['bytes_per_s'])}/s")
+        parts.append(f"{snap['items_per_s']:.1f} 个/s")
+        if snap["eta"] is not None and snap["completed"] < snap["total"]:
+            eta = int(snap["eta"])
+            parts.append(f"剩余约 {eta // 60:02d}:{eta % 60:02d}")
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            parts[0] = f"⏹ 取消中… {snap['completed']}/{snap['total']}"
+        self.status_var.set(" · ".join(parts))
+
+    def _progress_complete(self):
+        if self._progress_job:
             try:
-                self.progress.configure(value=val)
+                self.after_cancel(self._progress_job)
             except Exception:
                 pass
-            self.percent_var.set(f"{int(val)}%")
-            self._progress_job = self.after(120, self._tick_progress)
-        else:
             self._progress_job = None
-
-    def _progress_complete(self):
-        try:
-            self.progress.configure(value=100)
-        except Exception:
-            pass
-        self.percent_var.set("100%")
+        if self._batch is not None:
+            self._show_progress(self._batch.snapshot())
+        self._batch = None
+        self._cancel_event = None
 
     def _progress_reset(self):
         if self._progress_job:
@@ -835,21 +1204,34 @@ class App(tk.Tk):
 
     def _update_preview_async(self, path: str):
         # Show preview for PNG/GIF in the square canvas; center and fit
-        def _apply():
-            try:
-                ext = os.path.splitext(path)[1].lower()
-                if ext in (".png", ".gif"):
-                    self._preview_path = path
-                    self._redraw_preview()
-                else:
-                    self._preview_path = None
-                    self._preview_image = None
-                    self._draw_preview_placeholder("(图像预览不支持该格式)")
-            except Exception:
+        # 可从工作线程调用；批量下载时合并为最多每 PREVIEW_THROTTLE_MS 毫秒切换一次，只显示最新的图标。
+        # _preview_pending / _preview_update_job 只在 Tk 线程中读写，工作线程经 after 转交
+        self.after(0, self._queue_preview, path)
+
+    def _queue_preview(self, path: str):
+        self._preview_pending = path
+        if self._preview_update_job is None:
+            self._preview_update_job = self.after(0, self._apply_pending_preview)
+
+    def _apply_pending_preview(self):
+        path, self._preview_pending = self._preview_pending, None
+        if path is None:
+            self._preview_update_job = None
+            return
+        self._preview_update_job = self.after(PREVIEW_THROTTLE_MS, self._apply_pending_preview)
+        try:
+            ext = os.path.splitext(path)[1].lower()
+            if ext in DECODABLE_EXTS + (".gif",):
+                self._preview_path = path
+                self._redraw_preview()
+            else:
                 self._preview_path = None
                 self._preview_image = None
-                self._draw_preview_placeholder("(无法预览)")
-        self.after(0, _apply)
+                self._draw_preview_placeholder("(图像预览不支持该格式)")
+        except Exception:
+            self._preview_path = None
+            self._preview_image = None
+            self._draw_preview_placeholder("(无法预览)")
 
     # Preferences
     def _load_prefs_into_vars(self):
@@ -861,6 +1243,9 @@ class App(tk.Tk):
         theme = data.get("theme")
         out_dir = data.get("out_dir")
         size = data.get("size")
+        log_file = data.get("log_file")
+        if isinstance(log_file, str) and log_file.strip():
+            self._log_file = os.path.expanduser(log_file)
         if isinstance(theme, str) and theme in THEMES:
             self.theme_var.set(theme)
         if isinstance(out_dir, str) and out_dir.strip():
@@ -877,6 +1262,8 @@ class App(tk.Tk):
             "out_dir": self.out_dir_var.get(),
             "size": self.size_var.get(),
         }
+        if self._log_file:
+            data["log_file"] = self._log_file
         try:
             with open(self._prefs_path, "w", encoding="utf-8") as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
@@ -888,6 +1275,12 @@ class App(tk.Tk):
             self._save_prefs()
         except Exception:
             pass
+        if self._lookup is not None:
+            self._lookup.set()
+        try:
+            self._log_sink.close()
+        except Exception:
+            pass
         try:
             self.destroy()
         except Exception:
@@ -925,23 +1318,29 @@ class App(tk.Tk):
             self.preview_canvas.configure(width=size, height=size)
         except Exception:
             pass
-        self._redraw_preview()
+        # 防抖：拖动窗口时只在停顿后重绘一次
+        if self._preview_redraw_job is not None:
+            try:
+                self.after_cancel(self._preview_redraw_job)
+            except Exception:
+                pass
+        self._preview_redraw_job = self.after(PREVIEW_DEBOUNCE_MS, self._redraw_preview)
 
     def _redraw_preview(self):
+        self._preview_redraw_job = None
         self.preview_canvas.delete("all")
         self._draw_preview_card()
-        if self._preview_path and os.path.exists(self._preview_path):
+        if self._preview_path:
             try:
-                img = tk.PhotoImage(file=self._preview_path)
-                w, h = img.width(), img.height()
                 max_side = max(1, min(self.preview_canvas.winfo_width(), self.preview_canvas.winfo_height()) - 16)
-                subs = max(1, (max(w, h) + max_side - 1) // max_side)
-                if subs > 1:
-                    try:
-                        img = img.subsample(subs, subs)
-                        w, h = img.width(), img.height()
-                    except Exception:
-                        pass
+                img = self._preview_cache.get(self._preview_path, max_side, self._redraw_preview)
+                if img is None:
+                    # 后台正在生成该尺寸的预览：先保留上一张图，完成后会再次重绘
+                    img = self._preview_image
+                    if img is None:
+                        self._draw_preview_placeholder("(加载中…)")
+                        return
+                w, h = img.width(), img.height()
                 self._preview_image = img
                 x = max(0, (self.preview_canvas.winfo_width() - w) // 2)
                 y = max(0, (self.preview_canvas.winfo_height() - h) // 2)
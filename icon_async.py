@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import os
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖：pip install aiohttp
+    aiohttp = None
+
+from dd2 import (MAX_ICON_BYTES, atomic_write, dedupe_requests, ext_from_content_type, icon_filename, make_result,
+                 normalize_domain)
+
+# 单个事件循环上允许同时在途的请求数
+DEFAULT_CONCURRENCY = 512
+
+
+def _require_aiohttp():
+    if aiohttp is None:
+        raise RuntimeError("icon_async 需要 aiohttp，请先执行: pip install aiohttp")
+
+
+def new_client_session(concurrency=DEFAULT_CONCURRENCY, timeout=10):
+    """创建连接池上限与并发数一致的 aiohttp.ClientSession。"""
+    _require_aiohttp()
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+
+
+async def fetch_icon(domain, save_dir='icons', size=64, session=None, executor=None, fold_www=False):
+    """
+    download_icon_from_google 的 asyncio 版本。
+
+    文件名与扩展名规则与 dd2 完全一致；文件原子写入并交给线程池执行，不阻塞事件循环。
+
+    :param domain: 网站域名或 URL。
+    :param save_dir: 保存图标的目录（需已存在）。
+    :param size: 图标尺寸。
+    :param session: 可选的 aiohttp.ClientSession；未提供时临时创建一个。
+    :param executor: 用于写文件的 Executor；默认使用事件循环的默认线程池。
+    :param fold_www: 为 True 时去掉开头的 "www."（见 dd2.normalize_domain）。
+    :return: 结果字典，字段同 dd2.make_result。
+    """
+    host = normalize_domain(domain, fold_www)
+    if host is None:
+        return make_result(domain, size)
+    if session is None:
+        async with new_client_session(concurrency=1) as own_session:
+            return await _fetch_host(host, save_dir, size, own_session, executor, domain)
+    return await _fetch_host(host, save_dir, size, session, executor, domain)
+
+
+async def _fetch_host(host, save_dir, size, session, executor, domain=None):
+    result = make_result(domain or host, size, host)
+    try:
+        async with session.get(result["url"]) as response:
+            result["status"] = response.status
+            content_type = response.headers.get('Content-Type', '')
+            result["content_type"] = content_type or None
+            if response.status != 200 or 'image' not in content_type:
+                result["error"] = f"HTTP {response.status}"
+                return result
+            chunks = []
+            total = 0
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                total += len(chunk)
+                if total > MAX_ICON_BYTES:
+                    result["error"] = f"响应体过大: 超过 {MAX_ICON_BYTES} 字节"
+                    return result
+                chunks.append(chunk)
+            data = b''.join(chunks)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result["error"] = str(e) or type(e).__name__
+        return result
+
+    save_path = os.path.join(save_dir, icon_filename(host, size, ext_from_content_type(content_type)))
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(executor, atomic_write, save_path, data)
+    except OSError as e:
+        result["error"] = str(e)
+        return result
+
+    result.update(path=save_path, bytes=len(data), sha256=hashlib.sha256(data).hexdigest())
+    return result
+
+
+async def fetch_many(domains, sizes=(64,), save_dir='icons', concurrency=DEFAULT_CONCURRENCY, executor=None,
+                     fold_www=False):
+    """
+    在单个事件循环上并发下载大量图标。
+
+    输入先规范化并去重，相同的 (主机名, 尺寸) 只请求一次。通过信号量限制在途请求数：
+    任务按需创建，同一时刻最多存在 concurrency 个。
+
+    :param domains: 域名或 URL 列表。
+    :param sizes: 尺寸列表；每个域名会下载其中每个尺寸。
+    :param save_dir: 保存图标的目录。
+    :param concurrency: 最大在途请求数。
+    :param executor: 用于写文件的 Executor。
+    :param fold_www: 为 True 时去掉开头的 "www." 再去重。
+    :return: 结果字典列表，顺序与 (domain, size) 的输入顺序一致，domain 字段保留原始输入。
+    """
+    _require_aiohttp()
+    keys, items = dedupe_requests(domains, sizes, fold_www)
+    os.makedirs(save_dir, exist_ok=True)
+    concurrency = max(1, int(concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    done = {}
+    tasks = set()
+
+    async def run(key):
+        try:
+            done[key] = await _fetch_host(key[0], save_dir, key[1], session, executor)
+        except Exception as e:
+            # _fetch_host 未处理的异常只记入该键的结果，不影响其他键
+            done[key] = dict(make_result(key[0], key[1], key[0]), error=str(e) or type(e).__name__)
+        finally:
+            semaphore.release()
+
+    async with new_client_session(concurrency) as session:
+        for key in keys:
+            await semaphore.acquire()
+            task = asyncio.create_task(run(key))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    return [dict(done[key], domain=d) if key else make_result(d, s) for d, s, key in items]
@@ -0,0 +1,180 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import icon_store
+
+# 校验信息（ETag / Last-Modified / max-age）保存在输出目录下的隐藏子目录中，
+# 每个图标对应一个 "<domain>_<size>x<size>.json"，与扩展名无关。
+CACHE_DIRNAME = ".icon_cache"
+
+_MAX_AGE_RE = re.compile(r"(?:^|,)\s*(?:s-)?max-age\s*=\s*\"?(\d+)\"?", re.IGNORECASE)
+
+
+def parse_max_age(cache_control):
+    """
+    解析 Cache-Control 中的 max-age（秒）。
+
+    no-store / no-cache 视为 0（每次都需要重新验证）；没有 max-age 时返回 0。
+    """
+    if not cache_control:
+        return 0
+    lowered = cache_control.lower()
+    if "no-store" in lowered or "no-cache" in lowered:
+        return 0
+    m = _MAX_AGE_RE.search(cache_control)
+    return int(m.group(1)) if m else 0
+
+
+def meta_path(save_dir, stem):
+    """返回图标校验信息文件路径；stem 形如 "github.com_64x64"。"""
+    return os.path.join(save_dir, CACHE_DIRNAME, stem + ".json")
+
+
+def load_meta(save_dir, stem, exists=os.path.exists):
+    """
+    读取图标的缓存校验信息。
+
+    :param exists: 判断图标文件是否存在的函数（打包输出时检查包内索引）。
+    :return: 字典（含 file/etag/last_modified/max_age/fetched_at/content_type/bytes）；
+             校验信息缺失、损坏或对应图标文件已不存在时返回 None。
+    """
+    try:
+        with open(meta_path(save_dir, stem), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(meta, dict) or not meta.get("file"):
+        return None
+    if not exists(os.path.join(save_dir, meta["file"])):
+        return None
+    return meta
+
+
+def save_meta(save_dir, stem, meta):
+    """原子地写入校验信息（先写临时文件再 os.replace）。"""
+    path = meta_path(save_dir, stem)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    icon_store.atomic_write(path, json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+
+def meta_from_response(filename, headers, nbytes, now=None):
+    """根据响应头构建校验信息。"""
+    return {
+        "file": filename,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "max_age": parse_max_age(headers.get("Cache-Control")),
+        "fetched_at": time.time() if now is None else now,
+        "content_type": headers.get("Content-Type"),
+        "bytes": nbytes,
+    }
+
+
+def refresh_meta(meta, headers, now=None):
+    """收到 304 后更新校验信息：刷新时间戳，并采用服务端给出的新校验值。"""
+    meta = dict(meta)
+    if headers.get("ETag"):
+        meta["etag"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        meta["last_modified"] = headers["Last-Modified"]
+    if headers.get("Cache-Control"):
+        meta["max_age"] = parse_max_age(headers["Cache-Control"])
+    meta["fetched_at"] = time.time() if now is None else now
+    return meta
+
+
+def is_fresh(meta, now=None):
+    """图标是否仍在 max-age 有效期内（可直接使用，无需网络请求）。"""
+    now = time.time() if now is None else now
+    return now < float(meta.get("fetched_at", 0)) + int(meta.get("max_age") or 0)
+
+
+def conditional_headers(meta):
+    """构建条件请求头（If-None-Match / If-Modified-Since）。"""
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+# 内存缓存单个条目的默认上限：常见图标只有几 KB，远大于此的多半是异常响应，不值得占用内存
+MAX_ITEM_BYTES = 64 * 1024
+
+
+class MemoryCache:
+    """
+    进程内图标缓存（线程安全），按总字节数做 LRU 淘汰。
+
+    键为 (规范化域名, 尺寸)，值为 (图标字节, Content-Type)。
+    适合长期运行、反复请求热门域名的服务。
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=3600, max_item_bytes=MAX_ITEM_BYTES):
+        """
+        :param max_bytes: 缓存的总字节上限。
+        :param ttl: 条目存活秒数，过期后视为未命中；None 表示永不过期。
+        :param max_item_bytes: 单个条目的字节上限，更大的图标不缓存（下载时也不会为缓存在内存中保留一份）。
+        """
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (data, content_type, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """返回 (data, content_type)；未命中返回 None。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, data, content_type):
+        size = len(data)
+        if size > self.max_item_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (bytes(data), content_type, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """返回命中/未命中/淘汰计数以及当前条目数与字节数。"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _remove(self, key):
+        data, _, _ = self._entries.pop(key)
+        self._bytes -= len(data)
@@ -0,0 +1,344 @@
+import base64
+import os
+import threading
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+
+import icon_image
+
+# 图库中列出的文件扩展名
+GALLERY_EXTS = (".png", ".gif", ".ico", ".bmp", ".svg", ".jpg", ".jpeg")
+
+# 可由 icon_image 在后台线程解码的扩展名
+DECODABLE_EXTS = (".png", ".ico", ".bmp")
+
+# 缩略图边长与网格单元尺寸（像素）
+THUMB_SIZE = 64
+CELL_WIDTH = 112
+CELL_HEIGHT = 100
+
+# 已生成缩略图（PNG 字节）的缓存上限，以及同时存在的 PhotoImage 数上限
+THUMB_CACHE_BYTES = 16 * 1024 * 1024
+PHOTO_CACHE_SIZE = 600
+
+# 生成缩略图的后台线程数
+THUMB_WORKERS = 2
+
+
+def list_icons(directory):
+    """
+    列出目录中的图标文件（不递归，跳过隐藏文件与缓存目录）。
+
+    :return: 按文件名排序的 [(name, mtime_ns), ...]
+    """
+    items = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            name = entry.name
+            if name.startswith(".") or not name.lower().endswith(GALLERY_EXTS):
+                continue
+            try:
+                if entry.is_file():
+                    items.append((name, entry.stat().st_mtime_ns))
+            except OSError:
+                continue
+    items.sort()
+    return items
+
+
+def make_thumbnail(path, side=THUMB_SIZE):
+    """
+    生成 PNG 缩略图字节（面积平均缩小，只缩小不放大）；可在任意线程调用。
+
+    ICO 选用不小于缩略图尺寸的最小一张，避免解码多余的大图。
+
+    :return: PNG bytes；格式无法在 Python 中解码时返回 None。
+    """
+    if not path.lower().endswith(DECODABLE_EXTS):
+        return None
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        w, h, rgba = icon_image.decode_image(data, side)
+    except ValueError:
+        return None
+    scale = min(1.0, side / max(w, h))
+    nw, nh = max(1, round(w * scale)), max(1, round(h * scale))
+    if (nw, nh) != (w, h):
+        rgba = icon_image.resize_rgba(rgba, w, h, nw, nh)
+    return icon_image.encode_png(nw, nh, rgba, level=1)
+
+
+class ThumbnailLoader:
+    """
+    后台生成缩略图，结果按编码后的总字节数做 LRU 缓存（线程安全）。
+
+    提交的任务在开始前检查 is_wanted(key)：快速滚动时已经滚出视野的条目直接跳过。
+    """
+
+    def __init__(self, max_bytes=THUMB_CACHE_BYTES, workers=THUMB_WORKERS):
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()  # key -> PNG bytes 或 None（无法解码）
+        self._bytes = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb")
+
+    def get(self, key):
+        """:return: (是否已缓存, PNG bytes 或 None)"""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return True, self._cache[key]
+            return False, None
+
+    def request(self, key, path, is_wanted, done):
+        """在后台生成 key 对应的缩略图；完成后在工作线程中调用 done(key)。"""
+        with self._lock:
+            if key in self._pending or key in self._cache:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._run, key, path, is_wanted, done)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, key, path, is_wanted, done):
+        try:
+            if not is_wanted(key):
+                return
+            try:
+                png = make_thumbnail(path)
+            except OSError:
+                png = None
+            with self._lock:
+                self._cache[key] = png
+                self._bytes += len(png or b"")
+                while self._bytes > self.max_bytes and len(self._cache) > 1:
+                    _, old = self._cache.popitem(last=False)
+                    self._bytes -= len(old or b"")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+        done(key)
+
+
+class IconGallery(ttk.Frame):
+    """
+    虚拟化的图标缩略图网格，可浏览包含数万个图标的目录。
+
+    只为可见行创建画布条目与 PhotoImage：滚出视野的单元格回收给新进入视野的条目复用，
+    PhotoImage 数量与缩略图缓存都有上限，内存与 Tk 图像句柄占用不随目录大小增长。
+    缩略图在后台线程解码与缩放，主线程只负责由 PNG 字节创建 PhotoImage。
+    """
+
+    def __init__(self, master, directory=None, colors=None, on_open=None, **kwargs):
+        """
+        :param directory: 初始目录。
+        :param colors: 配色字典（App._colors）。
+        :param on_open: 双击缩略图时调用 on_open(path)。
+        """
+        super().__init__(master, style="Panel.TFrame", **kwargs)
+        self._colors = colors or {}
+        self._on_open = on_open
+        self.directory = None
+        self._items = []
+        self._cols = 1
+        self._cells = {}  # 条目序号 -> (image_item, text_item)
+        self._free = []
+        self._wanted = set()
+        self._wanted_lock = threading.Lock()
+        self._photos = OrderedDict()
+        self._refresh_job = None
+        self._listing = 0
+        self._loader = ThumbnailLoader()
+
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(self, textvariable=self.status_var).pack(side=tk.BOTTOM, anchor="w", pady=(4, 0))
+        self.canvas = tk.Canvas(self, highlightthickness=0, bd=0, bg=self._colors.get("panel", "#ffffff"),
+                                yscrollincrement=CELL_HEIGHT // 4)
+        self.vbar = ttk.Scrollbar(self, command=self.canvas.yview, style="Modern.Vertical.TScrollbar")
+        self.vbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.canvas.configure(yscrollcommand=self._on_yview)
+        self.canvas.bind("<Configure>", lambda e: self._relayout())
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-3, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.canvas.yview_scroll(3, "units"))
+        self.canvas.bind("<Double-Button-1>", self._on_double_click)
+        self.bind("<Destroy>", self._on_destroy, add="+")
+        if directory:
+            self.set_directory(directory)
+
+    # Public API
+    def set_directory(self, directory):
+        """在后台线程列出目录，完成后刷新网格。"""
+        self.directory = directory
+        self._listing += 1
+        token = self._listing
+        self.status_var.set("正在读取目录…")
+
+        def worker():
+            try:
+                items = list_icons(directory)
+                error = None
+            except OSError as e:
+                items, error = [], str(e)
+            try:
+                self.after(0, lambda: self._set_items(token, items, error))
+            except (RuntimeError, tk.TclError):
+                pass  # 窗口已关闭
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def refresh(self):
+        if self.directory:
+            self.set_directory(self.directory)
+
+    # Internal
+    def _set_items(self, token, items, error):
+        if token != self._listing:
+            return  # 期间又切换了目录
+        self._items = items
+        for index in list(self._cells):
+            self._release(index)
+        self.canvas.yview_moveto(0)
+        self.status_var.set(f"读取失败: {error}" if error else f"{len(items)} 个图标 · 双击在预览区查看")
+        self._relayout()
+
+    def _relayout(self):
+        width = max(self.canvas.winfo_width(), CELL_WIDTH)
+        cols = max(1, width // CELL_WIDTH)
+        if cols != self._cols:
+            self._cols = cols
+            for index in list(self._cells):
+                self._release(index)
+        rows = -(-len(self._items) // cols)
+        self.canvas.configure(scrollregion=(0, 0, width, max(rows * CELL_HEIGHT, 1)))
+        self._schedule_refresh()
+
+    def _on_yview(self, first, last):
+        self.vbar.set(first, last)
+        self._schedule_refresh()
+
+    def _on_wheel(self, event):
+        # Windows 每格 120；macOS 为较小的增量
+        step = -int(event.delta / 120) if abs(event.delta) >= 120 else -int(event.delta)
+        self.canvas.yview_scroll(step * 3, "units")
+
+    def _schedule_refresh(self):
+        if self._refresh_job is None:
+            self._refresh_job = self.after_idle(self._refresh_visible)
+
+    def _visible_range(self):
+        top = self.canvas.canvasy(0)
+        height = max(self.canvas.winfo_height(), 1)
+        first_row = max(0, int(top // CELL_HEIGHT))
+        last_row = int((top + height) // CELL_HEIGHT)
+        return range(first_row * self._cols, min(len(self._items), (last_row + 1) * self._cols))
+
+    def _refresh_visible(self):
+        self._refresh_job = None
+        visible = self._visible_range()
+        for index in [i for i in self._cells if i not in visible]:
+            self._release(index)
+        with self._wanted_lock:
+            self._wanted = {self._key(i) for i in visible}
+        for index in visible:
+            if index not in self._cells:
+                self._place(index)
+
+    def _key(self, index):
+        return self._items[index]
+
+    def _is_wanted(self, key):
+        with self._wanted_lock:
+            return key in self._wanted
+
+    def _release(self, index):
+        image_item, text_item = self._cells.pop(index)
+        self.canvas.itemconfigure(image_item, image="", state="hidden")
+        self.canvas.itemconfigure(text_item, text="", state="hidden")
+        self._free.append((image_item, text_item))
+
+    def _place(self, index):
+        if self._free:
+            cell = self._free.pop()
+        else:
+            cell = (self.canvas.create_image(0, 0, anchor="center"),
+                    self.canvas.create_text(0, 0, anchor="n", width=CELL_WIDTH - 8,
+                                            fill=self._colors.get("subtext", "#666666")))
+        image_item, text_item = cell
+        row, col = divmod(index, self._cols)
+        x = col * CELL_WIDTH + CELL_WIDTH // 2
+        y = row * CELL_HEIGHT
+        name = self._items[index][0]
+        label = name if len(name) <= 18 else name[:8] + "…" + name[-9:]
+        self.canvas.coords(image_item, x, y + 8 + THUMB_SIZE // 2)
+        self.canvas.coords(text_item, x, y + THUMB_SIZE + 14)
+        self.canvas.itemconfigure(text_item, text=label, state="normal")
+        self.canvas.itemconfigure(image_item, image=self._photo_for(index) or "", state="normal")
+        self._cells[index] = cell
+
+    def _photo_for(self, index):
+        key = self._key(index)
+        photo = self._photos.get(key)
+        if photo is not None:
+            self._photos.move_to_end(key)
+            return photo
+        cached, png = self._loader.get(key)
+        if not cached:
+            path = os.path.join(self.directory, key[0])
+            self._loader.request(key, path, self._is_wanted, self._on_thumbnail_ready)
+            return None
+        try:
+            if png is not None:
+                photo = tk.PhotoImage(data=base64.b64encode(png).decode("ascii"))
+            elif key[0].lower().endswith((".png", ".gif")):
+                # Python 无法解码的 PNG（隔行扫描）与 GIF 交给 Tk 读取
+                photo = tk.PhotoImage(file=os.path.join(self.directory, key[0]))
+                subs = max(1, -(-max(photo.width(), photo.height()) // THUMB_SIZE))
+                if subs > 1:
+                    photo = photo.subsample(subs, subs)
+            else:
+                return None
+        except tk.TclError:
+            return None
+        self._photos[key] = photo
+        if len(self._photos) > PHOTO_CACHE_SIZE:
+            self._photos.popitem(last=False)
+        return photo
+
+    def _on_thumbnail_ready(self, key):
+        # 工作线程回调：切回主线程更新对应单元格
+        try:
+            self.after(0, lambda: self._apply_thumbnail(key))
+        except (RuntimeError, tk.TclError):
+            pass
+
+    def _apply_thumbnail(self, key):
+        for index, (image_item, _) in self._cells.items():
+            if index < len(self._items) and self._items[index] == key:
+                self.canvas.itemconfigure(image_item, image=self._photo_for(index) or "")
+                return
+
+    def _on_double_click(self, event):
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        col = int(x // CELL_WIDTH)
+        if col >= self._cols:
+            return
+        index = int(y // CELL_HEIGHT) * self._cols + col
+        if 0 <= index < len(self._items) and self._on_open is not None:
+            self._on_open(os.path.join(self.directory, self._items[index][0]))
+
+    def _on_destroy(self, event):
+        if event.widget is self:
+            self._loader.shutdown()
+            self._photos.clear()
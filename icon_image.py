@@ -0,0 +1,697 @@
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：有 NumPy 时使用向量化实现
+    np = None
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# 颜色类型 -> 每像素通道数
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def is_png(data):
+    return data[:8] == PNG_SIGNATURE
+
+
+# ---------------------------------------------------------------- PNG 编码
+
+def _png_chunk(typ: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + typ + data + struct.pack('>I', zlib.crc32(typ + data) & 0xffffffff)
+
+
+def encode_png(width, height, rgba, level=9) -> bytes:
+    """
+    把 RGBA8 像素编码为 PNG（每行使用 None 过滤器）。
+
+    :param rgba: 长度为 width*height*4 的 bytes/bytearray/memoryview。
+    :param level: zlib 压缩级别。
+    """
+    stride = width * 4
+    rgba = memoryview(rgba).cast('B')
+    raw = bytearray((stride + 1) * height)
+    for y in range(height):
+        start = y * (stride + 1) + 1
+        raw[start:start + stride] = rgba[y * stride:(y + 1) * stride]
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    idat = zlib.compress(bytes(raw), level)
+    return PNG_SIGNATURE + _png_chunk(b'IHDR', ihdr) + _png_chunk(b'IDAT', idat) + _png_chunk(b'IEND', b'')
+
+
+# ---------------------------------------------------------------- PNG 解码
+
+def _unfilter(raw, height, stride, bpp):
+    """逐行撤销 PNG 过滤器，返回去掉过滤字节后的扫描线数据。"""
+    if np is not None:
+        ftypes = raw[0:(stride + 1) * height:stride + 1]
+        slow_rows = ftypes.count(3) + ftypes.count(4)
+        if slow_rows * stride > _WAVEFRONT_COST * (height + stride // bpp):
+            if max(ftypes) > 4:
+                raise ValueError(f"无效的 PNG 过滤类型: {max(ftypes)}")
+            return _unfilter_wavefront(raw, height, stride, bpp)
+    out = bytearray(height * stride)
+    prev = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        ftype = raw[pos]
+        line = bytearray(raw[pos + 1:pos + 1 + stride])
+        pos += stride + 1
+        if ftype == 1:  # Sub
+            if np is not None:
+                a = np.frombuffer(bytes(line), dtype=np.uint8).reshape(-1, bpp)
+                line = bytearray(np.cumsum(a, axis=0, dtype=np.uint8).tobytes())
+            else:
+                for i in range(bpp, stride):
+                    line[i] = (line[i] + line[i - bpp]) & 0xff
+        elif ftype == 2:  # Up
+            if np is not None:
+                line = bytearray((np.frombuffer(bytes(line), dtype=np.uint8)
+                                  + np.frombuffer(bytes(prev), dtype=np.uint8)).tobytes())
+            else:
+                for i in range(stride):
+                    line[i] = (line[i] + prev[i]) & 0xff
+        elif ftype == 3:  # Average
+            for k in range(bpp):
+                line[k::bpp] = _unfilter_average(line[k::bpp], prev[k::bpp])
+        elif ftype == 4:  # Paeth
+            for k in range(bpp):
+                line[k::bpp] = _unfilter_paeth(line[k::bpp], prev[k::bpp])
+        elif ftype != 0:
+            raise ValueError(f"无效的 PNG 过滤类型: {ftype}")
+        out[y * stride:(y + 1) * stride] = line
+        prev = line
+    return out
+
+
+# Average 与 Paeth 的每个字节都依赖同一行中刚还原出的左侧字节，无法整行向量化；
+# 按通道拆开后逐字节迭代（zip 顺序读取，左侧与左上字节放在局部变量中），不再在整行上反复下标访问。
+
+# 每条反对角线一次 NumPy 运算的开销约相当于逐字节还原多少个字节；
+# Average/Paeth 行的总字节数超过 (行数 + 每行像素数) 的这个倍数时改用 _unfilter_wavefront
+_WAVEFRONT_COST = 100
+
+
+def _unfilter_wavefront(raw, height, stride, bpp):
+    """
+    用 NumPy 按反对角线撤销过滤器：像素 (y, x) 只依赖左侧、上方与左上方的像素，
+    同一条反对角线 (x + y 相同) 上的像素互不依赖，可以一次算完；每行按自己的过滤类型选取预测值。
+
+    图像先错位存放（像素 (y, x) 放在第 x + y 列），每条反对角线就是一列中连续的若干行，只需切片。
+    """
+    width = stride // bpp
+    rows = np.frombuffer(bytes(raw[:(stride + 1) * height]), dtype=np.uint8).reshape(height, stride + 1)
+    ftypes = rows[:, 0]
+    masks = {t: (ftypes == t)[:, None] for t in range(1, 5) if (ftypes == t).any()}
+    filtered = np.zeros((height, height + width, bpp), dtype=np.int16)
+    for y in range(height):
+        filtered[y, y:y + width] = rows[y, 1:].reshape(width, bpp)
+    # 像素 (y, x) 存放在 out[y + 1, x + y + 2]；第 0 行与每行 x = -1 处为零，即第一行的"上方"与行首的"左侧"
+    out = np.zeros((height + 1, height + width + 2, bpp), dtype=np.int16)
+    for d in range(height + width - 1):
+        y0, y1 = max(0, d - width + 1), min(height, d + 1)
+        a = out[y0 + 1:y1 + 1, d + 1]
+        b = out[y0:y1, d + 1]
+        c = out[y0:y1, d]
+        pred = np.zeros_like(a)
+        if 1 in masks:
+            np.copyto(pred, a, where=masks[1][y0:y1])
+        if 2 in masks:
+            np.copyto(pred, b, where=masks[2][y0:y1])
+        if 3 in masks:
+            np.copyto(pred, (a + b) >> 1, where=masks[3][y0:y1])
+        if 4 in masks:
+            pa = np.abs(b - c)
+            pb = np.abs(a - c)
+            pc = np.abs(a + b - 2 * c)
+            np.copyto(pred, np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c)),
+                      where=masks[4][y0:y1])
+        out[y0 + 1:y1 + 1, d + 2] = (filtered[y0:y1, d] + pred) & 0xff
+    result = np.empty((height, width, bpp), dtype=np.uint8)
+    for y in range(height):
+        result[y] = out[y + 1, y + 2:y + 2 + width]
+    return bytearray(result.tobytes())
+
+
+def _unfilter_average(line, prev):
+    """还原一行中一个通道的 Average 过滤（line/prev 为该通道的字节序列），返回 bytearray。"""
+    out = bytearray(len(line))
+    left = 0
+    i = 0
+    for x, b in zip(line, prev):
+        left = (x + ((left + b) >> 1)) & 0xff
+        out[i] = left
+        i += 1
+    return out
+
+
+def _unfilter_paeth(line, prev):
+    """还原一行中一个通道的 Paeth 过滤，见 _unfilter_average。"""
+    out = bytearray(len(line))
+    a = c = 0
+    i = 0
+    for x, b in zip(line, prev):
+        # p = a + b - c 时 |p - a| = |b - c|，|p - b| = |a - c|，|p - c| = |a + b - 2c|
+        pa = b - c if b > c else c - b
+        pb = a - c if a > c else c - a
+        pc = a + b - c - c
+        if pc < 0:
+            pc = -pc
+        if pa <= pb and pa <= pc:
+            a = (x + a) & 0xff
+        elif pb <= pc:
+            a = (x + b) & 0xff
+        else:
+            a = (x + c) & 0xff
+        out[i] = a
+        c = b
+        i += 1
+    return out
+
+
+def _unpack_bits(data, height, stride, width, depth):
+    """把 1/2/4 位深的扫描线展开为每像素 1 字节（仍为原始取值）。"""
+    per_byte = 8 // depth
+    mask = (1 << depth) - 1
+    tables = [bytes(((b >> (8 - depth * (k + 1))) & mask) for b in range(256)) for k in range(per_byte)]
+    out = bytearray(width * height)
+    for y in range(height):
+        row = bytes(data[y * stride:(y + 1) * stride])
+        expanded = bytearray(stride * per_byte)
+        for k in range(per_byte):
+            expanded[k::per_byte] = row.translate(tables[k])
+        out[y * width:(y + 1) * width] = expanded[:width]
+    return out
+
+
+def decode_png(data):
+    """
+    解码 PNG 为 RGBA8 像素。
+
+    支持所有颜色类型与位深（16 位取高字节），不支持隔行扫描 (Adam7)。
+
+    :return: (width, height, rgba: bytearray)
+    :raises ValueError: 数据不是可解码的 PNG 时。
+    """
+    if not is_png(data):
+        raise ValueError("不是 PNG 数据")
+    pos = 8
+    idat = []
+    palette = None
+    trns = None
+    width = height = depth = ctype = interlace = None
+    while pos + 8 <= len(data):
+        length, typ = struct.unpack('>I4s', data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if typ == b'IHDR':
+            width, height, depth, ctype, _, _, interlace = struct.unpack('>IIBBBBB', body)
+        elif typ == b'PLTE':
+            palette = bytes(body)
+        elif typ == b'tRNS':
+            trns = bytes(body)
+        elif typ == b'IDAT':
+            idat.append(bytes(body))
+        elif typ == b'IEND':
+            break
+    if width is None or ctype not in _PNG_CHANNELS:
+        raise ValueError("PNG 头信息无效")
+    if interlace:
+        raise ValueError("不支持隔行扫描的 PNG")
+    try:
+        raw = zlib.decompress(b''.join(idat))
+    except zlib.error as e:
+        raise ValueError(f"PNG 数据损坏: {e}") from None
+
+    channels = _PNG_CHANNELS[ctype]
+    bits = channels * depth
+    stride = (width * bits + 7) // 8
+    if len(raw) < (stride + 1) * height:
+        raise ValueError("PNG 数据长度不足")
+    pixels = _unfilter(raw, height, stride, max(1, bits // 8))
+
+    # 灰度/真彩色的 tRNS 是 16 位取值：16 位深取高字节，其余取低字节
+    if trns and ctype in (0, 2):
+        trns = trns[0::2] if depth == 16 else trns[1::2]
+    if depth == 16:
+        pixels = pixels[0::2]
+    elif depth < 8:
+        pixels = _unpack_bits(pixels, height, stride, width, depth)
+        if ctype == 0:
+            scale = 255 // ((1 << depth) - 1)
+            if trns:
+                trns = bytes([(trns[0] & ((1 << depth) - 1)) * scale])
+            pixels = pixels.translate(bytes(min(255, v * scale) for v in range(256)))
+
+    n = width * height
+    out = bytearray(n * 4)
+    if ctype == 6:
+        out[:] = pixels
+    elif ctype == 2:
+        out[0::4] = pixels[0::3]
+        out[1::4] = pixels[1::3]
+        out[2::4] = pixels[2::3]
+        out[3::4] = b'\xff' * n
+        if trns and len(trns) >= 3:
+            key = bytes(trns[:3])
+            for i in range(n):
+                if out[i * 4:i * 4 + 3] == key:
+                    out[i * 4 + 3] = 0
+    elif ctype == 0:
+        out[0::4] = pixels
+        out[1::4] = pixels
+        out[2::4] = pixels
+        if trns:
+            alpha = bytes(0 if v == trns[0] else 255 for v in range(256))
+            out[3::4] = bytes(pixels).translate(alpha)
+        else:
+            out[3::4] = b'\xff' * n
+    elif ctype == 4:
+        gray = pixels[0::2]
+        out[0::4] = gray
+        out[1::4] = gray
+        out[2::4] = gray
+        out[3::4] = pixels[1::2]
+    else:  # 调色板
+        if palette is None:
+            raise ValueError("PNG 缺少调色板")
+        pal = palette.ljust(768, b'\x00')
+        alpha = (trns or b'').ljust(256, b'\xff')[:256]
+        idx = bytes(pixels)
+        out[0::4] = idx.translate(pal[0::3])
+        out[1::4] = idx.translate(pal[1::3])
+        out[2::4] = idx.translate(pal[2::3])
+        out[3::4] = idx.translate(alpha)
+    return width, height, out
+
+
+# ---------------------------------------------------------------- ICO / BMP 解码
+
+ICO_SIGNATURES = (b'\x00\x00\x01\x00', b'\x00\x00\x02\x00')  # 图标 / 光标
+
+# AND 掩码：1 表示透明
+_MASK_ALPHA = b'\xff\x00' + bytes(254)
+
+
+def is_ico(data):
+    return bytes(data[:4]) in ICO_SIGNATURES
+
+
+def is_bmp(data):
+    return bytes(data[:2]) == b'BM'
+
+
+def ico_entries(data):
+    """
+    列出 ICO 容器中的图像（损坏或越界的条目会被跳过）。
+
+    内嵌 PNG 的尺寸取自其 IHDR，而不是目录中的字节（256 及以上在目录里记为 0）。
+
+    :return: [{"width", "height", "bpp", "offset", "size", "png"}, ...]
+    :raises ValueError: 数据不是 ICO 时。
+    """
+    data = memoryview(data).cast('B')
+    if len(data) < 6 or not is_ico(data):
+        raise ValueError("不是 ICO 数据")
+    count = struct.unpack_from('<H', data, 4)[0]
+    if len(data) < 6 + 16 * count:
+        raise ValueError("ICO 目录不完整")
+    entries = []
+    for i in range(count):
+        w, h, _, _, _, bpp, size, offset = struct.unpack_from('<BBBBHHII', data, 6 + 16 * i)
+        if size < 16 or offset + size > len(data):
+            continue
+        png = bytes(data[offset:offset + 8]) == PNG_SIGNATURE
+        if png and size >= 24:
+            w, h = struct.unpack_from('>II', data, offset + 16)
+        entries.append({"width": w or 256, "height": h or 256, "bpp": bpp, "offset": offset, "size": size,
+                        "png": png})
+    return entries
+
+
+def pick_ico_entry(entries, size=None):
+    """
+    选择最合适的图像：不小于 size 的最小尺寸（都更小时取最大），同尺寸取色深最高者；
+    size 为 None 时取最大尺寸。
+
+    :raises ValueError: 没有可用的图像时。
+    """
+    if not entries:
+        raise ValueError("ICO 中没有可用的图像")
+
+    def side(e):
+        return max(e["width"], e["height"])
+
+    if size:
+        larger = [e for e in entries if side(e) >= size]
+        if larger:
+            return min(larger, key=lambda e: (side(e), -e["bpp"]))
+    return max(entries, key=lambda e: (side(e), e["bpp"]))
+
+
+def decode_ico(data, size=None):
+    """
+    解码 ICO 中最合适的一张图像（见 pick_ico_entry）为 RGBA8。
+
+    内嵌 PNG 交给 decode_png；BMP 条目支持 1/4/8/24/32 位，并应用 AND 掩码。
+
+    :return: (width, height, rgba: bytearray)
+    :raises ValueError: 无法解码时。
+    """
+    entry = pick_ico_entry(ico_entries(data), size)
+    body = memoryview(data).cast('B')[entry["offset"]:entry["offset"] + entry["size"]]
+    if entry["png"]:
+        return decode_png(bytes(body))
+    return _decode_dib(body, in_ico=True)
+
+
+def decode_bmp(data):
+    """
+    解码 BMP 文件为 RGBA8（1/4/8/24/32 位，不压缩或标准 BGRA 位域；不支持 RLE）。
+
+    :return: (width, height, rgba: bytearray)
+    :raises ValueError: 无法解码时。
+    """
+    data = memoryview(data).cast('B')
+    if len(data) < 26 or not is_bmp(data):
+        raise ValueError("不是 BMP 数据")
+    pixel_offset = struct.unpack_from('<I', data, 10)[0]
+    return _decode_dib(data[14:], pixel_offset - 14)
+
+
+def decode_image(data, size=None):
+    """
+    按文件内容（而非扩展名）识别并解码 PNG / ICO / BMP。
+
+    :param size: ICO 含多张图像时优先选择的尺寸，见 pick_ico_entry。
+    :return: (width, height, rgba: bytearray)
+    :raises ValueError: 格式不支持或数据损坏时。
+    """
+    if is_png(data):
+        return decode_png(data)
+    if is_ico(data):
+        return decode_ico(data, size)
+    if is_bmp(data):
+        return decode_bmp(data)
+    raise ValueError("不支持的图像格式")
+
+
+def sniff_content_type(data):
+    """
+    按文件内容判断图片类型，用于识别返回 200 但实际是 HTML 错误页等内容的响应。
+
+    :return: "image/png" 等 MIME 类型；不是可识别的图片时返回 None。
+    """
+    head = bytes(data[:16])
+    if is_png(head):
+        return 'image/png'
+    if is_ico(head):
+        return 'image/x-icon'
+    if head[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if head[:4] == b'GIF8':
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if is_bmp(head) and len(data) > 26:
+        return 'image/bmp'
+    text = bytes(data[:1024]).lstrip().lower()
+    if text.startswith((b'<svg', b'<?xml', b'<!--')) and b'<svg' in text and b'<html' not in text:
+        return 'image/svg+xml'
+    return None
+
+
+def image_side(data):
+    """
+    只读文件头得到图像的较长边（像素），不解码像素：PNG 取 IHDR，ICO 取其中最大的图像，GIF / BMP 取文件头；
+    SVG 可任意缩放，返回无穷大。其他格式（JPEG、WebP 等）或数据损坏时返回 None。
+    """
+    data = memoryview(data).cast('B')
+    try:
+        if is_png(data):
+            return max(struct.unpack_from('>II', data, 16))
+        if is_ico(data):
+            return max((max(e["width"], e["height"]) for e in ico_entries(data)), default=None)
+        if bytes(data[:4]) == b'GIF8':
+            return max(struct.unpack_from('<HH', data, 6))
+        if is_bmp(data):
+            if struct.unpack_from('<I', data, 14)[0] == 12:
+                return max(struct.unpack_from('<HH', data, 18))
+            return max(abs(v) for v in struct.unpack_from('<ii', data, 18))
+    except (ValueError, struct.error):
+        return None
+    return float('inf') if sniff_content_type(data) == 'image/svg+xml' else None
+
+
+def _rows_top_down(data, offset, stride, height, top_down):
+    """取出 height 行扫描线并转为自上而下的顺序（BMP 默认自下而上存储）。"""
+    block = data[offset:offset + stride * height]
+    if top_down:
+        return bytes(block)
+    if np is not None:
+        return np.frombuffer(block, dtype=np.uint8).reshape(height, stride)[::-1].tobytes()
+    return b''.join(block[y * stride:(y + 1) * stride] for y in range(height - 1, -1, -1))
+
+
+def _crop_rows(rows, stride, row_bytes, height):
+    """去掉每行末尾的 4 字节对齐填充。"""
+    if stride == row_bytes:
+        return rows
+    if np is not None:
+        return np.frombuffer(rows, dtype=np.uint8).reshape(height, stride)[:, :row_bytes].tobytes()
+    return b''.join(rows[y * stride:y * stride + row_bytes] for y in range(height))
+
+
+def _decode_dib(dib, pixel_offset=None, in_ico=False):
+    """
+    解码 DIB（BITMAPINFOHEADER 及其扩展版本）。
+
+    :param pixel_offset: 像素数据相对 dib 起始的偏移；None 表示紧跟在调色板之后（ICO 的情况）。
+    :param in_ico: ICO 条目的高度包含 AND 掩码（记录值为实际高度的 2 倍），且掩码紧跟在像素数据之后。
+    """
+    if len(dib) < 40:
+        raise ValueError("BMP 头信息无效")
+    header = struct.unpack_from('<I', dib, 0)[0]
+    if header < 40:
+        raise ValueError("不支持的 BMP 头 (OS/2)")
+    width, height, _, bpp, compression = struct.unpack_from('<iiHHI', dib, 4)
+    colors_used = struct.unpack_from('<I', dib, 32)[0]
+    top_down = height < 0
+    height = abs(height)
+    if in_ico:
+        height //= 2
+    if width <= 0 or height <= 0 or bpp not in (1, 4, 8, 24, 32):
+        raise ValueError(f"不支持的 BMP: {width}x{height}, {bpp} 位")
+    palette_offset = header
+    if compression in (3, 6):  # BI_BITFIELDS / BI_ALPHABITFIELDS
+        masks = struct.unpack_from('<III', dib, 40)
+        if bpp != 32 or masks != (0xff0000, 0xff00, 0xff):
+            raise ValueError("不支持的 BMP 位域")
+        if header == 40:
+            palette_offset += 12 if compression == 3 else 16
+    elif compression != 0:
+        raise ValueError("不支持压缩的 BMP")
+    ncolors = (colors_used or 1 << bpp) if bpp <= 8 else 0
+    if pixel_offset is None:
+        pixel_offset = palette_offset + 4 * ncolors
+    stride = ((width * bpp + 31) // 32) * 4
+    if len(dib) < pixel_offset + stride * height:
+        raise ValueError("BMP 数据长度不足")
+
+    rows = _rows_top_down(dib, pixel_offset, stride, height, top_down)
+    n = width * height
+    out = bytearray(n * 4)
+    has_alpha = False
+    if bpp == 32:
+        out[0::4] = rows[2::4]
+        out[1::4] = rows[1::4]
+        out[2::4] = rows[0::4]
+        alpha = rows[3::4]
+        # 独立的 BMP 只有声明了 alpha 掩码时第 4 字节才是透明度；ICO 中总是
+        alpha_mask = struct.unpack_from('<I', dib, 52)[0] if header >= 56 else 0
+        if in_ico or compression == 6 or alpha_mask == 0xff000000:
+            has_alpha = bool(alpha.strip(b'\x00'))
+        out[3::4] = alpha if has_alpha else b'\xff' * n
+    elif bpp == 24:
+        px = _crop_rows(rows, stride, width * 3, height)
+        out[0::4] = px[2::3]
+        out[1::4] = px[1::3]
+        out[2::4] = px[0::3]
+        out[3::4] = b'\xff' * n
+    else:
+        if bpp == 8:
+            idx = _crop_rows(rows, stride, width, height)
+        else:
+            idx = bytes(_unpack_bits(rows, height, stride, width, bpp))
+        palette = bytes(dib[palette_offset:palette_offset + 4 * ncolors]).ljust(1024, b'\x00')[:1024]
+        out[0::4] = idx.translate(palette[2::4])
+        out[1::4] = idx.translate(palette[1::4])
+        out[2::4] = idx.translate(palette[0::4])
+        out[3::4] = b'\xff' * n
+
+    mask_offset = pixel_offset + stride * height
+    mask_stride = ((width + 31) // 32) * 4
+    if in_ico and not has_alpha and len(dib) >= mask_offset + mask_stride * height:
+        mask = _rows_top_down(dib, mask_offset, mask_stride, height, top_down)
+        out[3::4] = bytes(_unpack_bits(mask, height, mask_stride, width, 1)).translate(_MASK_ALPHA)
+    return width, height, out
+
+
+# ---------------------------------------------------------------- 缩放
+
+def _area_spans(src, dst):
+    """面积平均的权重：每个目标像素 -> (起始源像素, [权重...])，权重和为 1。"""
+    scale = src / dst
+    spans = []
+    for i in range(dst):
+        lo = i * scale
+        hi = lo + scale
+        start = int(lo)
+        weights = []
+        j = start
+        while j < hi and j < src:
+            overlap = min(hi, j + 1) - max(lo, j)
+            if overlap > 1e-9:
+                weights.append(overlap / scale)
+            j += 1
+        spans.append((start, weights))
+    return spans
+
+
+def _area_matrix(src, dst):
+    m = np.zeros((dst, src), dtype=np.float32)
+    for i, (start, weights) in enumerate(_area_spans(src, dst)):
+        m[i, start:start + len(weights)] = weights
+    return m
+
+
+def resize_batch(images, width, height, new_width, new_height):
+    """
+    对一批尺寸相同的 RGBA8 图像做面积平均缩放（预乘 alpha，避免透明边缘发黑）。
+
+    有 NumPy 时整批一次矩阵运算完成；否则退化为纯 Python 的可分离卷积。
+
+    :param images: RGBA8 像素（bytes-like）列表，均为 width x height。
+    :return: 缩放后的 RGBA8 bytes 列表。
+    """
+    if not images:
+        return []
+    if np is not None:
+        batch = np.stack([np.frombuffer(bytes(im), dtype=np.uint8).reshape(height, width, 4) for im in images])
+        batch = batch.astype(np.float32)
+        alpha = batch[..., 3:4] / 255.0
+        batch[..., :3] *= alpha
+        wy = _area_matrix(height, new_height)
+        wx = _area_matrix(width, new_width)
+        out = np.einsum('yh,nhwc,xw->nyxc', wy, batch, wx, optimize=True)
+        a = out[..., 3:4]
+        rgb = np.where(a > 0, out[..., :3] * (255.0 / np.maximum(a, 1e-6)), 0.0)
+        out = np.concatenate([rgb, a], axis=-1)
+        out = np.clip(out + 0.5, 0, 255).astype(np.uint8)
+        return [out[i].tobytes() for i in range(len(images))]
+    return [_resize_python(im, width, height, new_width, new_height) for im in images]
+
+
+def _resize_python(rgba, width, height, new_width, new_height):
+    xs = _area_spans(width, new_width)
+    ys = _area_spans(height, new_height)
+    # 预乘 alpha
+    src = [0.0] * (width * height * 4)
+    for i in range(width * height):
+        a = rgba[i * 4 + 3]
+        f = a / 255.0
+        src[i * 4] = rgba[i * 4] * f
+        src[i * 4 + 1] = rgba[i * 4 + 1] * f
+        src[i * 4 + 2] = rgba[i * 4 + 2] * f
+        src[i * 4 + 3] = a
+    # 水平方向
+    tmp = [0.0] * (new_width * height * 4)
+    for y in range(height):
+        row = y * width * 4
+        trow = y * new_width * 4
+        for x, (start, weights) in enumerate(xs):
+            acc = [0.0, 0.0, 0.0, 0.0]
+            for k, w in enumerate(weights):
+                p = row + (start + k) * 4
+                acc[0] += src[p] * w
+                acc[1] += src[p + 1] * w
+                acc[2] += src[p + 2] * w
+                acc[3] += src[p + 3] * w
+            tmp[trow + x * 4:trow + x * 4 + 4] = acc
+    # 垂直方向
+    out = bytearray(new_width * new_height * 4)
+    for y, (start, weights) in enumerate(ys):
+        for x in range(new_width):
+            r = g = b = a = 0.0
+            for k, w in enumerate(weights):
+                p = ((start + k) * new_width + x) * 4
+                r += tmp[p] * w
+                g += tmp[p + 1] * w
+                b += tmp[p + 2] * w
+                a += tmp[p + 3] * w
+            o = (y * new_width + x) * 4
+            if a > 0:
+                f = 255.0 / a
+                out[o] = min(255, int(r * f + 0.5))
+                out[o + 1] = min(255, int(g * f + 0.5))
+                out[o + 2] = min(255, int(b * f + 0.5))
+                out[o + 3] = min(255, int(a + 0.5))
+    return bytes(out)
+
+
+def resize_rgba(rgba, width, height, new_width, new_height):
+    """缩放单张 RGBA8 图像，见 resize_batch。"""
+    return resize_batch([rgba], width, height, new_width, new_height)[0]
+
+
+def _letterbox(rgba, width, height, size):
+    """把 width x height 的图像居中放进 size x size 的透明画布。"""
+    if width == height == size:
+        return bytes(rgba)
+    out = bytearray(size * size * 4)
+    left = (size - width) // 2
+    top = (size - height) // 2
+    row = width * 4
+    for y in range(height):
+        o = ((top + y) * size + left) * 4
+        out[o:o + row] = rgba[y * row:(y + 1) * row]
+    return bytes(out)
+
+
+def _fit(width, height, size):
+    """按长边缩放到 size 后的尺寸（保持宽高比，短边至少 1 像素）。"""
+    if width >= height:
+        return size, max(1, round(height * size / width))
+    return max(1, round(width * size / height)), size
+
+
+def derive_sizes_batch(sources, sizes):
+    """
+    由一批源图像生成多个较小的正方形尺寸。
+
+    源图像按 (宽, 高) 分组，每组对每个目标尺寸只做一次批量缩放。
+    非正方形的源图像保持宽高比缩放到长边等于目标尺寸，再居中放进透明画布。
+    目标尺寸大于源图像长边的不生成（调用方应单独请求）。
+
+    :param sources: [(width, height, rgba), ...]
+    :param sizes: 目标边长列表。
+    :return: 与 sources 对应的 [{size: rgba, ...}, ...]。
+    """
+    results = [{} for _ in sources]
+    groups = {}
+    for i, (w, h, _) in enumerate(sources):
+        groups.setdefault((w, h), []).append(i)
+    for (w, h), indices in groups.items():
+        images = [sources[i][2] for i in indices]
+        for size in sizes:
+            if size > max(w, h):
+                continue
+            nw, nh = _fit(w, h, size)
+            if (nw, nh) == (w, h):
+                scaled = images
+            else:
+                scaled = resize_batch(images, w, h, nw, nh)
+            for i, im in zip(indices, scaled):
+                results[i][size] = _letterbox(im, nw, nh, size)
+    return results
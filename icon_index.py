@@ -0,0 +1,248 @@
+"""
+已下载图标的元数据索引（SQLite，WAL 模式）。
+
+查询示例:
+    python -m icon_index icons --missing 128        # 缺少 128px 图标的域名
+    python -m icon_index icons --changed-since 24h  # 最近 24 小时内内容有变化的图标
+    python -m icon_index icons --stats
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import icon_cache
+
+# 默认的索引文件名（位于输出目录下）
+INDEX_FILENAME = ".icon_index.sqlite"
+
+# 与 dd2.icon_filename 对应的文件名主干："<host>_<size>x<size>"
+_STEM_RE = re.compile(r"^(?P<host>.+)_(?P<size>\d+)x(?P=size)$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS icons (
+    host TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    content_type TEXT,
+    bytes INTEGER,
+    sha256 TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    max_age INTEGER,
+    fetched_at REAL,
+    updated_at REAL NOT NULL,
+    changed_at REAL NOT NULL,
+    derived_from TEXT,
+    PRIMARY KEY (host, size)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS icons_size ON icons (size);
+CREATE INDEX IF NOT EXISTS icons_changed ON icons (changed_at);
+"""
+
+_COLUMNS = ("host", "size", "file", "content_type", "bytes", "sha256", "etag", "last_modified", "max_age",
+            "fetched_at", "updated_at", "changed_at", "derived_from")
+
+
+class IconIndex:
+    """
+    每个 (host, size) 一行：文件名、内容类型、字节数、SHA-256、抓取时间与校验信息（ETag / Last-Modified / max-age）。
+
+    dd2 在写入图标后调用 record()；记录先缓存在内存中，每 flush_every 条或 flush_interval 秒在一个事务中提交，
+    所有查询前会先提交缓存。changed_at 只在内容哈希变化时更新，updated_at 每次写入或重新验证都会更新。
+    """
+
+    def __init__(self, path, flush_every=500, flush_interval=1.0):
+        """
+        :param path: SQLite 文件路径；不存在时创建。
+        :param flush_every: 累计多少条记录提交一次。
+        :param flush_interval: 距上次提交超过该秒数时，下一条记录到达即提交。
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    @classmethod
+    def for_dir(cls, save_dir, **kwargs):
+        """在输出目录下打开默认位置的索引。"""
+        return cls(os.path.join(save_dir, INDEX_FILENAME), **kwargs)
+
+    # ------------------------------------------------------------ 写入
+
+    def record(self, host, size, meta, sha256=None, derived_from=None):
+        """
+        记录一个已写入的图标。
+
+        :param meta: icon_cache 格式的校验信息（file / content_type / bytes / etag / last_modified / max_age /
+                     fetched_at）；只需 file，其余字段可缺省。
+        :param sha256: 内容哈希；None 时取 meta["sha256"]。
+        :param derived_from: 由其他尺寸缩放生成时的源图标路径。
+        """
+        now = time.time()
+        row = (host, int(size), meta["file"], meta.get("content_type"), meta.get("bytes"),
+               sha256 or meta.get("sha256"), meta.get("etag"), meta.get("last_modified"), meta.get("max_age"),
+               meta.get("fetched_at", now), now, meta.get("fetched_at", now), derived_from)
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def forget(self, host, size):
+        """删除一条记录（例如图标文件已被删除）。"""
+        with self._lock:
+            self._flush_locked()
+            self._db.execute("DELETE FROM icons WHERE host = ? AND size = ?", (host, int(size)))
+            self._db.commit()
+
+    def flush(self):
+        """立即提交缓存中的记录。"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        self._db.executemany(
+            f"INSERT INTO icons ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+            " ON CONFLICT (host, size) DO UPDATE SET file = excluded.file, content_type = excluded.content_type,"
+            " bytes = excluded.bytes, sha256 = excluded.sha256, etag = excluded.etag,"
+            " last_modified = excluded.last_modified, max_age = excluded.max_age, fetched_at = excluded.fetched_at,"
+            " updated_at = excluded.updated_at, derived_from = excluded.derived_from,"
+            " changed_at = CASE WHEN icons.sha256 IS excluded.sha256 THEN icons.changed_at"
+            " ELSE excluded.changed_at END",
+            rows)
+        self._db.commit()
+
+    def rebuild_from_dir(self, save_dir):
+        """
+        从输出目录中已有的缓存校验信息（.icon_cache/*.json）补建索引，用于索引启用前下载的图标。
+
+        :return: 补录的条数。
+        """
+        cache_dir = os.path.join(save_dir, icon_cache.CACHE_DIRNAME)
+        count = 0
+        try:
+            names = os.listdir(cache_dir)
+        except OSError:
+            return 0
+        for name in names:
+            m = _STEM_RE.match(name[:-5]) if name.endswith(".json") else None
+            meta = icon_cache.load_meta(save_dir, name[:-5]) if m else None
+            if meta is None:
+                continue
+            self.record(m.group("host"), int(m.group("size")), meta)
+            count += 1
+        self.flush()
+        return count
+
+    # ------------------------------------------------------------ 查询
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            self._flush_locked()
+            cursor = self._db.execute(sql, params)
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor]
+
+    def get(self, host, size):
+        """返回一条记录（字典），不存在时返回 None。"""
+        rows = self._query(f"SELECT {', '.join(_COLUMNS)} FROM icons WHERE host = ? AND size = ?", (host, int(size)))
+        return rows[0] if rows else None
+
+    def hosts(self):
+        """索引中出现过的全部主机名（有序）。"""
+        return [row["host"] for row in self._query("SELECT DISTINCT host FROM icons ORDER BY host")]
+
+    def missing(self, size, hosts=None):
+        """
+        缺少 size 尺寸图标的主机名。
+
+        :param hosts: 要检查的主机名；None 时检查索引中出现过的全部主机。
+        """
+        if hosts is None:
+            rows = self._query("SELECT DISTINCT host FROM icons EXCEPT SELECT host FROM icons WHERE size = ?"
+                               " ORDER BY host", (int(size),))
+            return [row["host"] for row in rows]
+        have = {row["host"] for row in self._query("SELECT host FROM icons WHERE size = ?", (int(size),))}
+        return [host for host in hosts if host not in have]
+
+    def changed_since(self, timestamp):
+        """内容在 timestamp（Unix 时间）之后发生变化（或首次下载）的记录，按时间先后排序。"""
+        return self._query(f"SELECT {', '.join(_COLUMNS)} FROM icons WHERE changed_at >= ? ORDER BY changed_at",
+                           (timestamp,))
+
+    def stats(self):
+        """按尺寸统计图标数与总字节数。"""
+        rows = self._query("SELECT size, COUNT(*) AS icons, COALESCE(SUM(bytes), 0) AS bytes FROM icons"
+                           " GROUP BY size ORDER BY size")
+        return {row["size"]: {"icons": row["icons"], "bytes": row["bytes"]} for row in rows}
+
+    def close(self):
+        """提交剩余记录并关闭数据库。"""
+        with self._lock:
+            self._flush_locked()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ---------------------------------------------------------------- 命令行
+
+def _parse_since(text):
+    """解析 "24h" / "30m" / "7d" / "3600"（秒前）或 Unix 时间戳，返回 Unix 时间。"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    try:
+        if text[-1:].lower() in units:
+            return time.time() - float(text[:-1]) * units[text[-1].lower()]
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的时间: {text!r}") from None
+    return value if value > 1e9 else time.time() - value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m icon_index", description="查询已下载图标的元数据索引")
+    parser.add_argument("dir", help="输出目录（索引位于 <dir>/" + INDEX_FILENAME + "）")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--missing", type=int, metavar="SIZE", help="列出缺少该尺寸图标的域名")
+    group.add_argument("--changed-since", type=_parse_since, metavar="WHEN",
+                       help="列出此后内容有变化的图标，例如 24h、30m、7d 或 Unix 时间戳")
+    group.add_argument("--stats", action="store_true", help="按尺寸统计")
+    group.add_argument("--rebuild", action="store_true", help="从 .icon_cache 中的校验信息补建索引")
+    args = parser.parse_args(argv)
+
+    with IconIndex.for_dir(args.dir) as index:
+        if args.missing is not None:
+            for host in index.missing(args.missing):
+                print(host)
+        elif args.changed_since is not None:
+            for row in index.changed_since(args.changed_since):
+                print(json.dumps(row, ensure_ascii=False))
+        elif args.stats:
+            print(json.dumps(index.stats(), ensure_ascii=False, indent=2))
+        else:
+            print(f"补录 {index.rebuild_from_dir(args.dir)} 条", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+import time
+
+# 默认的作业日志文件名（位于输出目录下）
+JOURNAL_FILENAME = ".dd2_journal.sqlite"
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    host TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    path TEXT,
+    sha256 TEXT,
+    bytes INTEGER,
+    content_type TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL,
+    PRIMARY KEY (host, size)
+) WITHOUT ROWID
+"""
+
+
+class Journal:
+    """
+    批量下载的作业日志（SQLite，WAL 模式）：每个 (host, size) 记录为 pending / done / failed，
+    以及结果路径、SHA-256 与错误信息。
+
+    同一个日志重新运行时，已完成的项直接从内存中的索引产出结果（每项 O(1)，不发请求），
+    失败与尚未完成的项重新下载。结果先缓存在内存中，每 flush_every 条或 flush_interval 秒提交一次事务，
+    写日志不会拖慢下载；进程被强制结束时最多丢失最后一批记录（这些项下次会重新下载）。
+
+    用法:
+        journal = icon_journal.Journal.for_dir("icons")
+        for result in dd2.iter_icons_bulk(domains, save_dir="icons", journal=journal):
+            ...
+        journal.close()
+    """
+
+    def __init__(self, path, flush_every=1000, flush_interval=1.0):
+        """
+        :param path: SQLite 文件路径；不存在时创建。
+        :param flush_every: 累计多少条结果提交一次。
+        :param flush_interval: 距上次提交超过该秒数时，下一条结果到达即提交。
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        # 已完成项的内存索引：(host, size) -> (path, sha256, bytes, content_type)
+        self._done = {(row[0], row[1]): row[2:] for row in self._db.execute(
+            "SELECT host, size, path, sha256, bytes, content_type FROM items WHERE status = ?", (DONE,))}
+
+    @classmethod
+    def for_dir(cls, save_dir, **kwargs):
+        """在输出目录下打开默认位置的日志。"""
+        return cls(os.path.join(save_dir, JOURNAL_FILENAME), **kwargs)
+
+    def add_pending(self, keys):
+        """把尚未出现过的 (host, size) 登记为 pending（已有记录的不变）。"""
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO items (host, size, status) VALUES (?, ?, ?)",
+                                 ((host, int(size), PENDING) for host, size in keys))
+            self._db.commit()
+
+    def done(self, key, exists=os.path.exists):
+        """
+        已完成项的记录。
+
+        :param exists: 判断图标是否存在的函数（打包输出时为 PackWriter.exists）。
+        :return: (path, sha256, bytes, content_type)；未完成或文件已不存在时返回 None。
+        """
+        entry = self._done.get(key)
+        if entry is None or not entry[0] or not exists(entry[0]):
+            return None
+        return entry
+
+    def record(self, key, result):
+        """
+        记录一条下载结果（dd2.make_result 格式）：有 path 为 done，否则为 failed。
+        取消、超时的项保持 pending。
+        """
+        if not result["path"] and result["error"] in ("已取消", "已超时"):
+            return
+        status = DONE if result["path"] else FAILED
+        row = (key[0], int(key[1]), status, result["path"], result.get("sha256"), result.get("bytes"),
+               result.get("content_type"), result.get("error"), time.time())
+        with self._lock:
+            if status == DONE:
+                self._done[key] = (result["path"], result.get("sha256"), result.get("bytes"),
+                                   result.get("content_type"))
+            else:
+                self._done.pop(key, None)
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self):
+        """立即提交缓存中的记录。"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        self._db.executemany(
+            "INSERT INTO items (host, size, status, path, sha256, bytes, content_type, error, attempts, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?)"
+            " ON CONFLICT (host, size) DO UPDATE SET status = excluded.status, path = excluded.path,"
+            " sha256 = excluded.sha256, bytes = excluded.bytes, content_type = excluded.content_type,"
+            " error = excluded.error, attempts = items.attempts + 1, updated_at = excluded.updated_at",
+            rows)
+        self._db.commit()
+
+    def failed(self):
+        """返回失败项列表 [(host, size, error, attempts)]。"""
+        self.flush()
+        with self._lock:
+            return self._db.execute("SELECT host, size, error, attempts FROM items WHERE status = ?",
+                                    (FAILED,)).fetchall()
+
+    def stats(self):
+        """按状态统计项数。"""
+        self.flush()
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in (PENDING, DONE, FAILED)}
+
+    def close(self):
+        """提交剩余记录并关闭数据库。"""
+        with self._lock:
+            self._flush_locked()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,357 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import icon_store
+
+logger = logging.getLogger("dd2.metrics")
+
+# 单次下载的各阶段：
+# wait（限速/熔断/重试退避）、connect（TCP）、tls（握手）、ttfb（发出请求到收到响应头）、
+# body（读取响应体）、write（写盘）
+PHASES = ("wait", "connect", "tls", "ttfb", "body", "write")
+
+# 直方图的默认桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+class Trace:
+    """
+    一次下载的阶段耗时累加器（秒）；重试时同一阶段的耗时会累加。
+
+    responses 为这次下载收到的每个上游响应的状态码（包括之后被重试的 429/5xx），按到达顺序排列。
+    """
+
+    __slots__ = ("phases", "started", "responses")
+
+    def __init__(self):
+        self.phases = {}
+        self.started = time.perf_counter()
+        self.responses = []  # list.append 是原子的，代发请求的其他线程也可以写入
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+def begin():
+    """为当前线程开始一次新的计时，返回 Trace。"""
+    trace = _local.trace = Trace()
+    return trace
+
+
+def end():
+    """结束当前线程的计时。"""
+    _local.trace = None
+
+
+def current():
+    """当前线程正在进行的 Trace；不在下载过程中时为 None。"""
+    return getattr(_local, "trace", None)
+
+
+def add(phase, seconds):
+    trace = current()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+
+def record_response(status):
+    """记录一个上游响应的状态码：计入 responses_to 指定的 Trace，否则计入当前线程的 Trace。"""
+    trace = getattr(_local, "responses", None) or current()
+    if trace is not None:
+        trace.responses.append(status)
+
+
+@contextmanager
+def responses_to(trace):
+    """
+    在其他线程中代发请求时（如对冲的图标来源请求），把 with 块内收到的响应计入调用方的 trace。
+
+    只记录响应状态码，不计阶段耗时（并行请求的耗时相互重叠）。
+    """
+    previous = getattr(_local, "responses", None)
+    _local.responses = trace
+    try:
+        yield
+    finally:
+        _local.responses = previous
+
+
+@contextmanager
+def phase(name):
+    """把 with 块的耗时计入当前线程 Trace 的 name 阶段。"""
+    trace = current()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add(name, time.perf_counter() - started)
+
+
+# ---------------------------------------------------------------- 事件监听
+
+def add_listener(callback):
+    """
+    注册事件回调：每次下载结束后以事件字典调用 callback(event)。
+
+    事件字段为 dd2.make_result 的全部字段，另加 phases（各阶段耗时，毫秒）
+    与 responses（{状态码: 次数}，每次尝试都计入，包括被重试的响应）。
+    回调在工作线程中同步执行，应尽量轻量；抛出的异常会被记录并忽略。
+    """
+    with _listeners_lock:
+        _listeners.append(callback)
+    return callback
+
+
+def remove_listener(callback):
+    with _listeners_lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+
+def has_listeners():
+    return bool(_listeners)
+
+
+def emit(result, trace=None):
+    """把一次下载的结果与阶段耗时分发给所有监听者。"""
+    if not _listeners:
+        return
+    phases = {name: round(seconds * 1000, 3) for name, seconds in trace.phases.items()} if trace else {}
+    responses = {}
+    for status in (trace.responses if trace else ()):
+        responses[status] = responses.get(status, 0) + 1
+    event = dict(result, phases=phases, responses=responses)
+    for callback in list(_listeners):
+        try:
+            callback(event)
+        except Exception:
+            logger.exception("指标回调出错: %r", callback)
+
+
+# ---------------------------------------------------------------- 连接阶段计时
+
+class _TimedHTTPConnection(HTTPConnection):
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            add("connect", time.perf_counter() - started)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            self._tcp_seconds = time.perf_counter() - started
+            add("connect", self._tcp_seconds)
+
+    def connect(self):
+        self._tcp_seconds = 0.0
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            add("tls", max(0.0, time.perf_counter() - started - self._tcp_seconds))
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    记录连接阶段耗时的 HTTPAdapter：新建连接时分别计入 connect / tls，
+    发送请求到收到响应头（stream=True 时 send 在此返回）扣除建连后计入 ttfb。
+    复用连接池中的连接时 connect / tls 为 0。每个响应的状态码经 record_response 记录（重试的每次尝试都会经过这里）。
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        trace = current()
+        if trace is None:
+            response = super().send(request, **kwargs)
+            record_response(response.status_code)
+            return response
+        before = trace.phases.get("connect", 0.0) + trace.phases.get("tls", 0.0)
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+            record_response(response.status_code)
+            return response
+        finally:
+            handshake = trace.phases.get("connect", 0.0) + trace.phases.get("tls", 0.0) - before
+            trace.add("ttfb", max(0.0, time.perf_counter() - started - handshake))
+
+
+# ---------------------------------------------------------------- 聚合与 Prometheus 导出
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsAggregator:
+    """
+    汇总下载事件，输出 Prometheus 文本格式的计数器与直方图。
+
+    用法:
+        metrics = icon_metrics.MetricsAggregator()
+        icon_metrics.add_listener(metrics)
+        metrics.start_file_export("dd2.prom", interval=5)   # 长时间运行时定期写文件
+        ...
+        metrics.stop()   # 停止定期导出并最后写一次
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, namespace="dd2"):
+        self.buckets = tuple(sorted(buckets))
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._fetches = {}      # (outcome, cache) -> 次数
+        self._statuses = {}     # 状态码 -> 次数
+        self._bytes = 0
+        self._retries = 0
+        self._duration = _Histogram(self.buckets)
+        self._phases = {name: _Histogram(self.buckets) for name in PHASES}
+        self._gauges = []       # (名称, 说明, 取值函数)
+        self._stop = None
+        self._thread = None
+        self._path = None
+
+    def __call__(self, event):
+        self.observe(event)
+
+    def observe(self, event):
+        """记录一个事件（icon_metrics.emit 产生的字典）。"""
+        outcome = "ok" if event.get("path") else "error"
+        key = (outcome, event.get("cache") or "none")
+        responses = event.get("responses")
+        if not responses and event.get("status") is not None:
+            responses = {event["status"]: 1}  # 会话没有使用 TimedHTTPAdapter 时只有最终状态码
+        with self._lock:
+            self._fetches[key] = self._fetches.get(key, 0) + 1
+            for status, n in (responses or {}).items():
+                self._statuses[status] = self._statuses.get(status, 0) + n
+            if event.get("cache") in (None, "miss"):
+                self._bytes += event.get("bytes") or 0
+            self._retries += event.get("retries") or 0
+            if event.get("elapsed_ms") is not None:
+                self._duration.observe(event["elapsed_ms"] / 1000.0)
+            for name, ms in (event.get("phases") or {}).items():
+                hist = self._phases.get(name)
+                if hist is not None:
+                    hist.observe(ms / 1000.0)
+
+    def add_gauge(self, name, help_text, fn):
+        """登记一个瞬时值指标（如并发上限），每次 render() 时调用 fn() 取值。"""
+        self._gauges.append((name, help_text, fn))
+
+    def render(self):
+        """返回 Prometheus 文本格式（exposition format 0.0.4）。"""
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            lines += [f"# HELP {ns}_fetches_total 已完成的图标下载数。", f"# TYPE {ns}_fetches_total counter"]
+            for (outcome, cache), n in sorted(self._fetches.items()):
+                lines.append(f'{ns}_fetches_total{{outcome="{outcome}",cache="{cache}"}} {n}')
+            lines += [f"# HELP {ns}_responses_total 按状态码统计的上游响应数（每次尝试都计入，包括被重试的响应）。",
+                      f"# TYPE {ns}_responses_total counter"]
+            for status, n in sorted(self._statuses.items()):
+                lines.append(f'{ns}_responses_total{{status="{status}"}} {n}')
+            lines += [f"# HELP {ns}_downloaded_bytes_total 从上游下载的图标字节数。",
+                      f"# TYPE {ns}_downloaded_bytes_total counter",
+                      f"{ns}_downloaded_bytes_total {self._bytes}",
+                      f"# HELP {ns}_retries_total 重试次数。",
+                      f"# TYPE {ns}_retries_total counter",
+                      f"{ns}_retries_total {self._retries}"]
+            lines += [f"# HELP {ns}_fetch_duration_seconds 单次下载总耗时。",
+                      f"# TYPE {ns}_fetch_duration_seconds histogram"]
+            lines += self._histogram_lines(f"{ns}_fetch_duration_seconds", self._duration, "")
+            lines += [f"# HELP {ns}_fetch_phase_seconds 单次下载各阶段耗时。",
+                      f"# TYPE {ns}_fetch_phase_seconds histogram"]
+            for name in PHASES:
+                lines += self._histogram_lines(f"{ns}_fetch_phase_seconds", self._phases[name], f'phase="{name}"')
+        for name, help_text, fn in self._gauges:
+            lines += [f"# HELP {ns}_{name} {help_text}", f"# TYPE {ns}_{name} gauge", f"{ns}_{name} {fn():g}"]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram_lines(metric, hist, labels):
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, n in zip(hist.buckets, hist.counts):
+            cumulative += n
+            lines.append(f'{metric}_bucket{{{labels}{sep}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{labels}{sep}le="+Inf"}} {hist.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{metric}_sum{suffix} {hist.sum:.6f}")
+        lines.append(f"{metric}_count{suffix} {hist.count}")
+        return lines
+
+    def write(self, path):
+        """原子写入 Prometheus 文本文件（可供 node_exporter textfile collector 读取）。"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        icon_store.atomic_write(path, self.render().encode('utf-8'))
+
+    def start_file_export(self, path, interval=5.0):
+        """在后台线程中每 interval 秒把指标写入 path。"""
+        self.stop()
+        self._path = path
+        self._stop = threading.Event()
+
+        def loop(stop):
+            while not stop.wait(interval):
+                try:
+                    self.write(path)
+                except OSError as e:
+                    logger.warning("写入指标文件失败: %s", e)
+
+        self._thread = threading.Thread(target=loop, args=(self._stop,), name="dd2-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止定期导出，并最后写一次完整数据。"""
+        if self._stop is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._stop = self._thread = None
+        self.write(self._path)
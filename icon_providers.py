@@ -0,0 +1,453 @@
+"""
+图标来源（provider）：Google favicon 服务、站点根目录的 /favicon.ico、首页 HTML 中的
+<link rel="icon"> 与 Web App Manifest。
+
+Providers 按各来源最近的成功率与延迟排序依次尝试。开启对冲（hedge）时，正在进行的请求超过其来源的
+p90 延迟仍未返回，就同时向下一个来源发出请求；采用最先返回的、不小于所需尺寸的图片，其余请求随即取消。
+
+用法:
+    providers = dd2.make_providers(("google", "favicon", "html"))
+    dd2.download_icons_bulk(domains, save_dir="icons", providers=providers)
+    print(providers.stats())
+"""
+import json
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import icon_image
+
+# 可用的来源名字，按默认顺序
+PROVIDER_NAMES = ("google", "favicon", "html")
+
+# 解析首页时最多读取的字节数（读到 </head> 即停止，<head> 通常在开头几 KB 内）
+HTML_MAX_BYTES = 256 * 1024
+
+# Web App Manifest 的大小上限
+MANIFEST_MAX_BYTES = 256 * 1024
+
+# 来源的延迟样本不足 MIN_SAMPLES 时使用的对冲等待时间（秒）
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_HEDGE_DELAY = 0.05
+MIN_SAMPLES = 10
+
+# 最近成功率低于该值的来源排在其他来源之后（即使它失败得很快）
+RELIABLE_RATE = 0.25
+
+# 等待结果时检查调用方取消事件的间隔（秒）
+_POLL_INTERVAL = 0.1
+
+_SIZES_RE = re.compile(r"(\d+)\s*[xX]\s*(\d+)")
+
+
+class NoIcon(Exception):
+    """来源没有返回可用的图片（HTTP 错误、内容不是图片等）。"""
+
+
+class Provider:
+    """
+    图标来源的基类。子类实现 fetch()，并给出 name 与 prior_latency（没有统计数据时假定的延迟，决定初始顺序）。
+
+    direct 表示直接请求网站本身：调用方据此为其使用按主机的限制，而不是为集中服务调整的共享限速、熔断与超时。
+    """
+
+    name = None
+    prior_latency = 0.5
+    direct = True
+
+    def fetch(self, host, size, get):
+        """
+        获取一个图标。
+
+        :param get: get(url, max_bytes=None, partial=False) -> (status, headers, data, final_url)
+                    （由 Providers 调用时另带关键字参数 cancel 与 direct）；
+                    状态码不是 200 时 data 为空；partial 为 True 时读取 HTML 的开头，到 </head> 或 max_bytes
+                    字节为止，不因超长报错。
+                    网络错误、取消时抛出异常。
+        :return: 字典 {"data", "content_type", "url", "status", "headers"}
+        :raises NoIcon: 没有可用的图片时。
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _image(get, url, max_bytes=None):
+        """请求 url，响应必须是 200 且内容可识别为图片（按内容判断，不信任 Content-Type）。"""
+        status, headers, data, final_url = get(url, max_bytes)
+        if status != 200:
+            raise NoIcon(f"HTTP {status}")
+        content_type = icon_image.sniff_content_type(data)
+        if content_type is None:
+            raise NoIcon(f"不是图片: {headers.get('Content-Type') or '未知类型'}")
+        return {"data": data, "content_type": content_type, "url": final_url, "status": status, "headers": headers}
+
+
+class GoogleProvider(Provider):
+    """Google favicon 服务（原有行为）；找不到图标时服务返回 404 与通用地球图标，视为失败。"""
+
+    name = "google"
+    prior_latency = 0.15
+    direct = False
+
+    def __init__(self, build_url):
+        """:param build_url: build_url(host, size) -> 请求 URL，如 dd2.build_icon_url。"""
+        self.build_url = build_url
+
+    def fetch(self, host, size, get):
+        return self._image(get, self.build_url(host, size))
+
+
+class FaviconIcoProvider(Provider):
+    """直接请求 https://<host>/favicon.ico；不支持指定尺寸，ICO 中含多种尺寸时由使用方挑选。"""
+
+    name = "favicon"
+    prior_latency = 0.3
+
+    def fetch(self, host, size, get):
+        return self._image(get, f"https://{host}/favicon.ico")
+
+
+class HtmlProvider(Provider):
+    """
+    解析首页 <head> 中的 <link rel="icon" / "shortcut icon" / "apple-touch-icon">，
+    声明的尺寸都小于所需尺寸时再读取 <link rel="manifest"> 中的 icons，按尺寸匹配程度依次尝试。
+    """
+
+    name = "html"
+    prior_latency = 0.8
+
+    def __init__(self, max_candidates=3):
+        """:param max_candidates: 最多尝试的候选图标数。"""
+        self.max_candidates = max_candidates
+
+    def fetch(self, host, size, get):
+        status, _, html, page_url = get(f"https://{host}/", HTML_MAX_BYTES, partial=True)
+        if status != 200:
+            raise NoIcon(f"首页 HTTP {status}")
+        parser = _IconLinkParser(page_url)
+        try:
+            parser.feed(html.decode('utf-8', 'replace'))
+        except Exception:
+            pass  # 只读取了开头一段，末尾残缺的标签无需处理
+        candidates = parser.icons
+        if parser.manifest and not any(c[1] >= size for c in candidates):
+            candidates = candidates + _manifest_icons(get, parser.manifest)
+        if not candidates:
+            raise NoIcon("页面中没有图标链接")
+        errors = []
+        for url, _ in sorted(candidates, key=lambda c: _fit(c[1], size))[:self.max_candidates]:
+            try:
+                return self._image(get, url)
+            except NoIcon as e:
+                errors.append(str(e))
+        raise NoIcon("; ".join(errors))
+
+
+class _IconLinkParser(HTMLParser):
+    """收集 <link> 中的图标 [(url, 尺寸)] 与 manifest 地址；尺寸未知时按常见取值估计，矢量图为无穷大。"""
+
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.icons = []
+        self.manifest = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href"):
+            self.base_url = urljoin(self.base_url, attrs["href"])
+            return
+        href = attrs.get("href")
+        if tag != "link" or not href:
+            return
+        rel = (attrs.get("rel") or "").lower().split()
+        url = urljoin(self.base_url, href.strip())
+        if "manifest" in rel:
+            self.manifest = self.manifest or url
+        elif "icon" in rel or "apple-touch-icon" in rel or "apple-touch-icon-precomposed" in rel:
+            default = 180 if "icon" not in rel else 32
+            self.icons.append((url, _declared_size(attrs.get("sizes"), attrs.get("type"), href, default)))
+
+
+def _declared_size(sizes, content_type, href, default):
+    """<link sizes="32x32 64x64"> 或 manifest 的 sizes 中最大的边长；SVG 或 "any" 视为无穷大。"""
+    if (sizes or "").strip().lower() == "any" or "svg" in (content_type or "") or href.lower().endswith(".svg"):
+        return float("inf")
+    found = [int(w) for w, _ in _SIZES_RE.findall(sizes or "")]
+    return max(found) if found else default
+
+
+def _fit(available, wanted):
+    """候选排序键：不小于所需尺寸的取最接近的，其次取最大的。"""
+    if available >= wanted:
+        return (0, available - wanted)
+    return (1, wanted - available)
+
+
+def _manifest_icons(get, url):
+    try:
+        status, _, data, final_url = get(url, MANIFEST_MAX_BYTES)
+        icons = json.loads(data.decode('utf-8')).get("icons") if status == 200 else None
+    except Exception:  # manifest 取不到或格式不对时只用页面中的链接
+        return []
+    result = []
+    for icon in icons if isinstance(icons, list) else ():
+        if isinstance(icon, dict) and icon.get("src") and "monochrome" not in str(icon.get("purpose", "")):
+            result.append((urljoin(final_url, icon["src"]),
+                           _declared_size(icon.get("sizes"), icon.get("type"), icon["src"], 0)))
+    return result
+
+
+class ProviderStats:
+    """
+    单个来源最近 window 次请求的成功率与延迟。
+
+    被对冲取消的请求只知道延迟不小于已用时间，作为删失样本计入延迟分布（Kaplan-Meier 估计），不计入成功率；
+    否则总被取消的慢来源永远没有样本，只能一直按 prior_latency 排序。
+    """
+
+    def __init__(self, window=200):
+        self.attempts = 0
+        self.successes = 0
+        self.cancelled = 0
+        self._outcomes = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)  # (延迟, 是否删失)
+
+    def record(self, ok, latency):
+        self.attempts += 1
+        self.successes += ok
+        self._outcomes.append(ok)
+        self._latencies.append((latency, False))
+
+    def record_cancelled(self, elapsed):
+        """记录一次被取消的请求：其延迟至少为 elapsed。"""
+        self.attempts += 1
+        self.cancelled += 1
+        self._latencies.append((elapsed, True))
+
+    def success_rate(self):
+        """最近的成功率（加一平滑，样本很少时接近 0.5）。"""
+        return (sum(self._outcomes) + 1) / (len(self._outcomes) + 2)
+
+    def percentile(self, pct):
+        """
+        延迟的 pct 分位数；没有删失样本时即普通的样本分位数。
+        删失样本过多、估计达不到该分位数时返回最大的样本（此时只是下界）。
+        """
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        n = len(ordered)
+        survival = 1.0
+        for i, (latency, censored) in enumerate(ordered):
+            if not censored:
+                survival *= 1 - 1 / (n - i)
+                if 1 - survival > pct / 100 + 1e-9:
+                    return latency
+        return ordered[-1][0]
+
+    def samples(self):
+        return len(self._latencies)
+
+
+class Providers:
+    """
+    一组图标来源及其统计数据，可在多次下载、多个线程之间共享（线程安全）。
+
+    每次按"预期耗时"（延迟中位数 / 成功率，没有样本时用来源的 prior_latency）从小到大排序，
+    成功率低于 RELIABLE_RATE 的来源排在最后，因此又快又可靠的来源排在前面；
+    某个来源开始频繁失败或变慢后会自动让位。
+    """
+
+    def __init__(self, providers, hedge=True, max_threads=64):
+        """
+        :param providers: Provider 实例列表。
+        :param hedge: 是否开启对冲；关闭时只在前一个来源失败后才尝试下一个。
+        :param max_threads: 执行来源请求的后台线程数上限（开启对冲时使用）。
+        """
+        self.providers = list(providers)
+        if not self.providers:
+            raise ValueError("至少需要一个图标来源")
+        self.hedge = hedge
+        self.hedged = 0  # 发出的对冲请求数
+        self._stats = {p.name: ProviderStats() for p in self.providers}
+        self._lock = threading.Lock()
+        self._max_threads = max_threads
+        self._executor = None
+
+    def ranked(self):
+        """按预期耗时排序的来源列表。"""
+        with self._lock:
+            def expected(provider):
+                stats = self._stats[provider.name]
+                latency = stats.percentile(50) if stats.samples() else provider.prior_latency
+                rate = stats.success_rate()
+                return rate < RELIABLE_RATE, latency / rate
+            return sorted(self.providers, key=expected)
+
+    def hedge_delay(self, provider):
+        """对冲等待时间：该来源的 p90 延迟；样本不足时为 DEFAULT_HEDGE_DELAY。"""
+        with self._lock:
+            stats = self._stats[provider.name]
+            if stats.samples() < MIN_SAMPLES:
+                return DEFAULT_HEDGE_DELAY
+            return max(MIN_HEDGE_DELAY, stats.percentile(90))
+
+    def stats(self):
+        """各来源的请求数、成功率与延迟（毫秒），按当前排序。"""
+        ranked = self.ranked()
+        with self._lock:
+            report = {}
+            for provider in ranked:
+                stats = self._stats[provider.name]
+                p50, p90 = stats.percentile(50), stats.percentile(90)
+                report[provider.name] = {
+                    "attempts": stats.attempts,
+                    "successes": stats.successes,
+                    "cancelled": stats.cancelled,
+                    "success_rate": round(stats.success_rate(), 3),
+                    "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                    "p90_ms": round(p90 * 1000, 1) if p90 is not None else None,
+                }
+            return report
+
+    def fetch(self, host, size, get, cancel=None):
+        """
+        依次（或对冲地）向各来源请求图标。
+
+        :param get: 见 Provider.fetch，另接受关键字参数 cancel（threading.Event，被设置后应尽快中止）
+                    与 direct（来源的 Provider.direct）；开启对冲时会在后台线程中调用。
+        :param cancel: 调用方的取消事件；被设置后中止所有请求并返回 (None, ["已取消"])。
+        :return: (结果字典（另含 "provider" 字段）或 None, 各来源的失败原因列表)
+
+        文件头表明小于 size 的图片（例如直接请求到的 16/32 像素 /favicon.ico）不会结束竞争：
+        先留作备选，继续等待其他来源；都没有足够大的图片时才返回其中最大的一个。
+        """
+        queue = self.ranked()
+        errors = []
+        fallback = _Fallback(size)
+        if not self.hedge:
+            for provider in queue:
+                if cancel is not None and cancel.is_set():
+                    return None, ["已取消"]
+                result, error = self._attempt(provider, host, size, get, cancel)
+                if fallback.accept(result):
+                    return result, errors
+                if result is None:
+                    errors.append(error)
+            return fallback.result, errors
+
+        executor = self._get_executor()
+        running = {}  # future -> (provider, 开始时刻, 该请求的取消事件)
+
+        def launch():
+            provider = queue.pop(0)
+            event = threading.Event()
+            running[executor.submit(self._attempt, provider, host, size, get, event)] = (
+                provider, time.monotonic(), event)
+
+        launch()
+        try:
+            while running:
+                # 最近发出的请求超过其来源的 p90 延迟时发出下一个来源的请求
+                hedge_at = None
+                if queue:
+                    provider, started, _ = max(running.values(), key=lambda r: r[1])
+                    hedge_at = started + self.hedge_delay(provider)
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+                if cancel is not None:
+                    timeout = _POLL_INTERVAL if timeout is None else min(timeout, _POLL_INTERVAL)
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                if cancel is not None and cancel.is_set():
+                    return None, ["已取消"]
+                for future in done:
+                    provider, _, _ = running.pop(future)
+                    result, error = future.result()
+                    if fallback.accept(result):
+                        return result, errors
+                    if result is None:
+                        errors.append(error)
+                if queue and (not running or (hedge_at is not None and time.monotonic() >= hedge_at)):
+                    if running:
+                        with self._lock:
+                            self.hedged += 1
+                    launch()
+            return fallback.result, errors
+        finally:
+            for _, _, event in running.values():
+                event.set()
+
+    def _attempt(self, provider, host, size, get, cancel):
+        """执行一次来源请求并记录统计；返回 (结果或 None, 失败原因)。"""
+        started = time.monotonic()
+        try:
+            result = provider.fetch(host, size, lambda url, *args, **kwargs: get(url, *args, cancel=cancel,
+                                                                                  direct=provider.direct, **kwargs))
+        except Exception as e:
+            result, error = None, f"{provider.name}: {e}"
+        else:
+            result["provider"] = provider.name
+            error = None
+        elapsed = time.monotonic() - started
+        with self._lock:
+            if result is None and cancel is not None and cancel.is_set():
+                self._stats[provider.name].record_cancelled(elapsed)
+            else:
+                self._stats[provider.name].record(result is not None, elapsed)
+        return result, error
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_threads, thread_name_prefix="dd2-provider")
+            return self._executor
+
+    def close(self):
+        """关闭后台线程池（进行中的请求执行完毕）。"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+class _Fallback:
+    """Providers.fetch 中收集小于所需尺寸的结果，保留其中最大的一个。"""
+
+    def __init__(self, size):
+        self.size = size
+        self.result = None
+        self._side = -1
+
+    def accept(self, result):
+        """result 可以直接采用（尺寸足够或无法判断）时返回 True；偏小时留作备选并返回 False。"""
+        if result is None:
+            return False
+        side = icon_image.image_side(result["data"])
+        if side is None or side >= self.size:
+            return True
+        if side > self._side:
+            self.result, self._side = result, side
+        return False
+
+
+def from_names(names, google_url, hedge=True, **kwargs):
+    """
+    按名字创建 Providers。
+
+    :param names: PROVIDER_NAMES 中的名字序列，或逗号分隔的字符串。
+    :param google_url: google 来源使用的 build_url(host, size)。
+    :param kwargs: 透传给 Providers。
+    :raises ValueError: 名字未知或为空时。
+    """
+    if isinstance(names, str):
+        names = [n.strip() for n in names.split(",") if n.strip()]
+    factories = {"google": lambda: GoogleProvider(google_url), "favicon": FaviconIcoProvider, "html": HtmlProvider}
+    providers = []
+    for name in dict.fromkeys(names):
+        if name not in factories:
+            raise ValueError(f"未知的图标来源: {name!r}（可用: {', '.join(PROVIDER_NAMES)}）")
+        providers.append(factories[name]())
+    return Providers(providers, hedge=hedge, **kwargs)
@@ -0,0 +1,224 @@
+from math import isqrt
+
+import icon_image
+
+
+def parse_color(value, alpha=255):
+    """把 "#rrggbb" 或 (r, g, b[, a]) 转为 4 字节的 RGBA。"""
+    if isinstance(value, bytes) and len(value) == 4:
+        return value
+    if isinstance(value, str):
+        h = value.lstrip('#')
+        return bytes((int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16), alpha))
+    value = tuple(value)
+    return bytes(value if len(value) == 4 else value + (alpha,))
+
+
+class Raster:
+    """
+    RGBA8 画布，像素存放在一个 bytearray 中，按行主序排列。
+
+    所有形状都先求出每行覆盖的 [x0, x1] 区间（整数运算，与逐像素判断 dx*dx + dy*dy <= r*r 的结果一致），
+    再用切片赋值整段填充，不对每个像素调用 Python 函数。超出画布的部分自动裁剪。
+    """
+
+    def __init__(self, width, height, background=(0, 0, 0, 0)):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(parse_color(background) * (width * height))
+
+    # ------------------------------------------------------------ 基本操作
+
+    def fill_span(self, y, x0, x1, color):
+        """填充第 y 行的 [x0, x1]（含两端）。"""
+        if y < 0 or y >= self.height:
+            return
+        x0 = max(x0, 0)
+        x1 = min(x1, self.width - 1)
+        if x0 > x1:
+            return
+        start = (y * self.width + x0) * 4
+        self.pixels[start:start + (x1 - x0 + 1) * 4] = parse_color(color) * (x1 - x0 + 1)
+
+    def fill_spans(self, spans, color):
+        """spans: {y: [(x0, x1), ...]}"""
+        color = parse_color(color)
+        for y, row in spans.items():
+            for x0, x1 in row:
+                self.fill_span(y, x0, x1, color)
+
+    def set_pixel(self, x, y, color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = (y * self.width + x) * 4
+            self.pixels[i:i + 4] = parse_color(color)
+
+    def to_png(self, level=9):
+        return icon_image.encode_png(self.width, self.height, self.pixels, level)
+
+    # ------------------------------------------------------------ 形状
+
+    def fill_rect(self, x0, y0, x1, y1, color):
+        """填充矩形 [x0, x1] x [y0, y1]（含边界）。"""
+        self.fill_spans(rect_spans(x0, y0, x1, y1), color)
+
+    def fill_circle(self, cx, cy, r, color):
+        self.fill_spans(circle_spans(cx, cy, r), color)
+
+    def fill_ring(self, cx, cy, r, thickness, color):
+        """圆环：(r - thickness)^2 <= d^2 <= r^2 的像素。"""
+        self.fill_spans(ring_spans(cx, cy, r, thickness), color)
+
+    def fill_round_rect(self, x0, y0, x1, y1, r, color):
+        self.fill_spans(round_rect_spans(x0, y0, x1, y1, r), color)
+
+    def fill_triangle(self, p0, p1, p2, color):
+        self.fill_spans(triangle_spans(p0, p1, p2), color)
+
+    def outline(self, spans, color):
+        """
+        描 1 像素内边框：区域内上下左右任一邻居落在区域外的像素（画布外的邻居不算）。
+
+        :param spans: 每行只有一个区间的凸形状，如 round_rect_spans 的结果。
+        """
+        self.fill_spans(outline_spans(spans, self.width, self.height), color)
+
+    def draw_line(self, x0, y0, x1, y1, color, thickness=1):
+        """Bresenham 直线；thickness > 1 时沿短轴方向平移叠加。"""
+        color = parse_color(color)
+        for off in range(-(thickness // 2), thickness // 2 + 1) if thickness > 1 else (0,):
+            if abs(x1 - x0) >= abs(y1 - y0):
+                self._line(x0, y0 + off, x1, y1 + off, color)
+            else:
+                self._line(x0 + off, y0, x1 + off, y1, color)
+
+    def _line(self, x0, y0, x1, y1, color):
+        dx, dy = abs(x1 - x0), abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        x, y = x0, y0
+        if dx > dy:
+            err = dx // 2
+            while x != x1:
+                self.set_pixel(x, y, color)
+                err -= dy
+                if err < 0:
+                    y += sy
+                    err += dx
+                x += sx
+        else:
+            err = dy // 2
+            while y != y1:
+                self.set_pixel(x, y, color)
+                err -= dx
+                if err < 0:
+                    x += sx
+                    err += dy
+                y += sy
+        self.set_pixel(x1, y1, color)
+
+
+# ---------------------------------------------------------------- 形状的行区间
+
+def rect_spans(x0, y0, x1, y1):
+    return {y: [(x0, x1)] for y in range(y0, y1 + 1)}
+
+
+def circle_spans(cx, cy, r):
+    spans = {}
+    for dy in range(-r, r + 1):
+        dx = isqrt(r * r - dy * dy)
+        spans[cy + dy] = [(cx - dx, cx + dx)]
+    return spans
+
+
+def ring_spans(cx, cy, r, thickness):
+    inner2 = max(r - thickness, 0) ** 2
+    spans = {}
+    for dy in range(-r, r + 1):
+        outer = isqrt(r * r - dy * dy)
+        rest = inner2 - dy * dy
+        if rest <= 0:
+            spans[cy + dy] = [(cx - outer, cx + outer)]
+            continue
+        inner = isqrt(rest - 1) + 1  # 满足 dx*dx >= rest 的最小 dx
+        if inner <= outer:
+            spans[cy + dy] = [(cx - outer, cx - inner), (cx + inner, cx + outer)]
+    return spans
+
+
+def round_rect_spans(x0, y0, x1, y1, r):
+    """圆角矩形：中间两个矩形加四个半径为 r 的角圆（每行一个区间）。"""
+    r = max(0, min(r, (x1 - x0) // 2, (y1 - y0) // 2))
+    spans = {}
+    for y in range(y0, y1 + 1):
+        if y0 + r <= y <= y1 - r:
+            spans[y] = [(x0, x1)]
+            continue
+        dy = (y0 + r - y) if y < y0 + r else (y - (y1 - r))
+        dx = isqrt(r * r - dy * dy)
+        spans[y] = [(x0 + r - dx, x1 - r + dx)]
+    return spans
+
+
+def triangle_spans(p0, p1, p2):
+    """三角形在每个整数行上覆盖的像素（像素中心在边上也算在内）。"""
+    pts = (p0, p1, p2)
+    spans = {}
+    for y in range(min(p[1] for p in pts), max(p[1] for p in pts) + 1):
+        xs = []
+        for (ax, ay), (bx, by) in ((p0, p1), (p1, p2), (p2, p0)):
+            if ay == by:
+                if ay == y:
+                    xs += [ax, bx]
+            elif min(ay, by) <= y <= max(ay, by):
+                xs.append(ax + (bx - ax) * (y - ay) / (by - ay))
+        if xs:
+            lo, hi = -int(-min(xs) // 1), int(max(xs) // 1)  # ceil / floor
+            if lo <= hi:
+                spans[y] = [(lo, hi)]
+    return spans
+
+
+def union_spans(*shapes):
+    """合并多个形状的行区间（相交或相邻的区间合为一段）。"""
+    rows = {}
+    for spans in shapes:
+        for y, row in spans.items():
+            rows.setdefault(y, []).extend(row)
+    merged = {}
+    for y, row in rows.items():
+        row.sort()
+        out = [list(row[0])]
+        for x0, x1 in row[1:]:
+            if x0 <= out[-1][1] + 1:
+                out[-1][1] = max(out[-1][1], x1)
+            else:
+                out.append([x0, x1])
+        merged[y] = [tuple(s) for s in out]
+    return merged
+
+
+def outline_spans(spans, width, height):
+    """见 Raster.outline。"""
+    border = {}
+    for y, row in spans.items():
+        (x0, x1), = row
+        parts = []
+        if x0 > 0:
+            parts.append((x0, x0))
+        if x1 < width - 1:
+            parts.append((x1, x1))
+        for ny in (y - 1, y + 1):
+            if ny < 0 or ny >= height:
+                continue
+            if ny not in spans:
+                parts.append((x0, x1))
+                continue
+            (n0, n1), = spans[ny]
+            if x0 < n0:
+                parts.append((x0, min(x1, n0 - 1)))
+            if x1 > n1:
+                parts.append((max(x0, n1 + 1), x1))
+        if parts:
+            border[y] = parts
+    return border
@@ -0,0 +1,310 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# 优先级：数值越小越先执行
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+PRIORITIES = {"interactive": INTERACTIVE, "normal": NORMAL, "bulk": BULK}
+
+# 工作线程当前执行任务的优先级，见 current_priority
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """任务所属作业已过截止时间，任务未开始执行。"""
+
+
+def current_priority():
+    """当前线程正在执行的调度任务的优先级；不在调度器的工作线程中时返回 None。"""
+    return getattr(_local, "priority", None)
+
+
+def parse_priority(priority):
+    """把 "interactive" / "normal" / "bulk" 或对应常量转换为优先级数值。"""
+    if isinstance(priority, str):
+        try:
+            return PRIORITIES[priority.lower()]
+        except KeyError:
+            raise ValueError(f"未知的优先级: {priority!r}") from None
+    if priority not in PRIORITIES.values():
+        raise ValueError(f"未知的优先级: {priority!r}")
+    return priority
+
+
+class Job:
+    """
+    一组同优先级任务（例如一次批量下载），由 Scheduler.job() 创建。
+
+    - 同一优先级的多个作业轮流取任务，互不饿死；
+    - max_concurrency 限制该作业同时占用的工作线程数；
+    - cancel() 或设置 cancel_event 后，排队中的任务被取消（Future 抛出 CancelledError），
+      进行中的任务可通过 cancel_event 自行中止；
+    - 到达 deadline 时设置 cancel_event，排队中的任务以 DeadlineExceeded 结束。
+
+    用作上下文管理器时，退出时调用 close()。
+    """
+
+    def __init__(self, scheduler, priority=NORMAL, deadline=None, cancel=None, max_concurrency=None,
+                 drop_on_cancel=True, name=None):
+        """
+        :param deadline: 相对截止时间（秒）；None 表示不限。
+        :param cancel: 可选的 threading.Event，与调用方共享取消状态；默认新建。
+        :param drop_on_cancel: 为 False 时取消后排队任务仍会执行（由任务自身检查 cancel_event 尽快返回）。
+        """
+        self.priority = parse_priority(priority)
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.drop_on_cancel = drop_on_cancel
+        self.cancel_event = cancel if cancel is not None else threading.Event()
+        self.deadline = time.monotonic() + deadline if deadline is not None else None
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self._scheduler = scheduler
+        self._tasks = deque()
+        self._queued = False  # 是否在调度器的轮转队列中
+        self._timer = None
+        if deadline is not None:
+            self._timer = threading.Timer(max(0.0, deadline), self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def expired(self, now=None):
+        return self.deadline is not None and (now if now is not None else time.monotonic()) >= self.deadline
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，返回 concurrent.futures.Future。"""
+        return self._scheduler._submit(self, fn, args, kwargs)
+
+    def map(self, fn, iterable):
+        """与 Executor.map 相同：全部提交后按输入顺序返回结果。"""
+        futures = [self.submit(fn, item) for item in iterable]
+        return (future.result() for future in futures)
+
+    def cancel(self):
+        """取消作业：设置 cancel_event，并立即结束所有排队中的任务。"""
+        self.cancel_event.set()
+        self._scheduler._drop(self)
+
+    def _expire(self):
+        self.cancel_event.set()
+        self._scheduler._drop(self)
+
+    def close(self):
+        """作业结束：停止截止时间计时器，丢弃仍在排队的任务（例如调用方提前放弃了结果）。"""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._scheduler._drop(self, force=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Scheduler:
+    """
+    下载工作线程之前的优先级调度器。
+
+    任务不直接进入线程池队列，而是挂在各自的 Job 上；空闲的工作线程每次只取一个任务：
+    先按优先级（interactive > normal > bulk），同一优先级内在作业之间轮转。
+    因此无论后台积压多少任务，新的 interactive 任务最多等待一个工作线程完成当前任务；
+    另有 reserved 个线程只执行 interactive 任务，所有普通线程都被占满时也能立即开始。
+
+    高优先级任务持续不断时低优先级任务会等待（严格优先级），interactive 应只用于少量的即时请求。
+    """
+
+    def __init__(self, workers=8, reserved=1, name="dd2-sched"):
+        """
+        :param workers: 普通工作线程数；可用 ensure_workers() 增加。
+        :param reserved: 只执行 interactive 任务的线程数。
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)    # 普通线程等待
+        self._urgent = threading.Condition(self._lock)  # 保留线程等待
+        self._rings = {p: deque() for p in PRIORITIES.values()}  # 有排队任务的作业，轮转
+        self._running = {p: 0 for p in PRIORITIES.values()}
+        self._defaults = {}
+        self._threads = []
+        self._workers = 0
+        self._shutdown = False
+        for _ in range(reserved):
+            self._start_thread(reserved=True)
+        self.ensure_workers(workers)
+
+    def ensure_workers(self, n):
+        """保证至少有 n 个普通工作线程（只增不减）。"""
+        with self._lock:
+            missing = n - self._workers
+            self._workers = max(self._workers, n)
+        for _ in range(missing):
+            self._start_thread(reserved=False)
+
+    def _start_thread(self, reserved):
+        thread = threading.Thread(target=self._worker, args=(reserved,), daemon=True,
+                                  name=f"{self.name}-{'r' if reserved else 'w'}{len(self._threads)}")
+        self._threads.append(thread)
+        thread.start()
+
+    def job(self, priority=NORMAL, deadline=None, cancel=None, max_concurrency=None, drop_on_cancel=True,
+            name=None):
+        """创建作业，参数见 Job。"""
+        return Job(self, priority, deadline, cancel, max_concurrency, drop_on_cancel, name)
+
+    def submit(self, fn, *args, priority=NORMAL, **kwargs):
+        """提交单个任务到该优先级的默认作业。"""
+        priority = parse_priority(priority)
+        with self._lock:
+            job = self._defaults.get(priority)
+        if job is None:
+            job = self._defaults.setdefault(priority, self.job(priority, name="default"))
+        return job.submit(fn, *args, **kwargs)
+
+    def stats(self):
+        """返回普通线程数，以及各优先级排队中的任务数、有排队任务的作业数和正在执行的任务数。"""
+        names = {v: k for k, v in PRIORITIES.items()}
+        with self._lock:
+            return {
+                "workers": self._workers,
+                "queued": {names[p]: sum(len(job._tasks) for job in ring) for p, ring in self._rings.items()},
+                "jobs": {names[p]: len(ring) for p, ring in self._rings.items()},
+                "running": {names[p]: n for p, n in self._running.items()},
+            }
+
+    def shutdown(self, wait=True):
+        """停止调度：排队中的任务被取消，进行中的任务执行完毕。"""
+        with self._lock:
+            self._shutdown = True
+            doomed = [task[0] for ring in self._rings.values() for job in ring for task in job._tasks]
+            for ring in self._rings.values():
+                for job in ring:
+                    job._tasks.clear()
+                    job._queued = False
+                ring.clear()
+            self._work.notify_all()
+            self._urgent.notify_all()
+        for future in doomed:
+            _cancel(future)
+        if wait:
+            for thread in self._threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+    # ------------------------------------------------------------ 内部
+
+    def _submit(self, job, fn, args, kwargs):
+        future = Future()
+        if job.drop_on_cancel and job.cancelled:
+            self._fail(job, [future])
+            return future
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("调度器已关闭")
+            job._tasks.append((future, fn, args, kwargs))
+            job.submitted += 1
+            if not job._queued:
+                self._rings[job.priority].append(job)
+                job._queued = True
+            self._work.notify()
+            if job.priority == INTERACTIVE:
+                self._urgent.notify()
+        return future
+
+    def _drop(self, job, force=False):
+        """结束作业所有排队中的任务（用于取消、超时与关闭作业）。"""
+        if not (job.drop_on_cancel or force):
+            return
+        with self._lock:
+            doomed = list(job._tasks)
+            job._tasks.clear()
+            if job._queued:
+                self._rings[job.priority].remove(job)
+                job._queued = False
+        self._fail(job, [task[0] for task in doomed])
+
+    @staticmethod
+    def _fail(job, futures):
+        expired = job.expired()
+        for future in futures:
+            if expired:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(DeadlineExceeded(job.name or "deadline"))
+            else:
+                _cancel(future)
+
+    def _pick(self, reserved, doomed):
+        """在锁内选出下一个任务；已取消作业的排队任务放入 doomed。"""
+        for priority in (INTERACTIVE,) if reserved else sorted(self._rings):
+            ring = self._rings[priority]
+            for _ in range(len(ring)):
+                job = ring[0]
+                ring.rotate(-1)
+                if job.drop_on_cancel and job.cancelled:
+                    doomed.append((job, [task[0] for task in job._tasks]))
+                    job._tasks.clear()
+                    ring.remove(job)
+                    job._queued = False
+                    continue
+                if job.max_concurrency and job.running >= job.max_concurrency:
+                    continue
+                task = job._tasks.popleft()
+                job.running += 1
+                self._running[priority] += 1
+                if not job._tasks:
+                    ring.remove(job)
+                    job._queued = False
+                return job, task
+        return None
+
+    def _worker(self, reserved):
+        wait_on = self._urgent if reserved else self._work
+        while True:
+            doomed = []
+            with self._lock:
+                while True:
+                    if self._shutdown:
+                        return
+                    picked = self._pick(reserved, doomed)
+                    if picked is not None or doomed:
+                        break
+                    wait_on.wait()
+            for job, futures in doomed:
+                self._fail(job, futures)
+            if picked is None:
+                continue
+            job, (future, fn, args, kwargs) = picked
+            _local.priority = job.priority
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = fn(*args, **kwargs)
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                _local.priority = None
+                with self._lock:
+                    job.running -= 1
+                    job.completed += 1
+                    self._running[job.priority] -= 1
+                    # 该作业因并发上限被跳过的任务现在可以执行
+                    if job._tasks:
+                        self._work.notify()
+                        if job.priority == INTERACTIVE:
+                            self._urgent.notify()
+
+
+def _cancel(future):
+    # 只调用 cancel() 不会唤醒 concurrent.futures.wait() 的等待者，与 Executor 一样再通知一次
+    if future.cancel():
+        future.set_running_or_notify_cancel()
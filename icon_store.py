@@ -0,0 +1,427 @@
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import threading
+
+# 内容寻址存储的默认目录名（位于输出目录下）
+BLOBS_DIRNAME = ".blobs"
+
+# 打包输出的默认文件名（位于输出目录下）；索引为同名加 .idx
+PACK_FILENAME = "icons.pack"
+PACK_MAGIC = b"DD2PACK1"
+
+
+class ContentStore:
+    """
+    内容寻址存储：图标字节按 SHA-256 命名保存为 blob，
+    每个 "<domain>_<size>x<size>.<ext>" 文件都是指向 blob 的硬链接。
+
+    大量域名返回完全相同的图标（共享 CDN、停放域名、Google 的默认地球图标），
+    相同内容只占一份磁盘空间和一个 inode；blob 已存在时完全跳过写入。
+    文件系统不支持硬链接时退化为普通文件副本。
+    """
+
+    def __init__(self, root):
+        """
+        :param root: blob 根目录，需与输出目录位于同一文件系统（硬链接要求），
+                     通常为 os.path.join(save_dir, BLOBS_DIRNAME)。
+        """
+        self.root = root
+        self.blobs_written = 0
+        self.dedup_hits = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_dir(cls, save_dir):
+        """在输出目录下创建默认位置的存储。"""
+        return cls(os.path.join(save_dir, BLOBS_DIRNAME))
+
+    def blob_path(self, digest):
+        # 只按内容命名：同样的字节以 .png 与 .ico 保存时也共用一个 blob
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def save(self, path, data, digest=None):
+        """
+        保存图标：blob 不存在时写入，然后把 path 原子地指向该 blob。
+
+        :param path: 对外可见的图标路径。
+        :param data: 图标字节。
+        :param digest: 已算好的 SHA-256（十六进制）；None 时现场计算。
+        :return: path
+        """
+        digest = digest or hashlib.sha256(data).hexdigest()
+        blob = self.blob_path(digest)
+        written = False if os.path.exists(blob) else self._create_blob(blob, data)
+        with self._lock:
+            if written:
+                self.blobs_written += 1
+            else:
+                self.dedup_hits += 1
+        try:
+            # 已经指向同一 blob 时无需改动（对同一 inode 的两个链接 rename 不会生效）
+            if os.path.exists(path) and os.path.samefile(path, blob):
+                return path
+            replace_with(path, lambda tmp: os.link(blob, tmp))
+        except OSError:
+            replace_with(path, lambda tmp: _write(tmp, data))
+        return path
+
+    def _create_blob(self, blob, data):
+        """
+        写入 blob；并发写入同一内容时只有一个成功（os.link 不覆盖已存在的文件），
+        保证所有硬链接指向同一个 inode。
+
+        :return: 本次是否真正写入了新 blob。
+        """
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp = temp_path(blob)
+        try:
+            _write(tmp, data)
+            try:
+                os.link(tmp, blob)
+            except FileExistsError:
+                return False
+            except OSError:
+                os.replace(tmp, blob)  # 不支持硬链接的文件系统
+            return True
+        finally:
+            remove_quietly(tmp)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def size(self, path):
+        return os.path.getsize(path)
+
+    def stats(self):
+        with self._lock:
+            return {"blobs_written": self.blobs_written, "dedup_hits": self.dedup_hits}
+
+
+class PackWriter:
+    """
+    打包输出：所有图标追加写入同一个文件，不再每个图标一个小文件。
+
+    - <output>/icons.pack：8 字节魔数后依次是各图标的原始字节；
+    - <output>/icons.pack.idx：每行 "name\toffset\tlength\tsha256"，同名的后一行覆盖前一行；
+      带缓存校验信息（ETag / Last-Modified 等）的行末尾多一列 JSON，见 save_meta。
+
+    与 ContentStore 的接口相同（save / exists / read / size），可作为 store 传给 dd2 的下载函数；
+    此时结果中的 path 只是包内的名字（os.path.basename(path)），文件系统中并不存在。
+    相同内容只写一次（后来的名字指向已有的偏移）。写入先进入缓冲区，每 flush_every 条先刷数据再刷索引，
+    进程中途被杀时重新打开会丢弃索引之外的残余数据。读取用 PackReader（mmap，零拷贝）。
+    """
+
+    def __init__(self, path, flush_every=256):
+        """
+        :param path: 包文件路径；已存在时继续追加。
+        :param flush_every: 累计多少条新记录刷新一次文件缓冲区。
+        """
+        self.path = path
+        self.index_path = path + ".idx"
+        self.flush_every = flush_every
+        self.blobs_written = 0
+        self.dedup_hits = 0
+        self._lock = threading.Lock()
+        self._entries = {}    # name -> (offset, length, sha256)
+        self._by_digest = {}  # sha256 -> (offset, length)
+        self._meta = {}       # stem -> 校验信息（icon_cache 的格式）
+        self._unflushed = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        end = self._recover()
+        self._pack = open(path, 'a+b')  # 追加写入，同时允许 read() 用 pread 读取
+        self._index = open(self.index_path, 'a', encoding='utf-8')
+        self._size = end
+
+    @classmethod
+    def for_dir(cls, save_dir, **kwargs):
+        """在输出目录下打开默认位置的包文件。"""
+        return cls(os.path.join(save_dir, PACK_FILENAME), **kwargs)
+
+    def _recover(self):
+        """读取已有索引，截掉未写完的数据与索引行，返回数据末尾偏移。"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < len(PACK_MAGIC):
+            with open(self.path, 'wb') as f:
+                f.write(PACK_MAGIC)
+            with open(self.index_path, 'w', encoding='utf-8'):
+                pass
+            return len(PACK_MAGIC)
+        with open(self.path, 'rb') as f:
+            if f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+                raise ValueError(f"不是图标包文件: {self.path}")
+        pack_size = os.path.getsize(self.path)
+        entries, self._meta, good = _read_pack_index(self.index_path, pack_size)
+        for name, (offset, length, digest) in entries.items():
+            self._entries[name] = (offset, length, digest)
+            self._by_digest[digest] = (offset, length)
+        end = max((offset + length for offset, length, _ in entries.values()), default=len(PACK_MAGIC))
+        if pack_size > end:
+            os.truncate(self.path, end)
+        if good < os.path.getsize(self.index_path):
+            os.truncate(self.index_path, good)
+        return end
+
+    def save(self, path, data, digest=None):
+        """
+        追加一个图标；同名同内容时不做任何写入。
+
+        :param path: 图标路径，包内以 os.path.basename(path) 为名。
+        :return: path
+        """
+        digest = digest or hashlib.sha256(data).hexdigest()
+        name = os.path.basename(path)
+        with self._lock:
+            current = self._entries.get(name)
+            if current is not None and current[2] == digest:
+                self.dedup_hits += 1
+                return path
+            location = self._by_digest.get(digest)
+            if location is None:
+                location = (self._size, len(data))
+                self._pack.write(data)
+                self._size += len(data)
+                self._by_digest[digest] = location
+                self.blobs_written += 1
+            else:
+                self.dedup_hits += 1
+            self._entries[name] = (location[0], location[1], digest)
+            self._index.write(f"{name}\t{location[0]}\t{location[1]}\t{digest}\n")
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._flush_locked()
+        return path
+
+    def save_meta(self, stem, meta):
+        """
+        在索引中追加一行记录图标的缓存校验信息（代替 .icon_cache 下的 JSON 文件）。
+
+        :param stem: 形如 "github.com_64x64"，与 icon_cache.save_meta 相同。
+        :param meta: 校验信息，其中 file 指向的图标必须已在包内，否则抛出 FileNotFoundError。
+        """
+        text = json.dumps(meta, ensure_ascii=False)
+        with self._lock:
+            entry = self._entries.get(meta["file"])
+            if entry is None:
+                raise FileNotFoundError(meta["file"])
+            self._meta[stem] = dict(meta)
+            self._index.write(f"{meta['file']}\t{entry[0]}\t{entry[1]}\t{entry[2]}\t{text}\n")
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._flush_locked()
+
+    def load_meta(self, stem):
+        """
+        :return: save_meta 保存的校验信息；没有记录，或图标内容在那之后已被替换时返回 None。
+        """
+        with self._lock:
+            meta = self._meta.get(stem)
+            if meta is None:
+                return None
+            entry = self._entries.get(meta["file"])
+            if entry is None or meta.get("sha256") not in (None, entry[2]):
+                return None
+            return dict(meta)
+
+    def exists(self, path):
+        return os.path.basename(path) in self._entries
+
+    def read(self, path):
+        """读取一个图标的字节；不存在时抛出 FileNotFoundError。"""
+        with self._lock:
+            entry = self._entries.get(os.path.basename(path))
+            if entry is None:
+                raise FileNotFoundError(path)
+            self._pack.flush()
+        return os.pread(self._pack.fileno(), entry[1], entry[0])
+
+    def size(self, path):
+        entry = self._entries.get(os.path.basename(path))
+        if entry is None:
+            raise FileNotFoundError(path)
+        return entry[1]
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        # 先刷数据再刷索引：索引中出现的记录，其数据一定已在包文件中
+        self._pack.flush()
+        self._index.flush()
+        self._unflushed = 0
+
+    def stats(self):
+        with self._lock:
+            return {"blobs_written": self.blobs_written, "dedup_hits": self.dedup_hits,
+                    "icons": len(self._entries), "bytes": self._size}
+
+    def close(self):
+        with self._lock:
+            if self._pack.closed:
+                return
+            self._flush_locked()
+            self._pack.close()
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackReader:
+    """
+    以 mmap 只读打开 PackWriter 写出的包文件；get() 返回指向映射内存的 memoryview 切片，
+    不复制数据，也没有每个图标一次的系统调用。
+
+    打开后写入的新图标需调用 refresh() 才可见。close() 后之前返回的切片不可再用，需要长期保存时先 bytes() 复制。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self._mm = None
+        self._view = None
+        self._entries = {}
+        self.refresh()
+
+    @classmethod
+    def for_dir(cls, save_dir):
+        return cls(os.path.join(save_dir, PACK_FILENAME))
+
+    def refresh(self):
+        """重新读取索引并重新映射包文件。"""
+        self.close()
+        with open(self.path, 'rb') as f:
+            if f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+                raise ValueError(f"不是图标包文件: {self.path}")
+            size = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        self._entries = _read_pack_index(self.index_path, size)[0]
+
+    def get(self, name):
+        """
+        :param name: 包内名字，例如 "github.com_64x64.png"（也接受完整路径）。
+        :return: memoryview；不存在时返回 None。
+        """
+        entry = self._entries.get(os.path.basename(name))
+        if entry is None:
+            return None
+        offset, length, _ = entry
+        return self._view[offset:offset + length]
+
+    def sha256(self, name):
+        entry = self._entries.get(os.path.basename(name))
+        return entry[2] if entry else None
+
+    def names(self):
+        return list(self._entries)
+
+    def __contains__(self, name):
+        return os.path.basename(name) in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # 调用方仍持有切片；映射在其释放后由垃圾回收关闭
+            self._mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_pack_index(index_path, pack_size):
+    """
+    读取包索引。
+
+    :return: ({name: (offset, length, sha256)}, {stem: 校验信息}, 最后一条有效记录之后的字节偏移)；
+             遇到残缺的行或超出 pack_size 的记录（数据未写完）即停止，其后的内容由 PackWriter 截掉。
+    """
+    entries = {}
+    metas = {}
+    good = 0
+    try:
+        with open(index_path, 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return entries, metas, 0
+    for line in raw.split(b"\n")[:-1]:
+        parts = line.split(b"\t")
+        try:
+            offset, length = int(parts[1]), int(parts[2])
+            name, digest = parts[0].decode('utf-8'), parts[3].decode('ascii')
+            meta = json.loads(parts[4]) if len(parts) == 5 else None
+        except (IndexError, ValueError):
+            break
+        if len(parts) > 5 or offset + length > pack_size:
+            break
+        entries[name] = (offset, length, digest)
+        if isinstance(meta, dict):
+            metas[os.path.splitext(name)[0]] = meta
+        good += len(line) + 1
+    return entries, metas, good
+
+
+# ---------------------------------------------------------------- 原子写入（各模块共用）
+
+# 临时文件名中的序号：同一线程先后（或嵌套）写同一路径时也不会撞名
+_temp_counter = itertools.count()
+
+
+def _write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def temp_path(path):
+    """
+    同目录下的隐藏临时文件名（含进程号、线程号与序号，并发写同一路径的线程各用各的），
+    保证 os.replace 在同一文件系统内原子完成。
+    """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.{next(_temp_counter)}.part")
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def replace_with(path, create):
+    """在同目录临时名上执行 create(tmp)，再 os.replace 到 path；失败时删除临时文件。"""
+    tmp = temp_path(path)
+    try:
+        create(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        remove_quietly(tmp)
+        raise
+
+
+def atomic_write(path, data):
+    """先写临时文件再 os.replace 到目标路径，目录中永远不会出现写了一半的文件。"""
+    replace_with(path, lambda tmp: _write(tmp, data))
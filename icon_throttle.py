@@ -0,0 +1,396 @@
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+# 视为上游过载/临时故障、值得重试的状态码
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class RateLimiter:
+    """
+    令牌桶限速器（线程安全），在所有工作线程之间共享。
+
+    acquire() 会预约一个令牌：桶里没有令牌时计算出需要等待的时间并在锁外休眠，
+    因此并发调用者按到达顺序依次放行，不会互相抢占。
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: 每秒放行的请求数；None 或 <= 0 表示不限速。
+        :param burst: 桶容量（允许的瞬时突发数），默认等于 rate。
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate or self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """
+    按主机限制同时进行的请求数（线程安全），用于直接请求各网站的来源：
+    慢或不可达的主机只占用自己的名额，不影响其他主机。空闲主机的状态随即释放，主机再多也不会积累。
+    同一主机上 urgent 的调用者（interactive 任务）优先获得名额。
+    """
+
+    def __init__(self, per_host=2):
+        """:param per_host: 同一主机同时进行的请求数上限。"""
+        self.per_host = per_host
+        self._hosts = {}  # host -> [进行中的请求数, 等待中的调用者数, 其中 urgent 的个数]
+        self._cond = threading.Condition()
+
+    def acquire(self, host, urgent=False):
+        with self._cond:
+            state = self._hosts.setdefault(host, [0, 0, 0])
+            state[1] += 1
+            state[2] += urgent
+            while state[0] >= self.per_host or (state[2] and not urgent):
+                self._cond.wait()
+            state[1] -= 1
+            state[2] -= urgent
+            state[0] += 1
+
+    def release(self, host):
+        with self._cond:
+            state = self._hosts[host]
+            state[0] -= 1
+            if state[1]:
+                self._cond.notify_all()
+            elif not state[0]:
+                del self._hosts[host]
+
+
+class CircuitBreaker:
+    """
+    熔断器：最近一段请求的错误率过高时暂停整个线程池。
+
+    closed（正常）-> 错误率超过阈值 -> open（所有调用者在 wait() 中等待 cooldown 秒）
+    -> half_open（只放行一个探测请求）-> 探测成功则 closed，失败则再次 open。
+    """
+
+    def __init__(self, window=50, failure_ratio=0.5, min_requests=20, cooldown=10.0):
+        """
+        :param window: 统计错误率的最近请求数。
+        :param failure_ratio: 触发熔断的错误率。
+        :param min_requests: 样本数少于该值时不熔断。
+        :param cooldown: 熔断后暂停的秒数。
+        """
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.trips = 0
+        self._outcomes = deque(maxlen=window)
+        self._open_until = 0.0
+        self._probe_started = None
+        self._cond = threading.Condition()
+
+    def wait(self):
+        """熔断期间阻塞调用者；返回时表示可以发送请求。"""
+        with self._cond:
+            while True:
+                if self.state == "closed":
+                    return
+                now = time.monotonic()
+                if self.state == "open":
+                    if now < self._open_until:
+                        self._cond.wait(self._open_until - now)
+                        continue
+                    self.state = "half_open"
+                    self._probe_started = None
+                # half_open：只放行一个探测请求；探测迟迟没有结果时允许再探测一次
+                if self._probe_started is None or now - self._probe_started > self.cooldown:
+                    self._probe_started = now
+                    return
+                self._cond.wait(min(1.0, self.cooldown))
+
+    def record(self, ok):
+        """记录一次请求结果；ok 为 False 表示过载类错误（429/5xx/连接失败）。"""
+        with self._cond:
+            if self.state == "half_open":
+                if ok:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                self._cond.notify_all()
+                return
+            if self.state == "open":
+                return  # 熔断前已发出的请求，结果不再计入
+            self._outcomes.append(ok)
+            n = len(self._outcomes)
+            if n >= self.min_requests and self._outcomes.count(False) / n >= self.failure_ratio:
+                self._trip()
+                self._cond.notify_all()
+
+    def _trip(self):
+        self.state = "open"
+        self.trips += 1
+        self._open_until = time.monotonic() + self.cooldown
+        self._outcomes.clear()
+
+
+class RetryPolicy:
+    """带抖动的指数退避（full jitter），并遵守服务端的 Retry-After。"""
+
+    def __init__(self, retries=4, base=0.5, cap=30.0):
+        """
+        :param retries: 首次请求之外的最大重试次数。
+        :param base: 第一次重试的退避上限（秒），之后每次翻倍。
+        :param cap: 单次退避的最长秒数。
+        """
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def backoff(self, attempt, retry_after=None):
+        """第 attempt 次（从 0 开始）失败后应等待的秒数。"""
+        if retry_after:
+            try:
+                return min(self.cap, max(0.0, float(retry_after)))
+            except ValueError:
+                pass  # HTTP 日期格式，按常规退避处理
+        return random.uniform(0, min(self.cap, self.base * (2 ** attempt)))
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 自适应并发上限（线程安全），在所有工作线程之间共享；限制同时等待响应头的请求数。
+
+    每完成 limit 个（至少 min_round 个）在本轮开始后发出的请求为一轮（大致一个往返时间）。
+    本轮过载类错误（429/5xx/超时/连接失败）的比例超过 error_ratio，或延迟中位数超过基线的 tolerance 倍时，
+    上限乘以 decrease；否则若本轮并发确实达到了上限，上限加 1。
+    基线是最近 baseline_rounds 轮延迟中位数的 10% 分位数，近似上游没有排队时的延迟；
+    用分位数而不是最小值，长尾延迟下个别特别快的一轮不会把基线压得过低。
+
+    acquire() 在并发已达上限时阻塞；urgent 的调用者（interactive 任务）优先于普通调用者获得名额。
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=128, tolerance=2.0, error_ratio=0.1, decrease=0.7,
+                 baseline_rounds=50, min_round=16):
+        """
+        :param initial: 初始并发上限。
+        :param minimum: 并发上限的下界。
+        :param maximum: 并发上限的上界；实际并发还受调用方工作线程数限制。
+        :param tolerance: 延迟中位数超过基线多少倍视为上游开始排队。
+        :param error_ratio: 一轮中过载类错误超过该比例时回退。
+        :param decrease: 每次回退时上限乘以的系数。
+        :param baseline_rounds: 计算基线的轮数。
+        :param min_round: 每轮至少包含的请求数。
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.error_ratio = error_ratio
+        self.decrease = decrease
+        self.min_round = min_round
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._round = []     # 本轮成功请求的延迟
+        self._errors = 0     # 本轮过载类错误数
+        self._saturated = False
+        self._round_started = time.monotonic()  # 早于此刻发出的请求属于上一轮的上限，不计入本轮
+        self._medians = deque(maxlen=baseline_rounds)
+        self._urgent = 0     # 正在等待名额的 urgent 调用者数
+        self._cond = threading.Condition()
+
+    def acquire(self, urgent=False):
+        """
+        等待一个并发名额。
+
+        :return: 获得名额的时刻（time.monotonic()），请求结束后传给 release()。
+        """
+        with self._cond:
+            if urgent:
+                self._urgent += 1
+            try:
+                while self.in_flight >= int(self.limit) or (self._urgent and not urgent):
+                    self._saturated = True
+                    self._cond.wait()
+            finally:
+                if urgent:
+                    self._urgent -= 1
+            self.in_flight += 1
+            if self.in_flight >= int(self.limit):
+                self._saturated = True
+        return time.monotonic()
+
+    def release(self, started, ok=None):
+        """
+        归还名额并记录结果。
+
+        :param started: acquire() 的返回值。
+        :param ok: True 为正常响应（计入延迟），False 为过载类错误，None 为与上游负载无关的失败（不计入）。
+        """
+        latency = time.monotonic() - started
+        with self._cond:
+            self.in_flight -= 1
+            if started >= self._round_started:
+                if ok:
+                    self._round.append(latency)
+                elif ok is not None:
+                    self._errors += 1
+                if len(self._round) + self._errors >= max(int(self.limit), self.min_round):
+                    self._end_round()
+            if self._urgent:
+                self._cond.notify_all()
+            else:
+                self._cond.notify(max(1, int(self.limit) - self.in_flight))
+
+    def _end_round(self):
+        median = sorted(self._round)[len(self._round) // 2] if self._round else None
+        if median is not None:
+            self._medians.append(median)
+        overloaded = self._errors > self.error_ratio * (len(self._round) + self._errors)
+        if overloaded or (median is not None and median > self._baseline() * self.tolerance):
+            self.limit = max(float(self.minimum), self.limit * self.decrease)
+            self.decreases += 1
+        elif self._saturated and self.limit < self.maximum:
+            self.limit = min(float(self.maximum), self.limit + 1)
+            self.increases += 1
+        self._round = []
+        self._errors = 0
+        self._saturated = False
+        self._round_started = time.monotonic()
+
+    def _baseline(self):
+        medians = sorted(self._medians)
+        return medians[len(medians) // 10]
+
+    def stats(self):
+        with self._cond:
+            return {"limit": int(self.limit), "in_flight": self.in_flight, "increases": self.increases,
+                    "decreases": self.decreases,
+                    "baseline_ms": round(self._baseline() * 1000, 1) if self._medians else None}
+
+
+class AdaptiveTimeout:
+    """
+    由最近请求延迟推算的超时：最近 window 个延迟的 percentile 分位数乘以 multiplier，限制在 [minimum, maximum]。
+
+    样本不足 min_samples 时使用 maximum（即原先的固定超时）。超时的请求以当时的超时值计入样本，
+    上游整体变慢、超时比例上升时分位数随之升高，超时自动放宽，不会陷入"超时过短、请求全部失败"的循环。
+    """
+
+    def __init__(self, percentile=99, multiplier=3.0, minimum=1.0, maximum=10.0, window=1000, min_samples=50):
+        """
+        :param percentile: 参考的延迟分位数。
+        :param multiplier: 超时为该分位数的倍数。
+        :param minimum: 超时下限（秒）。
+        :param maximum: 超时上限（秒）。
+        :param window: 参与统计的最近样本数。
+        :param min_samples: 开始自适应所需的最少样本数。
+        """
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.minimum = minimum
+        self.maximum = maximum
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._timeout = maximum
+        self._pending = 0  # 上次重新计算后新增的样本数
+        self._lock = threading.Lock()
+
+    def timeout(self):
+        """当前应使用的超时秒数。"""
+        return self._timeout
+
+    def record(self, latency, timed_out=False):
+        """
+        记录一次请求到收到响应头的耗时（秒）。
+
+        :param timed_out: 请求超时；此时 latency 为所用的超时值，并立即重新计算超时，上游突然变慢时尽快放宽。
+        """
+        with self._lock:
+            self._samples.append(latency)
+            self._pending += 1
+            n = len(self._samples)
+            # 平时每新增约 1/10 窗口的样本重新排序一次，而不是每个样本都排序
+            if n >= self.min_samples and (timed_out or self._pending >= max(1, self._samples.maxlen // 10)):
+                self._pending = 0
+                value = sorted(self._samples)[min(n - 1, n * self.percentile // 100)]
+                self._timeout = min(self.maximum, max(self.minimum, value * self.multiplier))
+
+    def stats(self):
+        return {"timeout_s": round(self._timeout, 3), "samples": len(self._samples)}
+
+
+def _get(session, url, concurrency, timeouts, urgent, kwargs):
+    """发送一次 GET：占用一个并发名额，超时取自 timeouts，并把延迟与结果反馈给两者。"""
+    if timeouts is not None:
+        kwargs = dict(kwargs, timeout=timeouts.timeout())
+    started = concurrency.acquire(urgent) if concurrency is not None else time.monotonic()
+    ok = None
+    try:
+        response = session.get(url, **kwargs)
+        ok = response.status_code not in RETRY_STATUSES
+        if timeouts is not None:
+            timeouts.record(time.monotonic() - started)
+        return response
+    except requests.exceptions.Timeout:
+        ok = False
+        if timeouts is not None:
+            timeouts.record(kwargs["timeout"], timed_out=True)
+        raise
+    except requests.exceptions.ConnectionError:
+        ok = False
+        raise
+    finally:
+        if concurrency is not None:
+            concurrency.release(started, ok)
+
+
+def send_with_retry(session, url, limiter=None, breaker=None, policy=None, concurrency=None, timeouts=None,
+                    urgent=False, **kwargs):
+    """
+    发送 GET 请求：先经过熔断器、限速器与并发上限，遇到 429/5xx/连接错误时按退避策略重试。
+
+    :param concurrency: 可选的 AdaptiveConcurrency；退避等待期间不占用名额。
+    :param timeouts: 可选的 AdaptiveTimeout；给出时覆盖 kwargs 中的 timeout。
+    :param urgent: 是否优先获得并发名额（interactive 任务）。
+    :param kwargs: 透传给 session.get 的参数。
+    :return: (response, retries)。重试耗尽时返回最后一次的响应（状态码可能仍是 429/5xx）。
+    :raises requests.exceptions.RequestException: 重试耗尽后仍无法连接时。
+    """
+    policy = policy or RetryPolicy(retries=0)
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.wait()
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = _get(session, url, concurrency, timeouts, urgent, kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if breaker is not None:
+                breaker.record(False)
+            if attempt >= policy.retries:
+                raise
+            delay = policy.backoff(attempt)
+        else:
+            retryable = response.status_code in RETRY_STATUSES
+            if breaker is not None:
+                breaker.record(not retryable)
+            if not retryable or attempt >= policy.retries:
+                return response, attempt
+            delay = policy.backoff(attempt, response.headers.get('Retry-After'))
+            response.close()
+        time.sleep(delay)
+        attempt += 1
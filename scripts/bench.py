@@ -0,0 +1,207 @@
+"""
+dd2 下载性能基准：启动本地模拟服务，测量单个、批量与重复（缓存）运行。
+
+报告吞吐量、p50/p95/p99 延迟、峰值 RSS 与写入字节数，结果以 JSON 输出，便于长期对比。
+每个场景在独立的子进程中运行（共用同一个模拟服务），峰值 RSS 只反映该场景本身（repeat 场景含预热）。
+
+用法: python scripts/bench.py --domains 2000 --workers 32 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import dd2  # noqa: E402
+import icon_throttle  # noqa: E402
+from bench_server import add_server_arguments, start_server  # noqa: E402
+
+
+SCENARIOS = ("single", "bulk", "derive", "repeat", "repeat_disk")
+
+
+def percentile(values, pct):
+    """最近秩百分位数；空列表返回 None。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # macOS 单位为字节
+
+
+def summarize(name, results, latencies_ms, wall):
+    ok = [r for r in results if r["path"]]
+    written = sum(r["bytes"] for r in ok if r["cache"] in (None, "miss"))
+    return {
+        "scenario": name,
+        "items": len(results),
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "wall_s": round(wall, 4),
+        "throughput_per_s": round(len(results) / wall, 2) if wall > 0 else None,
+        "latency_ms": {
+            "p50": percentile(latencies_ms, 50),
+            "p95": percentile(latencies_ms, 95),
+            "p99": percentile(latencies_ms, 99),
+            "max": max(latencies_ms) if latencies_ms else None,
+        },
+        "bytes_written": written,
+        "cache": {k: sum(1 for r in results if r["cache"] == k) for k in ("memory", "fresh", "revalidated", "miss")},
+        "retries": sum(r["retries"] for r in results),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def run_single(domains, sizes, out_dir):
+    results, latencies = [], []
+    started = time.perf_counter()
+    for d in domains:
+        for size in sizes:
+            t0 = time.perf_counter()
+            path = dd2.download_icon_from_google(d, save_dir=out_dir, size=size, use_cache=False)
+            latencies.append(round((time.perf_counter() - t0) * 1000, 2))
+            nbytes = os.path.getsize(path) if path else 0
+            results.append(dict(dd2.make_result(d, size, dd2.normalize_domain(d)), path=path, bytes=nbytes,
+                                error=None if path else "下载失败"))
+    return summarize("single", results, latencies, time.perf_counter() - started)
+
+
+def run_bulk(name, domains, sizes, out_dir, workers, use_cache, derive=False):
+    started = time.perf_counter()
+    results = dd2.download_icons_bulk(domains, sizes, out_dir, workers=workers, use_cache=use_cache,
+                                      derive_sizes=derive)
+    wall = time.perf_counter() - started
+    latencies = [r["elapsed_ms"] for r in results if r["elapsed_ms"] is not None]
+    return summarize(name, results, latencies, wall)
+
+
+def run_scenario(name, args, work_dir, on_warmup=None):
+    """
+    在当前进程中运行一个场景（由 run_in_subprocess 启动的子进程调用）。
+
+    :param on_warmup: repeat 场景预热结束、正式计时开始前调用。
+    """
+    sizes = tuple(int(s) for s in args.sizes.split(","))
+    domains = [f"site{i}.bench.test" for i in range(args.domains)]
+    out_dir = os.path.join(work_dir, name)
+    if name == "single":
+        return run_single(domains[:args.single_domains], sizes, out_dir)
+    if name in ("bulk", "derive"):
+        return run_bulk(name, domains, sizes, out_dir, args.workers, use_cache=False, derive=name == "derive")
+    run_bulk("warmup", domains, sizes, out_dir, args.workers, use_cache=True)
+    if on_warmup is not None:
+        on_warmup()
+    if name == "repeat_disk":
+        dd2.memory_cache.clear()
+    return run_bulk(name, domains, sizes, out_dir, args.workers, use_cache=True)
+
+
+def run_in_subprocess(name, argv, url, work_dir, server):
+    """
+    在子进程中运行一个场景并返回其结果；upstream_requests 由父进程按模拟服务的计数补上
+    （子进程输出 "warmup" 行时重新开始计数，不含预热的请求）。
+
+    :raises RuntimeError: 子进程失败时。
+    """
+    before = server.requests
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), *argv, "--run-scenario", name,
+                             "--server-url", url, "--work-dir", work_dir],
+                            stdout=subprocess.PIPE, text=True)
+    last = None
+    for line in proc.stdout:
+        if line.strip() == "warmup":
+            before = server.requests
+        elif line.strip():
+            last = line
+    if proc.wait() != 0 or last is None:
+        raise RuntimeError(f"场景 {name} 的子进程退出码 {proc.returncode}")
+    res = json.loads(last)
+    res["upstream_requests"] = server.requests - before
+    return res
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    parser = argparse.ArgumentParser(description="dd2 下载性能基准")
+    parser.add_argument("--domains", type=int, default=500, help="批量场景的域名数量")
+    parser.add_argument("--single-domains", type=int, default=50, help="单个下载场景的域名数量")
+    parser.add_argument("--sizes", default="64", help="逗号分隔的尺寸列表")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0, help="限速（每秒请求数），0 为不限速")
+    parser.add_argument("--scenarios", default="single,bulk,repeat,repeat_disk",
+                        help="要运行的场景: single,bulk,derive,repeat,repeat_disk")
+    parser.add_argument("--label", default="", help="写入结果的标签，便于区分不同运行")
+    parser.add_argument("--output", help="结果 JSON 文件（默认输出到标准输出）")
+    # 子进程模式（由 run_in_subprocess 使用）
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--server-url", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    add_server_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.run_scenario:
+        dd2.ICON_API = args.server_url
+        dd2.rate_limiter.rate = args.rate or None
+        dd2.retry_policy = icon_throttle.RetryPolicy(retries=4, base=0.05, cap=1.0)
+        res = run_scenario(args.run_scenario, args, args.work_dir, on_warmup=lambda: print("warmup", flush=True))
+        print(json.dumps(res))
+        return 0
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"未知场景: {name}")
+    server, url = start_server(args.latency, args.error_rate, args.mix, args.payload_bytes, args.max_age,
+                               capacity=args.capacity)
+    work_dir = tempfile.mkdtemp(prefix="dd2-bench-")
+    report = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items()
+                   if k not in ("output", "run_scenario", "server_url", "work_dir")},
+        "results": [],
+    }
+    try:
+        for name in scenarios:
+            res = run_in_subprocess(name, argv, url, work_dir, server)
+            report["results"].append(res)
+            print(f"{name:12s} {res['throughput_per_s']:>10} items/s  p50={res['latency_ms']['p50']}ms "
+                  f"p99={res['latency_ms']['p99']}ms  rss={res['peak_rss_kb']}KB", file=sys.stderr)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+本地 favicon 服务，模拟 t0.gstatic.com/faviconV2 供基准测试使用。
+
+可配置延迟分布、错误率、负载大小、返回的图片类型与并发处理能力；支持 ETag 条件请求。
+
+独立运行: python scripts/bench_server.py --port 8765 --latency lognormal:3,0.6 --error-rate 0.01
+"""
+import argparse
+import functools
+import hashlib
+import math
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "ico": "image/x-icon",
+    "jpeg": "image/jpeg",
+}
+
+
+def parse_latency(spec):
+    """
+    解析延迟分布（毫秒），返回无参采样函数。
+
+    - "fixed:20"
+    - "uniform:10,80"
+    - "lognormal:3,0.6"（ln(ms) 的均值与标准差；中位数约 e^3 = 20ms）
+    - "none"
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "none":
+        return lambda: 0.0
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda: math.exp(random.gauss(values[0], values[1]))
+    raise ValueError(f"未知的延迟分布: {spec!r}")
+
+
+def parse_mix(spec):
+    """解析内容类型权重，例如 "png:8,ico:1,svg:1"。"""
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition(":")
+        if name not in CONTENT_TYPES:
+            raise ValueError(f"未知的内容类型: {name!r}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def _png(side, seed, extra):
+    rng = random.Random(seed)
+    row = bytes(rng.randrange(256) for _ in range(side * 4))
+    raw = b"".join(b"\x00" + row[y % len(row):] + row[:y % len(row)] for y in range(side))
+
+    def chunk(typ, data):
+        return struct.pack(">I", len(data)) + typ + data + struct.pack(">I", zlib.crc32(typ + data) & 0xffffffff)
+
+    body = (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", side, side, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6)))
+    if extra:
+        body += chunk(b"tEXt", b"pad\x00" + b"x" * extra)
+    return body + chunk(b"IEND", b"")
+
+
+@functools.lru_cache(maxsize=4096)
+def make_payload(kind, host, size, payload_bytes=0):
+    """按 (主机名, 尺寸) 生成确定性的图标内容，便于 ETag 命中。"""
+    seed = f"{host}:{size}"
+    side = max(1, min(int(size), 256))
+    if kind == "png":
+        return _png(side, seed, payload_bytes)
+    if kind == "ico":
+        png = _png(min(side, 64), seed, payload_bytes)
+        return struct.pack("<HHH", 0, 1, 1) + struct.pack("<BBBBHHII", 0, 0, 0, 0, 1, 32, len(png), 22) + png
+    if kind == "svg":
+        color = hashlib.md5(seed.encode()).hexdigest()[:6]
+        pad = f"<!-- {'x' * payload_bytes} -->" if payload_bytes else ""
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{side}" height="{side}">{pad}'
+                f'<rect width="100%" height="100%" fill="#{color}"/></svg>').encode()
+    rng = random.Random(seed)
+    return b"\xff\xd8\xff\xe0\x00\x10JFIF\x00" + bytes(rng.randrange(256) for _ in range(256 + payload_bytes))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体是两次写入；保持连接时 Nagle 算法加上客户端的延迟 ACK 会让每个请求多等约 40 ms，
+    # 测到的主要是这段停顿，而且恰好惩罚复用连接的 Session
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cfg = self.server.config
+        query = parse_qs(urlsplit(self.path).query)
+        host = urlsplit(query.get("url", ["https://unknown"])[0]).hostname or "unknown"
+        size = query.get("size", ["64"])[0]
+        delay = cfg["latency"]() / 1000.0
+        if cfg["slots"] is not None:
+            # 模拟处理能力有限的上游：超出 capacity 的并发请求排队，延迟随并发升高
+            with cfg["slots"]:
+                time.sleep(delay)
+        elif delay > 0:
+            time.sleep(delay)
+        with self.server.lock:
+            self.server.requests += 1
+        if random.random() < cfg["error_rate"]:
+            self._empty(random.choice((429, 503)), {"Retry-After": "0"})
+            return
+        rng = random.Random(f"{host}:kind")
+        kinds, weights = zip(*cfg["mix"])
+        kind = rng.choices(kinds, weights)[0]
+        body = make_payload(kind, host, size, cfg["payload_bytes"])
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self._empty(304, {"ETag": etag, "Cache-Control": f"public, max-age={cfg['max_age']}"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES[kind])
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"public, max-age={cfg['max_age']}")
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端已超时断开
+
+    def _empty(self, status, headers):
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def start_server(latency="lognormal:3,0.6", error_rate=0.0, mix="png:8,ico:1,svg:1", payload_bytes=0,
+                 max_age=86400, port=0, capacity=0):
+    """
+    在后台线程启动模拟服务。
+
+    :param capacity: 同时处理的请求数上限，超出的请求排队；0 表示不限。
+
+    :return: (server, api_url)；server.requests 为已处理的请求数，server.shutdown() 停止服务。
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    server.config = {
+        "latency": parse_latency(latency),
+        "error_rate": error_rate,
+        "mix": parse_mix(mix),
+        "payload_bytes": payload_bytes,
+        "max_age": max_age,
+        "slots": threading.Semaphore(capacity) if capacity > 0 else None,
+    }
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/faviconV2"
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", default="lognormal:3,0.6", help="延迟分布（毫秒），见 parse_latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 429/503 的概率")
+    parser.add_argument("--mix", default="png:8,ico:1,svg:1", help="内容类型权重，例如 png:8,ico:1,svg:1,jpeg:1")
+    parser.add_argument("--payload-bytes", type=int, default=0, help="每个响应额外填充的字节数")
+    parser.add_argument("--max-age", type=int, default=86400, help="Cache-Control max-age（秒）")
+    parser.add_argument("--capacity", type=int, default=0, help="同时处理的请求数上限，超出的排队（0 为不限）")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="本地 favicon 模拟服务")
+    p.add_argument("--port", type=int, default=8765)
+    add_server_arguments(p)
+    a = p.parse_args()
+    srv, url = start_server(a.latency, a.error_rate, a.mix, a.payload_bytes, a.max_age, a.port, a.capacity)
+    print(f"serving {url}  (dd2.ICON_API = {url!r})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
@@ -0,0 +1,146 @@
+"""
+GUI 冷启动基准：在独立进程中启动 download_icon_gui.App，测量从进程启动到第一帧绘制完成的时间。
+
+场景:
+- cold_icon: 每次使用空的图标缓存目录（首次启动，需要绘制窗口图标）
+- warm_icon: 复用已生成的图标缓存（常规启动）
+- import: 只导入模块、不创建窗口（无显示环境时也可运行）
+
+同时记录第一帧时已加载的重量级模块（requests、urllib3、numpy、dd2），便于发现启动路径上的意外导入。
+
+用法: python scripts/bench_startup.py --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from bench import git_commit, percentile  # noqa: E402
+
+HEAVY_MODULES = ("requests", "urllib3", "numpy", "dd2")
+
+# 子进程：导入 GUI 模块并（可选）创建窗口，处理完第一批事件后输出一行 JSON
+_CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import download_icon_gui
+imported = time.perf_counter()
+report = {{"import_ms": (imported - started) * 1000}}
+if {window!r}:
+    app = download_icon_gui.App()
+    app.update()
+    report["frame_ms"] = (time.perf_counter() - started) * 1000
+    report["app_ms"] = (time.perf_counter() - imported) * 1000
+report["heavy_modules"] = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps(report), flush=True)
+if {window!r}:
+    app.destroy()
+"""
+
+
+def run_once(window, cache_dir):
+    """
+    启动一个子进程并返回其报告；total_ms 为父进程观察到的从启动到输出报告的时间（含解释器启动）。
+
+    :raises RuntimeError: 子进程失败（例如没有显示环境）。
+    """
+    code = _CHILD.format(root=ROOT, window=window, heavy=HEAVY_MODULES)
+    env = dict(os.environ, DOWNLOAD_ICON_CACHE_DIR=cache_dir)
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, env=env, cwd=ROOT)
+    line = proc.stdout.readline()
+    total_ms = (time.perf_counter() - started) * 1000
+    _, err = proc.communicate(timeout=60)
+    if not line:
+        raise RuntimeError(err.strip().splitlines()[-1] if err.strip() else f"子进程退出码 {proc.returncode}")
+    report = json.loads(line)
+    report["total_ms"] = total_ms
+    return report
+
+
+def run_scenario(name, runs):
+    window = name != "import"
+    work_dir = tempfile.mkdtemp(prefix="dd2-startup-")
+    samples = []
+    try:
+        if name == "warm_icon":
+            run_once(window, work_dir)  # 预先生成图标缓存
+        for i in range(runs):
+            cache_dir = os.path.join(work_dir, f"cold{i}") if name == "cold_icon" else work_dir
+            samples.append(run_once(window, cache_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    def stats(field):
+        values = [s[field] for s in samples if field in s]
+        if not values:
+            return None
+        return {"p50": round(percentile(values, 50), 1), "p95": round(percentile(values, 95), 1),
+                "min": round(min(values), 1), "max": round(max(values), 1)}
+
+    return {
+        "scenario": name,
+        "runs": runs,
+        "total_ms": stats("total_ms"),
+        "import_ms": stats("import_ms"),
+        "app_ms": stats("app_ms"),
+        "heavy_modules": sorted({m for s in samples for m in s["heavy_modules"]}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GUI 启动时间基准（time-to-first-frame）")
+    parser.add_argument("--runs", type=int, default=10, help="每个场景的启动次数")
+    parser.add_argument("--scenarios", default="import,cold_icon,warm_icon",
+                        help="要运行的场景: import,cold_icon,warm_icon")
+    parser.add_argument("--label", default="", help="写入结果的标签，便于区分不同运行")
+    parser.add_argument("--output", help="结果 JSON 文件（默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for name in scenarios:
+        if name not in ("import", "cold_icon", "warm_icon"):
+            parser.error(f"未知场景: {name}")
+    report = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": [],
+    }
+    for name in scenarios:
+        try:
+            res = run_scenario(name, args.runs)
+        except RuntimeError as e:
+            print(f"{name:12s} 失败: {e}", file=sys.stderr)
+            report["results"].append({"scenario": name, "error": str(e)})
+            continue
+        report["results"].append(res)
+        print(f"{name:12s} total p50={res['total_ms']['p50']}ms p95={res['total_ms']['p95']}ms  "
+              f"import p50={res['import_ms']['p50']}ms  heavy={','.join(res['heavy_modules']) or '-'}",
+              file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())